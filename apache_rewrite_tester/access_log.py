@@ -0,0 +1,253 @@
+"""
+Replay Apache access logs through a config's rewrite rules:
+
+    python -m apache_rewrite_tester.access_log httpd.conf access.log
+"""
+import argparse
+import collections
+import mmap
+import re
+import sys
+
+from apache_rewrite_tester.batch import DEFAULT_CHUNK_SIZE, \
+    RequestFailure, Throughput
+from apache_rewrite_tester.config_cache import ConfigCache
+from apache_rewrite_tester.http_request import Request
+from apache_rewrite_tester.outcome_cache import OutcomeCache
+from apache_rewrite_tester.profiling import Profile
+from apache_rewrite_tester.rewrite_objects.condition_memo import \
+    ConditionMemo
+from apache_rewrite_tester.rewrite_objects.main_context import MainContext
+
+__author__ = 'jwilner'
+
+
+# common log format, optionally followed by the combined format's referer
+# and user agent; Apache escapes quotes within fields with a backslash.
+LOG_LINE_REGEX = re.compile(r"""
+                            ^(?P<remote_host>\S+)\s
+                            (?P<ident>\S+)\s
+                            (?P<user>\S+)\s
+                            \[(?P<time>[^\]]+)\]\s
+                            "(?P<request_line>(?:[^"\\]|\\.)*)"\s
+                            (?P<status>\d{3}|-)\s
+                            (?P<size>\d+|-)
+                            (?:\s
+                            "(?P<referer>(?:[^"\\]|\\.)*)"\s
+                            "(?P<user_agent>(?:[^"\\]|\\.)*)"
+                            )?
+                            """, re.VERBOSE)
+
+LogEntry = collections.namedtuple("LogEntry",
+                                  "line_number remote_host time request_line "
+                                  "status referer user_agent")
+
+Outcome = collections.namedtuple("Outcome",
+                                 "line_number request_uri result error")
+
+OUTCOME_TEMPLATE = "{line_number}\t{request_uri}\t{result}\n"
+
+FAILURE_TEMPLATE = "{0.status} {0.reason}"
+
+DEFAULT_SERVER_PORT = 80
+
+
+def read_log_lines(filename, encoding="utf-8"):
+    """
+    Lazily read lines through a memory map, so that even huge logs are
+    never loaded whole.
+
+    :type filename: str
+    :type encoding: str
+    :rtype: __generator[(int, str)]
+    """
+    with open(filename, "rb") as log_file:
+        try:
+            mapped = mmap.mmap(log_file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # empty files can't be mapped
+            return
+
+        with mapped:
+            for line_number, line in enumerate(iter(mapped.readline, b""), 1):
+                yield line_number, line.decode(encoding, "replace").rstrip()
+
+
+def parse_log_lines(lines):
+    """
+    Lines which aren't in common or combined format come out as None.
+
+    :type lines: Iterable[(int, str)]
+    :rtype: __generator[(int, LogEntry)]
+    """
+    for line_number, line in lines:
+        match = LOG_LINE_REGEX.match(line)
+        if match is None:
+            yield line_number, None
+            continue
+
+        yield line_number, LogEntry(line_number, match.group("remote_host"),
+                                    match.group("time"),
+                                    match.group("request_line"),
+                                    match.group("status"),
+                                    _get_logged_value(match, "referer"),
+                                    _get_logged_value(match, "user_agent"))
+
+
+def _get_logged_value(match, group):
+    """
+    Apache logs missing values as a dash.
+
+    :type match: __Match
+    :type group: str
+    :rtype: str
+    """
+    value = match.group(group)
+    return None if value in (None, "-") else value
+
+
+def replay(main_context, lines, host=None, server_addr=None,
+           server_port=DEFAULT_SERVER_PORT, make_environment=None,
+           workers=None, chunk_size=DEFAULT_CHUNK_SIZE, throughput=None):
+    """
+    Lazily rewrite each logged request, yielding an Outcome per log line in
+    order; lines which can't be replayed, or whose requests fail, carry an
+    error instead of a result.
+
+    :type main_context: MainContext
+    :type lines: Iterable[(int, str)]
+    :param host: the Host header to give requests, since logs don't have it
+    :type host: str
+    :param server_addr: the address requests were received on, which
+        SERVER_ADDR and host selection go by
+    :type server_addr: str
+    :param server_port: the port requests were received on, which
+        SERVER_PORT, HTTPS and host selection go by
+    :type server_port: int
+    :type make_environment: (Request) -> MutableMapping
+    :type workers: int
+    :type chunk_size: int
+    :type throughput: Throughput
+    :rtype: __generator[Outcome]
+    """
+    # what's been read but not yet handled, in order
+    pending = collections.deque()
+
+    def get_requests():
+        for line_number, entry in parse_log_lines(lines):
+            if entry is None:
+                pending.append(Outcome(line_number, None, None,
+                                       "unrecognized log line"))
+                continue
+
+            try:
+                request = Request.from_log_entry(entry.remote_host,
+                                                 entry.request_line,
+                                                 entry.referer,
+                                                 entry.user_agent, host,
+                                                 entry.time, server_addr,
+                                                 server_port)
+            except ValueError:
+                pending.append(Outcome(line_number, None, None,
+                                       "invalid request line"))
+                continue
+
+            pending.append((line_number, request.request_uri))
+            yield request
+
+    results = main_context.handle_requests(get_requests(), make_environment,
+                                           workers=workers,
+                                           chunk_size=chunk_size,
+                                           throughput=throughput,
+                                           failures=(Exception,))
+    for result in results:
+        while isinstance(pending[0], Outcome):
+            yield pending.popleft()
+        line_number, request_uri = pending.popleft()
+        if isinstance(result, RequestFailure):
+            yield Outcome(line_number, request_uri, None,
+                          FAILURE_TEMPLATE.format(result))
+        else:
+            yield Outcome(line_number, request_uri, result, None)
+
+    # errors trailing the last request
+    yield from pending
+
+
+def write_outcomes(outcomes, output):
+    """
+    One tab-separated line per log line: line number, requested uri (or a
+    dash) and the rewritten path, or the error after an exclamation mark.
+
+    :type outcomes: Iterable[Outcome]
+    :type output: io.TextIOBase
+    """
+    for outcome in outcomes:
+        output.write(OUTCOME_TEMPLATE.format(
+            line_number=outcome.line_number,
+            request_uri=outcome.request_uri or "-",
+            result=outcome.result if outcome.error is None
+            else "!" + outcome.error))
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("config")
+    parser.add_argument("access_log")
+    parser.add_argument("--server-root")
+    parser.add_argument("--host", help="Host header to send with requests")
+    parser.add_argument("--server-addr")
+    parser.add_argument("--server-port", type=int,
+                        default=DEFAULT_SERVER_PORT)
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--output", type=argparse.FileType("w"),
+                        default=sys.stdout)
+    parser.add_argument("--config-cache",
+                        help="a directory to cache the parsed config in")
+    parser.add_argument("--profile",
+                        help="where to report per-directive counts and "
+                             "timings: .json, .csv or Prometheus text")
+    parser.add_argument("--outcome-cache", type=float, metavar="MEGABYTES",
+                        help="remember rewrites of requests the rules can't "
+                             "tell apart, in up to this much memory")
+    parser.add_argument("--condition-memo", choices=("request", "batch"),
+                        help="remember conditions' regex matches for the "
+                             "rest of each request, or the whole batch")
+    args = parser.parse_args(args)
+
+    if args.profile and args.workers:
+        parser.error("only requests rewritten in this process are profiled")
+
+    if args.config_cache is None:
+        main_context = MainContext.from_file(args.config, args.server_root)
+    else:
+        main_context = ConfigCache(args.config_cache).load(args.config,
+                                                           args.server_root)
+    profile = Profile() if args.profile else None
+    condition_memo = None
+    if args.condition_memo is not None:
+        condition_memo = ConditionMemo(
+            across_requests=args.condition_memo == "batch")
+    main_context.compile(profile=profile, condition_memo=condition_memo)
+    outcome_cache = None
+    if args.outcome_cache is not None:
+        outcome_cache = OutcomeCache(int(args.outcome_cache * 1024 * 1024))
+        main_context.cache_outcomes(outcome_cache)
+    throughput = Throughput()
+    outcomes = replay(main_context, read_log_lines(args.access_log),
+                      host=args.host, server_addr=args.server_addr,
+                      server_port=args.server_port, workers=args.workers, throughput=throughput)
+    write_outcomes(outcomes, args.output)
+
+    print(throughput, file=sys.stderr)
+    # each worker has a cache and memo of its own, which aren't reported back
+    if not args.workers:
+        for stats in outcome_cache, condition_memo:
+            if stats is not None:
+                print(stats, file=sys.stderr)
+
+    if profile is not None:
+        profile.write(args.profile)
+
+
+if __name__ == '__main__':
+    main()
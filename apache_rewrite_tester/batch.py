@@ -0,0 +1,208 @@
+import collections
+import concurrent.futures
+import itertools
+import time
+
+from apache_rewrite_tester.environment import Environment
+from apache_rewrite_tester.rewrite_objects.control_flow import \
+    RewriteLoopError
+
+__author__ = 'jwilner'
+
+
+DEFAULT_CHUNK_SIZE = 1000
+
+# what a config can make of a request, rather than what's gone wrong with
+# the tester; each is reported in place of the request's result
+REQUEST_FAILURES = RewriteLoopError,
+
+RequestFailure = collections.namedtuple("RequestFailure", "status reason")
+
+# per worker process; set once by _initialize_worker
+_worker_handler = None
+_worker_make_environment = None
+_worker_failures = REQUEST_FAILURES
+
+
+class Throughput(object):
+    """
+    Running count of requests handled, and how quickly.
+    """
+    def __init__(self, clock=time.perf_counter):
+        """
+        :type clock: () -> float
+        """
+        self._clock = clock
+        self.started = clock()
+        self.finished = None
+        self.count = 0
+
+    def add(self, count):
+        """
+        :type count: int
+        """
+        self.count += count
+        self.finished = self._clock()
+
+    @property
+    def elapsed(self):
+        """
+        :rtype: float
+        """
+        return (self.finished or self._clock()) - self.started
+
+    @property
+    def requests_per_second(self):
+        """
+        :rtype: float
+        """
+        elapsed = self.elapsed
+        return self.count / elapsed if elapsed else 0.0
+
+    def __str__(self):
+        return "{0.count} requests in {0.elapsed:.3f}s " \
+               "({0.requests_per_second:.1f} requests/s)".format(self)
+
+
+def handle_requests(handler, requests, make_environment=None, workers=None,
+                    chunk_size=DEFAULT_CHUNK_SIZE, throughput=None,
+                    failures=REQUEST_FAILURES):
+    """
+    Lazily evaluate a stream of requests, yielding results in input order.
+    A request Apache would have failed, e.g. with a 500 for looping too
+    many times, gives a RequestFailure rather than ending the stream.
+
+    With `workers`, requests are evaluated in chunks by a pool of processes,
+    each of which receives the handler once, when it starts.
+
+    :type handler: RequestHandler
+    :type requests: Iterable[HTTPRequest]
+    :param make_environment: gives a fresh environment for each request;
+        must be picklable when using workers. By default, a single
+        Environment is reset and reused for every request.
+    :type make_environment: (HTTPRequest) -> MutableMapping
+    :type workers: int
+    :type chunk_size: int
+    :type throughput: Throughput
+    :param failures: the exceptions reported as RequestFailures, rather
+        than raised
+    :type failures: tuple[type]
+    :rtype: __generator[str | RequestFailure]
+    """
+    if workers is None:
+        chunks = _handle_serially(handler, _chunk(requests, chunk_size),
+                                  make_environment, failures)
+    else:
+        chunks = _handle_in_pool(handler, _chunk(requests, chunk_size),
+                                 make_environment, workers, failures)
+
+    for results in chunks:
+        if throughput is not None:
+            throughput.add(len(results))
+        yield from results
+
+
+def _chunk(iterable, size):
+    """
+    :type iterable: Iterable
+    :type size: int
+    :rtype: __generator[list]
+    """
+    iterator = iter(iterable)
+    chunk = list(itertools.islice(iterator, size))
+    while chunk:
+        yield chunk
+        chunk = list(itertools.islice(iterator, size))
+
+
+def _handle_serially(handler, chunks, make_environment,
+                     failures=REQUEST_FAILURES):
+    """
+    :type handler: RequestHandler
+    :type chunks: Iterable[list[HTTPRequest]]
+    :type make_environment: (HTTPRequest) -> MutableMapping
+    :type failures: tuple[type]
+    :rtype: __generator[list[str | RequestFailure]]
+    """
+    if make_environment is None:
+        make_environment = _make_reused_environment_maker()
+
+    for chunk in chunks:
+        yield [_handle_request(handler, request, make_environment, failures)
+               for request in chunk]
+
+
+def _handle_request(handler, request, make_environment, failures):
+    """
+    :type handler: RequestHandler
+    :type request: HTTPRequest
+    :type make_environment: (HTTPRequest) -> MutableMapping
+    :type failures: tuple[type]
+    :rtype: str | RequestFailure
+    """
+    try:
+        return handler.handle_request(request, make_environment(request))
+    except failures as error:
+        # anything unforeseen is an internal server error, as in Apache
+        return RequestFailure(getattr(error, "STATUS", 500),
+                              "{}: {}".format(type(error).__name__, error))
+
+
+def _make_reused_environment_maker():
+    """
+    :rtype: (HTTPRequest) -> Environment
+    """
+    environment = Environment()
+
+    def make_environment(request):
+        environment.reset(request)
+        return environment
+
+    return make_environment
+
+
+def _handle_in_pool(handler, chunks, make_environment, workers,
+                    failures=REQUEST_FAILURES):
+    """
+    Keeps a couple of chunks per worker in flight, so neither the inputs nor
+    the results of a long stream pile up in memory.
+
+    :type handler: RequestHandler
+    :type chunks: Iterable[list[HTTPRequest]]
+    :type make_environment: (HTTPRequest) -> MutableMapping
+    :type workers: int
+    :type failures: tuple[type]
+    :rtype: __generator[list[str | RequestFailure]]
+    """
+    maximum_pending = 2 * workers
+    with concurrent.futures.ProcessPoolExecutor(
+            max_workers=workers, initializer=_initialize_worker,
+            initargs=(handler, make_environment, failures)) as executor:
+        pending = collections.deque()
+        for chunk in chunks:
+            pending.append(executor.submit(_handle_chunk, chunk))
+            if len(pending) >= maximum_pending:
+                yield pending.popleft().result()
+
+        while pending:
+            yield pending.popleft().result()
+
+
+def _initialize_worker(handler, make_environment, failures):
+    """
+    :type handler: RequestHandler
+    :type make_environment: (HTTPRequest) -> MutableMapping
+    :type failures: tuple[type]
+    """
+    global _worker_handler, _worker_make_environment, _worker_failures
+    _worker_handler, _worker_make_environment = handler, make_environment
+    _worker_failures = failures
+
+
+def _handle_chunk(chunk):
+    """
+    :type chunk: list[HTTPRequest]
+    :rtype: list[str | RequestFailure]
+    """
+    return next(_handle_serially(_worker_handler, (chunk,),
+                                 _worker_make_environment, _worker_failures))
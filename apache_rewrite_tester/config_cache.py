@@ -0,0 +1,206 @@
+"""
+A cache of parsed configs on disk, so that running again against an
+unchanged config tree loads its MainContext rather than reparsing it.
+
+An entry is kept per config file and server root. It's only used while
+every file the config was read from hashes as it did, and every Include
+pattern matches the same files; otherwise the config is parsed again and
+the entry replaced.
+"""
+import gc
+import glob
+import hashlib
+import os
+import pickle
+import tempfile
+import zlib
+
+from apache_rewrite_tester.rewrite_objects.main_context import MainContext
+from apache_rewrite_tester.utils import IncludeGraph
+
+__author__ = 'jwilner'
+
+
+# bumped whenever the pickled directives change shape
+CACHE_VERSION = 2
+
+ENTRY_SUFFIX = ".config-cache"
+
+# errors loading an entry which just mean reparsing
+LOAD_ERRORS = (OSError, EOFError, ValueError, TypeError, AttributeError,
+               ImportError, IndexError, pickle.UnpicklingError, zlib.error)
+
+
+def hash_file(filename):
+    """
+    :type filename: str
+    :rtype: str
+    """
+    digest = hashlib.sha256()
+    with open(filename, "rb") as config_file:
+        for block in iter(lambda: config_file.read(1 << 16), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class Manifest(object):
+    """
+    What a parsed config depends on: a hash of the content of every file it
+    was read from, and the files each Include pattern matched.
+    """
+    __slots__ = "hashes", "includes"
+
+    @classmethod
+    def from_include_graph(cls, include_graph):
+        """
+        :type include_graph: IncludeGraph
+        :rtype: Manifest
+        """
+        return cls(tuple((filename, hash_file(filename))
+                         for filename in include_graph.filenames),
+                   tuple((pattern, filenames)
+                         for _, pattern, filenames in include_graph.includes))
+
+    def __init__(self, hashes, includes):
+        """
+        :type hashes: tuple[(str, str)]
+        :type includes: tuple[(str, tuple[str])]
+        """
+        self.hashes = hashes
+        self.includes = includes
+
+    def __getstate__(self):
+        return self.hashes, self.includes
+
+    def __setstate__(self, state):
+        self.hashes, self.includes = state
+
+    def is_fresh(self):
+        """
+        Whether reading the config again would read the same content.
+
+        :rtype: bool
+        """
+        # the cheap check first: a new or deleted file under an Include
+        for pattern, filenames in self.includes:
+            if tuple(sorted(glob.glob(pattern))) != filenames:
+                return False
+
+        try:
+            return all(hash_file(filename) == digest
+                       for filename, digest in self.hashes)
+        except OSError:
+            return False
+
+
+class ConfigCache(object):
+    """
+    Parsed configs pickled into a directory, one file per entry.
+    """
+    def __init__(self, directory):
+        """
+        :type directory: str
+        """
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+
+    def load(self, filename, server_root=None):
+        """
+        The config's MainContext, from the cache if it's still fresh, or
+        else freshly parsed and cached.
+
+        :type filename: str
+        :type server_root: str
+        :rtype: MainContext
+        """
+        main_context = self.get(filename, server_root)
+        if main_context is not None:
+            self.hits += 1
+            return main_context
+
+        self.misses += 1
+        include_graph = IncludeGraph()
+        main_context = MainContext.from_file(filename, server_root,
+                                             include_graph)
+        self.put(filename, server_root, main_context,
+                 Manifest.from_include_graph(include_graph))
+        return main_context
+
+    def get(self, filename, server_root=None):
+        """
+        :type filename: str
+        :type server_root: str
+        :rtype: MainContext
+        :returns: None if there's no fresh entry
+        """
+        try:
+            with open(self._get_entry_filename(filename, server_root),
+                      "rb") as entry:
+                version, manifest = pickle.load(entry)
+                if version != CACHE_VERSION or not manifest.is_fresh():
+                    return None
+
+                # the context itself is only decompressed once it's known to
+                # be wanted
+                return _unpickle(zlib.decompress(entry.read()))
+        except LOAD_ERRORS:
+            return None
+
+    def put(self, filename, server_root, main_context, manifest):
+        """
+        :type filename: str
+        :type server_root: str
+        :type main_context: MainContext
+        :type manifest: Manifest
+        """
+        os.makedirs(self.directory, exist_ok=True)
+
+        # written aside and renamed into place, so that a concurrent run
+        # never reads half an entry
+        handle, temporary = tempfile.mkstemp(dir=self.directory)
+        try:
+            with os.fdopen(handle, "wb") as entry:
+                pickle.dump((CACHE_VERSION, manifest), entry,
+                            pickle.HIGHEST_PROTOCOL)
+                entry.write(zlib.compress(
+                    pickle.dumps(main_context, pickle.HIGHEST_PROTOCOL)))
+            os.replace(temporary,
+                       self._get_entry_filename(filename, server_root))
+        except BaseException:
+            os.remove(temporary)
+            raise
+
+    def _get_entry_filename(self, filename, server_root):
+        """
+        :type filename: str
+        :type server_root: str
+        :rtype: str
+        """
+        # relative includes resolve against the working directory when
+        # there's no server root, so it's part of the key then
+        key = "\0".join((os.path.abspath(filename),
+                         os.path.abspath(server_root)
+                         if server_root is not None else "",
+                         os.getcwd() if server_root is None else ""))
+        return os.path.join(self.directory,
+                            hashlib.sha256(key.encode()).hexdigest() +
+                            ENTRY_SUFFIX)
+
+
+def _unpickle(data):
+    """
+    Unpickling a large config creates objects by the hundred thousand, none
+    of them garbage; collecting as they're created more than doubles the
+    time it takes.
+
+    :type data: bytes
+    :rtype: object
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return pickle.loads(data)
+    finally:
+        if enabled:
+            gc.enable()
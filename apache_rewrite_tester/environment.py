@@ -1,4 +1,5 @@
 import collections
+import datetime
 import re
 
 import enum
@@ -6,24 +7,167 @@ import enum
 __author__ = 'jwilner'
 
 
+LOG_TIME_FORMAT = "%d/%b/%Y:%H:%M:%S %z"
+
+SERVER_SOFTWARE = "Apache"
+API_VERSION = "20120211:0"
+
+HTTPS_PORT = 443
+
+
 def _make_header_value_extractor(header_key):
     """
     :type header_key: str
     :rtype: (HTTPRequest) -> str
     """
+    def extract_value(request):
+        """
+        Like Apache, a missing header is an empty string.
+
+        :type request: HTTPRequest
+        :rtype: str
+        """
+        return request.headers.get(header_key, "")
+
+    return extract_value
+
+
+def _make_attribute_extractor(name):
+    """
+    :type name: str
+    :rtype: (HTTPRequest) -> str
+    """
+    def extract_value(request):
+        """
+        :type request: HTTPRequest
+        :rtype: str
+        """
+        value = getattr(request, name)
+        return "" if value is None else str(value)
+
+    return extract_value
+
+
+def _make_constant_extractor(value):
+    """
+    For what a request alone can't tell us.
+
+    :type value: str
+    :rtype: (HTTPRequest) -> str
+    """
+    def extract_value(request):
+        """
+        :type request: HTTPRequest
+        :rtype: str
+        """
+        return value
+
+    return extract_value
+
+
+def _make_time_extractor(time_format):
+    """
+    :type time_format: str
+    :rtype: (HTTPRequest) -> str
+    """
     def extract_value(request):
         """
         :type request: HTTPRequest
         :rtype: str
         """
-        return request.headers[header_key]
+        return _get_request_time(request).strftime(time_format)
 
     return extract_value
 
 
+def _get_request_time(request):
+    """
+    :type request: HTTPRequest
+    :rtype: datetime.datetime
+    """
+    time = request.time
+    if time is None:
+        return datetime.datetime.now()
+    if isinstance(time, str):
+        return datetime.datetime.strptime(time, LOG_TIME_FORMAT)
+    return time
+
+
+def _extract_weekday(request):
+    """
+    :type request: HTTPRequest
+    :rtype: str
+    """
+    # Apache counts from Sunday
+    return str(_get_request_time(request).isoweekday() % 7)
+
+
+def _extract_request_uri(request):
+    """
+    :type request: HTTPRequest
+    :rtype: str
+    """
+    return request.path
+
+
+def _extract_the_request(request):
+    """
+    :type request: HTTPRequest
+    :rtype: str
+    """
+    request_uri = _extract_request_uri(request)
+    if request.query_string:
+        request_uri = "{}?{}".format(request_uri, request.query_string)
+    return "{} {} {}".format(request.method, request_uri, request.http_version)
+
+
+def _extract_server_name(request):
+    """
+    As with UseCanonicalName Off, the requested host, less any port.
+
+    :type request: HTTPRequest
+    :rtype: str
+    """
+    host = request.headers.get("Host", "")
+    name, colon, port = host.rpartition(":")
+    return name if colon and port.isdigit() else host
+
+
+def _extract_ipv6(request):
+    """
+    :type request: HTTPRequest
+    :rtype: str
+    """
+    return "on" if ":" in (request.remote_addr or "") else "off"
+
+
+def _extract_https(request):
+    """
+    A request doesn't know its scheme, so guess from the port.
+
+    :type request: HTTPRequest
+    :rtype: str
+    """
+    return "on" if request.local_port == HTTPS_PORT else "off"
+
+
+def _extract_request_scheme(request):
+    """
+    :type request: HTTPRequest
+    :rtype: str
+    """
+    return "https" if _extract_https(request) == "on" else "http"
+
+
 class Backreference(collections.Hashable):
     MAXIMUM_INDEX = 10  # exclusive
 
+    # distinguishes the kinds of backreference in hashes
+    KIND = 0
+
+    # backreferences are interned, so that looking one up never allocates
+    _interned = {}
+
     @classmethod
     def from_string(cls, string):
         """
@@ -35,14 +179,22 @@ class Backreference(collections.Hashable):
     @classmethod
     def update_environment(cls, match, environment):
         """
+        An Environment keeps all of a match's groups as a single tuple;
+        any other mapping gets an entry per group. As in Apache, a group
+        which took no part in the match is empty.
+
         :type match: __Match
         :type environment: MutableMapping
         """
+        if isinstance(environment, Environment):
+            environment.capture(cls, match)
+            return
+
         for index in range(cls.MAXIMUM_INDEX):
             backreference = cls(index)
             try:
                 group = match.group(index)
-                environment[backreference] = group
+                environment[backreference] = "" if group is None else group
             except IndexError:
                 # unset old backreferences
                 try:
@@ -51,17 +203,35 @@ class Backreference(collections.Hashable):
                     # won't be any for higher indices
                     break
 
+    def __new__(cls, index):
+        """
+        :type index: int
+        :rtype: Backreference
+        """
+        key = cls, index
+        try:
+            return cls._interned[key]
+        except KeyError:
+            backreference = cls._interned[key] = super().__new__(cls)
+            return backreference
+
     def __init__(self, index):
         """
         :type index: int
         """
         self.index = index
 
+    def __reduce__(self):
+        # unpickle through __new__, and so back to the interned instance
+        return type(self), (self.index,)
+
     def __hash__(self):
         """
+        The same from run to run, unlike hashes involving types.
+
         :rtype: int
         """
-        return int(hash(type(self)) / (hash(self.index) or 1))
+        return self.index * 4 + self.KIND
 
     def __eq__(self, other):
         """
@@ -72,19 +242,23 @@ class Backreference(collections.Hashable):
 
 
 class CondBackreference(Backreference):
-    pass
+    KIND = 1
 
 
 class RuleBackreference(Backreference):
-    pass
+    KIND = 2
 
 
 class MapExpansion(collections.Hashable):
+    """
+    A ${map:key|default} lookup; the key and default are themselves left as
+    unparsed format strings, which may refer to variables and backreferences.
+    """
     REGEX = re.compile(r"""
-                       ^(?P<map_name>\w+):
-                       (?P<lookup_key>\w+)
-                       (?:\|(?P<default>\w+))$
-                       """, re.VERBOSE)
+                       ^(?P<map_name>[^:]+):
+                       (?P<lookup_key>[^|]*)
+                       (?:\|(?P<default>.*))?$
+                       """, re.VERBOSE | re.DOTALL)
 
     @classmethod
     def from_string(cls, string):
@@ -94,18 +268,28 @@ class MapExpansion(collections.Hashable):
 
         return cls(**match.groupdict())
 
-    def __init__(self, map_name, lookup_key, default):
+    def __init__(self, map_name, lookup_key, default=None):
         """
         :type map_name: str
         :type lookup_key: str
+        :param default: None if there's none, and the lookup comes out empty
         :type default: str
         """
         self.map_name = map_name
         self.lookup_key = lookup_key
         self.default = default
 
+    def __repr__(self):
+        return "{0.__class__.__name__}({0.map_name!r}, {0.lookup_key!r}, " \
+               "{0.default!r})".format(self)
+
+    def __eq__(self, other):
+        return type(other) is self.__class__ and \
+            (other.map_name, other.lookup_key, other.default) == \
+            (self.map_name, self.lookup_key, self.default)
+
     def __hash__(self):
-        return hash(self.map_name + self.lookup_key)
+        return hash((self.map_name, self.lookup_key, self.default))
 
 
 class ServerVariableType(enum.Enum):
@@ -121,7 +305,8 @@ class ServerVariable(enum.Enum):
         _make_header_value_extractor("Accept")
     HTTP_COOKIE = 1, ServerVariableType.HTTP_HEADERS, \
         _make_header_value_extractor("Cookie")
-    HTTP_FORWARDED = 2, ServerVariableType.HTTP_HEADERS
+    HTTP_FORWARDED = 2, ServerVariableType.HTTP_HEADERS, \
+        _make_header_value_extractor("Forwarded")
     HTTP_HOST = 3, ServerVariableType.HTTP_HEADERS, \
         _make_header_value_extractor("Host")
     HTTP_PROXY_CONNECTION = 4, ServerVariableType.HTTP_HEADERS, \
@@ -129,49 +314,81 @@ class ServerVariable(enum.Enum):
     HTTP_REFERER = 5, ServerVariableType.HTTP_HEADERS, \
         _make_header_value_extractor("Referer")
     HTTP_USER_AGENT = 6, ServerVariableType.HTTP_HEADERS, \
-        _make_header_value_extractor("User-String")
-
-    AUTH_TYPE = 7, ServerVariableType.CONNECTION_AND_REQUEST
-    CONN_REMOTE_ADDR = 8, ServerVariableType.CONNECTION_AND_REQUEST
-    CONTEXT_PREFIX = 9, ServerVariableType.CONNECTION_AND_REQUEST
-    CONTEXT_DOCUMENT_ROOT = 10, ServerVariableType.CONNECTION_AND_REQUEST
-    IPV6 = 11, ServerVariableType.CONNECTION_AND_REQUEST
-    PATH_INFO = 12, ServerVariableType.CONNECTION_AND_REQUEST
-    QUERY_STRING = 13, ServerVariableType.CONNECTION_AND_REQUEST
-    REMOTE_ADDR = 14, ServerVariableType.CONNECTION_AND_REQUEST
-    REMOTE_HOST = 15, ServerVariableType.CONNECTION_AND_REQUEST
-    REMOTE_IDENT = 16, ServerVariableType.CONNECTION_AND_REQUEST
-    REMOTE_PORT = 17, ServerVariableType.CONNECTION_AND_REQUEST
-    REMOTE_USER = 18, ServerVariableType.CONNECTION_AND_REQUEST
-    REQUEST_METHOD = 19, ServerVariableType.CONNECTION_AND_REQUEST
-    SCRIPT_FILENAME = 20, ServerVariableType.CONNECTION_AND_REQUEST
-
-    DOCUMENT_ROOT = 21, ServerVariableType.SERVER_INTERNALS
-    SCRIPT_GROUP = 22, ServerVariableType.SERVER_INTERNALS
-    SCRIPT_USER = 23, ServerVariableType.SERVER_INTERNALS
-    SERVER_ADDR = 24, ServerVariableType.SERVER_INTERNALS
-    SERVER_ADMIN = 25, ServerVariableType.SERVER_INTERNALS
-    SERVER_NAME = 26, ServerVariableType.SERVER_INTERNALS
-    SERVER_PORT = 27, ServerVariableType.SERVER_INTERNALS
-    SERVER_PROTOCOL = 28, ServerVariableType.SERVER_INTERNALS
-    SERVER_SOFTWARE = 29, ServerVariableType.SERVER_INTERNALS
-
-    TIME_YEAR = 30, ServerVariableType.DATE_AND_TIME
-    TIME_MON = 31, ServerVariableType.DATE_AND_TIME
-    TIME_DAY = 32, ServerVariableType.DATE_AND_TIME
-    TIME_HOUR = 33, ServerVariableType.DATE_AND_TIME
-    TIME_MIN = 34, ServerVariableType.DATE_AND_TIME
-    TIME_SEC = 35, ServerVariableType.DATE_AND_TIME
-    TIME_WDAY = 36, ServerVariableType.DATE_AND_TIME
-    TIME = 37, ServerVariableType.DATE_AND_TIME
-
-    API_VERSION = 38, ServerVariableType.SPECIALS
-    HTTPS = 39, ServerVariableType.SPECIALS
-    IS_SUBREQ = 40, ServerVariableType.SPECIALS
-    REQUEST_FILENAME = 41, ServerVariableType.SPECIALS
-    REQUEST_SCHEME = 42, ServerVariableType.SPECIALS
-    REQUEST_URI = 43, ServerVariableType.SPECIALS
-    THE_REQUEST = 44, ServerVariableType.SPECIALS
+        _make_header_value_extractor("User-Agent")
+
+    AUTH_TYPE = 7, ServerVariableType.CONNECTION_AND_REQUEST, \
+        _make_constant_extractor("")
+    CONN_REMOTE_ADDR = 8, ServerVariableType.CONNECTION_AND_REQUEST, \
+        _make_attribute_extractor("remote_addr")
+    CONTEXT_PREFIX = 9, ServerVariableType.CONNECTION_AND_REQUEST, \
+        _make_constant_extractor("")
+    CONTEXT_DOCUMENT_ROOT = 10, ServerVariableType.CONNECTION_AND_REQUEST, \
+        _make_constant_extractor("")
+    IPV6 = 11, ServerVariableType.CONNECTION_AND_REQUEST, _extract_ipv6
+    PATH_INFO = 12, ServerVariableType.CONNECTION_AND_REQUEST, \
+        _make_constant_extractor("")
+    QUERY_STRING = 13, ServerVariableType.CONNECTION_AND_REQUEST, \
+        _make_attribute_extractor("query_string")
+    REMOTE_ADDR = 14, ServerVariableType.CONNECTION_AND_REQUEST, \
+        _make_attribute_extractor("remote_addr")
+    # no DNS lookups, as with HostnameLookups Off
+    REMOTE_HOST = 15, ServerVariableType.CONNECTION_AND_REQUEST, \
+        _make_attribute_extractor("remote_addr")
+    REMOTE_IDENT = 16, ServerVariableType.CONNECTION_AND_REQUEST, \
+        _make_constant_extractor("")
+    REMOTE_PORT = 17, ServerVariableType.CONNECTION_AND_REQUEST, \
+        _make_attribute_extractor("remote_port")
+    REMOTE_USER = 18, ServerVariableType.CONNECTION_AND_REQUEST, \
+        _make_constant_extractor("")
+    REQUEST_METHOD = 19, ServerVariableType.CONNECTION_AND_REQUEST, \
+        _make_attribute_extractor("method")
+    SCRIPT_FILENAME = 20, ServerVariableType.CONNECTION_AND_REQUEST, \
+        _extract_request_uri
+
+    DOCUMENT_ROOT = 21, ServerVariableType.SERVER_INTERNALS, \
+        _make_constant_extractor("")
+    SCRIPT_GROUP = 22, ServerVariableType.SERVER_INTERNALS, \
+        _make_constant_extractor("")
+    SCRIPT_USER = 23, ServerVariableType.SERVER_INTERNALS, \
+        _make_constant_extractor("")
+    SERVER_ADDR = 24, ServerVariableType.SERVER_INTERNALS, \
+        _make_attribute_extractor("local_addr")
+    SERVER_ADMIN = 25, ServerVariableType.SERVER_INTERNALS, \
+        _make_constant_extractor("")
+    SERVER_NAME = 26, ServerVariableType.SERVER_INTERNALS, \
+        _extract_server_name
+    SERVER_PORT = 27, ServerVariableType.SERVER_INTERNALS, \
+        _make_attribute_extractor("local_port")
+    SERVER_PROTOCOL = 28, ServerVariableType.SERVER_INTERNALS, \
+        _make_attribute_extractor("http_version")
+    SERVER_SOFTWARE = 29, ServerVariableType.SERVER_INTERNALS, \
+        _make_constant_extractor(SERVER_SOFTWARE)
+
+    TIME_YEAR = 30, ServerVariableType.DATE_AND_TIME, \
+        _make_time_extractor("%Y")
+    TIME_MON = 31, ServerVariableType.DATE_AND_TIME, \
+        _make_time_extractor("%m")
+    TIME_DAY = 32, ServerVariableType.DATE_AND_TIME, \
+        _make_time_extractor("%d")
+    TIME_HOUR = 33, ServerVariableType.DATE_AND_TIME, \
+        _make_time_extractor("%H")
+    TIME_MIN = 34, ServerVariableType.DATE_AND_TIME, \
+        _make_time_extractor("%M")
+    TIME_SEC = 35, ServerVariableType.DATE_AND_TIME, \
+        _make_time_extractor("%S")
+    TIME_WDAY = 36, ServerVariableType.DATE_AND_TIME, _extract_weekday
+    TIME = 37, ServerVariableType.DATE_AND_TIME, \
+        _make_time_extractor("%Y%m%d%H%M%S")
+
+    API_VERSION = 38, ServerVariableType.SPECIALS, \
+        _make_constant_extractor(API_VERSION)
+    HTTPS = 39, ServerVariableType.SPECIALS, _extract_https
+    IS_SUBREQ = 40, ServerVariableType.SPECIALS, \
+        _make_constant_extractor("false")
+    REQUEST_FILENAME = 41, ServerVariableType.SPECIALS, _extract_request_uri
+    REQUEST_SCHEME = 42, ServerVariableType.SPECIALS, _extract_request_scheme
+    REQUEST_URI = 43, ServerVariableType.SPECIALS, _extract_request_uri
+    THE_REQUEST = 44, ServerVariableType.SPECIALS, _extract_the_request
 
     def __init__(self, index, variable_type, extractor=None):
         """
@@ -182,6 +399,10 @@ class ServerVariable(enum.Enum):
         self.type = variable_type
         self.extract = extractor
 
+    def __reduce_ex__(self, protocol):
+        # by name, since values hold extractors which can't be pickled
+        return getattr, (type(self), self.name)
+
 
 class ApacheFlag(enum.Enum):
     def __init__(self, pattern, parsers=()):
@@ -191,6 +412,10 @@ class ApacheFlag(enum.Enum):
         self.pattern = re.compile(pattern, re.IGNORECASE | re.VERBOSE)
         self.parsers = parsers
 
+    def __reduce_ex__(self, protocol):
+        # by name, since values can hold parsers which can't be pickled
+        return getattr, (type(self), self.name)
+
     @classmethod
     def look_up(cls, string):
         """
@@ -224,20 +449,155 @@ class ApacheFlag(enum.Enum):
                 map(cls.look_up, filter(bool, string.split(',')))}
 
 
-
 class Environment(collections.MutableMapping):
+    """
+    Every ServerVariable has a fixed slot in an array, indexed by its id;
+    anything else goes in a plain dict. A slot only counts as set if it was
+    set in the current generation, so resetting for the next request is
+    just a matter of moving to a new generation.
+
+    Rule and condition backreferences are kept as a single tuple of groups
+    per kind, captured straight from the match.
+
+    Server variables which haven't been set are extracted from the request
+    on first access, where the variable knows how.
+    """
+    SIZE = len(ServerVariable)
+
+    # slot to key, for iteration
+    KEYS = tuple(sorted(ServerVariable, key=lambda variable: variable.id))
+
+    # where each kind of backreference keeps its captures
+    CAPTURE_INDICES = {RuleBackreference: 0, CondBackreference: 1}
+
+    # marks groups which were deleted from a capture
+    _UNSET = object()
+
+    def __init__(self, request=None):
+        """
+        :type request: HTTPRequest
+        """
+        self.request = request
+        self._values = [None] * self.SIZE
+        self._generations = [0] * self.SIZE
+        self._generation = 1
+        self._captures = [(), ()]
+        self._capture_generations = [0, 0]
+        self._others = {}
+
+    def reset(self, request=None):
+        """
+        Forget everything, in constant time, to start on another request.
+
+        :type request: HTTPRequest
+        """
+        self.request = request
+        self._generation += 1
+        if self._others:
+            self._others = {}
+
+    def capture(self, backreference_type, match):
+        """
+        Replace all backreferences of a kind with a match's groups; those
+        which took no part in the match are empty.
+
+        :type backreference_type: type
+        :type match: __Match
+        """
+        capture_index = self.CAPTURE_INDICES[backreference_type]
+        self._captures[capture_index] = \
+            (match.group(0),) + match.groups("")
+        self._capture_generations[capture_index] = self._generation
+
+    def _get_capture(self, capture_index):
+        """
+        :type capture_index: int
+        :rtype: tuple[str]
+        """
+        if self._capture_generations[capture_index] != self._generation:
+            return ()
+        return self._captures[capture_index]
+
+    def _set_capture(self, key, value):
+        """
+        :type key: Backreference
+        :type value: object
+        """
+        capture_index = self.CAPTURE_INDICES[type(key)]
+        groups = list(self._get_capture(capture_index))
+        groups.extend([self._UNSET] * (key.index + 1 - len(groups)))
+        groups[key.index] = value
+        self._captures[capture_index] = tuple(groups)
+        self._capture_generations[capture_index] = self._generation
+
+    def _iterate_captures(self):
+        """
+        :rtype: __generator[Backreference]
+        """
+        for backreference_type, capture_index in \
+                self.CAPTURE_INDICES.items():
+            groups = self._get_capture(capture_index)
+            for index in range(min(len(groups), Backreference.MAXIMUM_INDEX)):
+                if groups[index] is not self._UNSET:
+                    yield backreference_type(index)
+
     def __getitem__(self, key):
-        pass
+        key_type = type(key)
+        if key_type is ServerVariable:
+            slot = key.id
+            if self._generations[slot] == self._generation:
+                return self._values[slot]
+
+            if self.request is not None and key.extract is not None:
+                value = key.extract(self.request)
+                self._values[slot] = value
+                self._generations[slot] = self._generation
+                return value
+
+            raise KeyError(key)
+
+        capture_index = self.CAPTURE_INDICES.get(key_type)
+        if capture_index is None:
+            return self._others[key]
+
+        groups = self._get_capture(capture_index)
+        if key.index < len(groups) and groups[key.index] is not self._UNSET:
+            return groups[key.index]
+
+        raise KeyError(key)
 
     def __iter__(self):
-        pass
+        generation = self._generation
+        for slot, slot_generation in enumerate(self._generations):
+            if slot_generation == generation:
+                yield self.KEYS[slot]
+
+        yield from self._iterate_captures()
+        yield from self._others
 
     def __len__(self):
-        pass
+        return self._generations.count(self._generation) + \
+            sum(1 for _ in self._iterate_captures()) + len(self._others)
 
     def __setitem__(self, key, value):
-        pass
+        key_type = type(key)
+        if key_type is ServerVariable:
+            self._values[key.id] = value
+            self._generations[key.id] = self._generation
+        elif key_type in self.CAPTURE_INDICES:
+            self._set_capture(key, value)
+        else:
+            self._others[key] = value
 
     def __delitem__(self, key):
-        pass
-
+        key_type = type(key)
+        if key_type is ServerVariable:
+            if self._generations[key.id] != self._generation:
+                raise KeyError(key)
+            self._generations[key.id] = 0
+            self._values[key.id] = None
+        elif key_type in self.CAPTURE_INDICES:
+            self[key]  # raises KeyError if it isn't there
+            self._set_capture(key, self._UNSET)
+        else:
+            del self._others[key]
@@ -7,6 +7,8 @@ __author__ = 'jwilner'
 REQUEST_LINE_TEMPLATE = "{method} {request_uri} {http_version}"
 HEADER_LINE = "{field_name}: {field_value}"
 
+DEFAULT_HTTP_VERSION = "HTTP/1.1"
+
 
 def get_request(method, request_uri, http_version, host, headers=None):
     """
@@ -44,6 +46,10 @@ class HTTPRequest(http.server.BaseHTTPRequestHandler):
         self.raw_requestline = self.rfile.readline()
         self.parse_request()
 
+        # as with a Request, rules see the path without the query string
+        self.request_uri = self.path
+        self.path, _, self.query_string = self.request_uri.partition("?")
+
     def send_error(self, code, message=None):
         """
         :type code: int
@@ -51,3 +57,171 @@ class HTTPRequest(http.server.BaseHTTPRequestHandler):
         """
         raise ValueError("Invalid message: "
                          "parsing yielded {} {}".format(code,  message))
+
+    # what a Request has but a parsed request text can't know
+    remote_addr = remote_port = local_addr = local_port = time = None
+
+    @property
+    def method(self):
+        """
+        :rtype: str
+        """
+        return self.command
+
+    @property
+    def http_version(self):
+        """
+        :rtype: str
+        """
+        return self.request_version
+
+    def to_request(self):
+        """
+        :rtype: Request
+        """
+        return Request.from_request_uri(self.command, self.request_uri,
+                                        self.request_version,
+                                        dict(self.headers.items()))
+
+
+def _normalize_header_name(name):
+    """
+    :type name: str
+    :rtype: str
+    """
+    return name.title()
+
+
+class Request(object):
+    """
+    Just the fields rewriting looks at, for when requests come by the
+    million and parsing them through HTTPRequest is too costly.
+    """
+    __slots__ = "method", "path", "query_string", "http_version", "headers", \
+        "remote_addr", "remote_port", "local_addr", "local_port", "time"
+
+    @classmethod
+    def from_request_uri(cls, method, request_uri,
+                         http_version=DEFAULT_HTTP_VERSION, headers=None,
+                         **addresses):
+        """
+        :type method: str
+        :type request_uri: str
+        :type http_version: str
+        :type headers: dict[str, str]
+        :rtype: Request
+        """
+        path, _, query_string = request_uri.partition("?")
+        return cls(method, path, query_string, http_version, headers,
+                   **addresses)
+
+    @classmethod
+    def from_request_line(cls, request_line, headers=None, **addresses):
+        """
+        :param request_line: e.g. "GET /index.html?a=b HTTP/1.1"
+        :type request_line: str
+        :type headers: dict[str, str]
+        :rtype: Request
+        """
+        method, request_uri, *http_version = request_line.split(" ", 2)
+        return cls.from_request_uri(method, request_uri,
+                                    *(http_version or (DEFAULT_HTTP_VERSION,)),
+                                    headers=headers, **addresses)
+
+    @classmethod
+    def from_log_entry(cls, remote_addr, request_line, referer=None,
+                       user_agent=None, host=None, time=None,
+                       local_addr=None, local_port=None):
+        """
+        From the fields an access log records about a request.
+
+        :type remote_addr: str
+        :type request_line: str
+        :type referer: str
+        :type user_agent: str
+        :type host: str
+        :param time: as logged, e.g. "10/Oct/2000:13:55:36 -0700"
+        :type time: str
+        :param local_addr: where the request was received, which logs
+            don't record
+        :type local_addr: str
+        :type local_port: int
+        :rtype: Request
+        """
+        headers = {}
+        for name, value in (("Host", host), ("Referer", referer),
+                            ("User-Agent", user_agent)):
+            if value is not None:
+                headers[name] = value
+
+        return cls.from_request_line(request_line, headers,
+                                     remote_addr=remote_addr,
+                                     local_addr=local_addr,
+                                     local_port=local_port, time=time)
+
+    def __init__(self, method, path, query_string="",
+                 http_version=DEFAULT_HTTP_VERSION, headers=None,
+                 remote_addr=None, remote_port=None, local_addr=None,
+                 local_port=None, time=None):
+        """
+        :type method: str
+        :type path: str
+        :type query_string: str
+        :type http_version: str
+        :type headers: dict[str, str]
+        :type remote_addr: str
+        :type remote_port: int
+        :type local_addr: str
+        :type local_port: int
+        :param time: when the request was made; a datetime, a string as
+            access logs have it, or None for whenever it's asked
+        :type time: datetime.datetime | str
+        """
+        self.method = method
+        self.path = path
+        self.query_string = query_string
+        self.http_version = http_version
+        self.headers = {} if headers is None else \
+            {_normalize_header_name(name): value
+             for name, value in headers.items()}
+        self.remote_addr = remote_addr
+        self.remote_port = remote_port
+        self.local_addr = local_addr
+        self.local_port = local_port
+        self.time = time
+
+    def __repr__(self):
+        return "{0.__class__.__name__}({0.method!r}, " \
+               "{0.request_uri!r})".format(self)
+
+    def __eq__(self, other):
+        """
+        :type other: object
+        :rtype: bool
+        """
+        if type(self) != type(other):
+            return NotImplemented
+
+        return all(getattr(self, name) == getattr(other, name)
+                   for name in self.__slots__)
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    @property
+    def request_uri(self):
+        """
+        :rtype: str
+        """
+        if not self.query_string:
+            return self.path
+        return "{}?{}".format(self.path, self.query_string)
+
+    @property
+    def request_line(self):
+        """
+        :rtype: str
+        """
+        return REQUEST_LINE_TEMPLATE.format(method=self.method,
+                                            request_uri=self.request_uri,
+                                            http_version=self.http_version)
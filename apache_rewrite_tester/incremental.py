@@ -0,0 +1,358 @@
+"""
+Keep a parsed config up to date as the files it's read from are edited,
+reparsing only the files which changed:
+
+    python -m apache_rewrite_tester.incremental httpd.conf --server-root /etc
+
+A changed file's directives are reparsed, along with those of everything it
+includes, and spliced into the existing tree in place of the old ones.
+Whenever that can't be shown to give what a full parse would, e.g. when a
+file opens a <VirtualHost> another file closes, the whole config is parsed
+again instead.
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+
+from apache_rewrite_tester.rewrite_objects.main_context import MainContext
+from apache_rewrite_tester.utils import IncludeGraph, read_directive_lines
+
+__author__ = 'jwilner'
+
+
+DEFAULT_INTERVAL = 1.
+
+
+class _CannotSplice(Exception):
+    """
+    A changed file's directives can't be replaced on their own.
+    """
+
+
+def _stamp(filename):
+    """
+    :type filename: str
+    :rtype: (int, int)
+    :returns: the modification time and size, or None if there's no file
+    """
+    try:
+        stat = os.stat(filename)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _get_filename(directive):
+    """
+    :type directive: Directive
+    :rtype: str
+    """
+    source = directive.source
+    return None if source is None else source.filename
+
+
+class IncrementalConfig(object):
+    """
+    A config's MainContext, along with which file included which, so that
+    each file's directives can be found again.
+    """
+    def __init__(self, filename, server_root=None):
+        """
+        :type filename: str
+        :type server_root: str
+        """
+        self.filename = filename
+        self.server_root = server_root
+
+        self.main_context = None
+        self.full_parses = 0
+        self.partial_parses = 0
+
+        # filename -> its stamp when last read
+        self._stamps = {}
+
+        # (the including file, pattern, the filenames it matched)
+        self._includes = []
+
+        # set after a failed refresh, when the tree no longer matches the
+        # stamps
+        self._needs_reload = False
+
+        self.reload()
+
+    def reload(self):
+        """
+        Parse the whole config again.
+        """
+        include_graph = IncludeGraph()
+        self.main_context = MainContext.from_file(self.filename,
+                                                  self.server_root,
+                                                  include_graph)
+        self._stamps = {filename: _stamp(filename)
+                        for filename in include_graph.filenames}
+        self._includes = list(include_graph.includes)
+        self._needs_reload = False
+        self.full_parses += 1
+
+    def find_changes(self):
+        """
+        Files changed since they were last read, and files whose Include
+        patterns now match other files.
+
+        :rtype: set[str]
+        """
+        changed = {filename for filename, stamp in self._stamps.items()
+                   if _stamp(filename) != stamp}
+
+        changed.update(including_filename
+                       for including_filename, pattern, filenames
+                       in self._includes
+                       if tuple(sorted(glob.glob(pattern))) != filenames)
+
+        return changed
+
+    def refresh(self):
+        """
+        Bring the MainContext up to date with the files.
+
+        :rtype: set[str]
+        :returns: the files which had changed
+        """
+        changed = self.find_changes()
+        if not changed:
+            return changed
+
+        try:
+            if self._needs_reload or self.filename in changed:
+                self.reload()
+                return changed
+
+            try:
+                for filename in self._get_outermost(changed):
+                    self._reparse_file(filename)
+            except _CannotSplice:
+                self.reload()
+        except Exception:
+            self._acknowledge_changes()
+            raise
+
+        return changed
+
+    def watch(self, on_refresh, interval=DEFAULT_INTERVAL,
+              on_error=None):
+        """
+        Refresh whenever the files change, until interrupted.
+
+        :param on_refresh: called with the files which changed
+        :type on_refresh: (set[str]) -> None
+        :param interval: seconds between checking the files
+        :type interval: float
+        :param on_error: called with the error if a refresh fails, e.g. on a
+            half-written file, or one removed as it's read, as editors do
+            when saving; the last good MainContext is kept meanwhile.
+            Errors are raised if not given.
+        :type on_error: (Exception) -> None
+        """
+        while True:
+            time.sleep(interval)
+            try:
+                changed = self.refresh()
+            except (ValueError, KeyError, OSError) as error:
+                if on_error is None:
+                    raise
+                on_error(error)
+                continue
+
+            if changed:
+                on_refresh(changed)
+
+    def _get_outermost(self, filenames):
+        """
+        The files not included, however indirectly, by another of them;
+        reparsing those reparses the rest.
+
+        :type filenames: set[str]
+        :rtype: list[str]
+        """
+        parents = self._get_parents()
+
+        outermost = []
+        for filename in sorted(filenames):
+            ancestor = parents.get(filename)
+            while ancestor is not None and ancestor not in filenames:
+                ancestor = parents.get(ancestor)
+            if ancestor is None:
+                outermost.append(filename)
+        return outermost
+
+    def _get_parents(self):
+        """
+        :rtype: dict[str, str]
+        """
+        parents = {}
+        for including_filename, _, filenames in self._includes:
+            for filename in filenames:
+                if filename in parents:
+                    # included twice; its directives are in two places
+                    raise _CannotSplice(filename)
+                parents[filename] = including_filename
+        return parents
+
+    def _get_descendants(self, filename):
+        """
+        The file and every file it includes, however indirectly.
+
+        :type filename: str
+        :rtype: set[str]
+        """
+        descendants = {filename}
+        found = True
+        while found:
+            found = False
+            for including_filename, _, filenames in self._includes:
+                if including_filename in descendants and \
+                        not descendants.issuperset(filenames):
+                    descendants.update(filenames)
+                    found = True
+        return descendants
+
+    def _reparse_file(self, filename):
+        """
+        :type filename: str
+        """
+        files = self._get_descendants(filename)
+        host_index, start, end = self._locate(files)
+
+        main_context = self.main_context
+        context = main_context if host_index is None \
+            else main_context.children[host_index]
+
+        include_graph = IncludeGraph()
+        lines = read_directive_lines(filename, self.server_root,
+                                     include_graph)
+        try:
+            directives, end_match = context.consume_children(lines)
+        except (ValueError, KeyError):
+            # e.g. it opens a context another file closes; if it's really
+            # broken, parsing everything will say so
+            raise _CannotSplice(filename)
+
+        if end_match is not None:  # it closes the context it's in
+            raise _CannotSplice(filename)
+
+        context = context.with_children(
+            context.children[:start] + directives + context.children[end:])
+        if host_index is not None:
+            children = main_context.children
+            context = main_context.with_children(
+                children[:host_index] + (context,) +
+                children[host_index + 1:])
+        self.main_context = context
+
+        for old_filename in files:
+            self._stamps.pop(old_filename, None)
+        self._stamps.update((new_filename, _stamp(new_filename))
+                            for new_filename in include_graph.filenames)
+
+        # replaced where the old ones were, to keep the order they're read
+        position = next((index for index, (including_filename, _, _)
+                         in enumerate(self._includes)
+                         if including_filename in files),
+                        len(self._includes))
+        self._includes = [include for include in self._includes
+                          if include[0] not in files]
+        self._includes[position:position] = include_graph.includes
+
+        self.partial_parses += 1
+
+    def _locate(self, files):
+        """
+        Where the directives read from the files are in the tree.
+
+        :type files: set[str]
+        :rtype: (int, int, int)
+        :returns: the index of the virtual host they're in, or None if
+            they're in the main context, and the slice of its children they
+            make up
+        """
+        found = []
+        for index, child in enumerate(self.main_context.children):
+            if _get_filename(child) in files:
+                found.append((None, index))
+                continue
+
+            for inner_index, inner_child in \
+                    enumerate(getattr(child, "children", ())):
+                if _get_filename(inner_child) in files:
+                    found.append((index, inner_index))
+
+        # with nothing to replace, there's nowhere to put the new directives
+        if not found:
+            raise _CannotSplice(files)
+
+        host_indices = {host_index for host_index, _ in found}
+        if len(host_indices) > 1:
+            raise _CannotSplice(files)
+
+        indices = [index for _, index in found]
+        if indices != list(range(indices[0], indices[-1] + 1)):
+            raise _CannotSplice(files)
+
+        host_index, = host_indices
+        return host_index, indices[0], indices[-1] + 1
+
+    def _acknowledge_changes(self):
+        """
+        After a failed refresh, take the files as they are, so the same
+        failure isn't hit again until they next change; that change then
+        has everything reparsed.
+        """
+        self._includes = [(including_filename, pattern,
+                           tuple(sorted(glob.glob(pattern))))
+                          for including_filename, pattern, _
+                          in self._includes]
+
+        filenames = set(self._stamps)
+        for _, _, included in self._includes:
+            filenames.update(included)
+        self._stamps = {filename: _stamp(filename) for filename in filenames}
+
+        self._needs_reload = True
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("config")
+    parser.add_argument("--server-root")
+    parser.add_argument("--interval", type=float, default=DEFAULT_INTERVAL)
+    parser.add_argument("--analyze", action="store_true",
+                        help="report rules which can never fire after "
+                             "every change")
+    args = parser.parse_args(args)
+
+    config = IncrementalConfig(args.config, args.server_root)
+
+    def report(changed):
+        print("{}: {} full, {} partial parses so far".format(
+            ", ".join(sorted(changed)), config.full_parses,
+            config.partial_parses))
+        if args.analyze:
+            print(config.main_context.analyze())
+        sys.stdout.flush()
+
+    def report_error(error):
+        print("error: {!r}".format(error), file=sys.stderr)
+
+    print("watching {}: {} virtual hosts".format(
+        args.config, len(config.main_context.virtual_hosts)))
+    sys.stdout.flush()
+    try:
+        config.watch(report, args.interval, report_error)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
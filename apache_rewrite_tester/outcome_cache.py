@@ -0,0 +1,139 @@
+"""
+Rewritten paths remembered across requests which can't be told apart.
+
+A virtual host's rules can only see the request's path and the server
+variables their conditions' test strings and substitutions refer to, which
+are found once per host; requests to the same host agreeing on those are
+rewritten alike, however else they differ. Hosts whose rules look up maps
+are never cached.
+"""
+import collections
+import sys
+
+__author__ = 'jwilner'
+
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+# roughly what an entry costs beyond its key's and result's own objects: the
+# ordered dict's link and slot, the key tuple and the stored pair
+ENTRY_OVERHEAD = 200
+
+STATS_TEMPLATE = "{hits} hits, {misses} misses ({hit_rate:.1%} hit rate), " \
+                 "{uncacheable} uncacheable; {entries} entries in " \
+                 "~{size} of {max_bytes} bytes, {evictions} evicted"
+
+
+class OutcomeCache(object):
+    """
+    The least recently used outcomes are evicted once their estimated size
+    exceeds the budget.
+    """
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        """
+        :param max_bytes: roughly how much memory the entries may take
+        :type max_bytes: int
+        """
+        self.max_bytes = max_bytes
+
+        self.hits = 0
+        self.misses = 0
+        self.uncacheable = 0
+        self.evictions = 0
+        self.size = 0
+
+        # key -> (result, estimated size)
+        self._entries = collections.OrderedDict()
+
+        # keys hold handlers by id, so those are kept alive to keep their ids
+        # from being reused
+        self._handlers = {}
+
+    def __getstate__(self):
+        """
+        Outcomes are only worth keeping within a process; a pickled cache,
+        e.g. one sent to a worker, starts empty.
+
+        :rtype: dict
+        """
+        return {"max_bytes": self.max_bytes}
+
+    def __setstate__(self, state):
+        """
+        :type state: dict
+        """
+        self.__init__(**state)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __str__(self):
+        return STATS_TEMPLATE.format(hits=self.hits, misses=self.misses,
+                                     hit_rate=self.hit_rate,
+                                     uncacheable=self.uncacheable,
+                                     entries=len(self), size=self.size,
+                                     max_bytes=self.max_bytes,
+                                     evictions=self.evictions)
+
+    @property
+    def hit_rate(self):
+        """
+        :rtype: float
+        """
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.
+
+    def rewrite(self, handler, request, environment):
+        """
+        The request's path as rewritten by the handler, which should be the
+        one selected for it.
+
+        :type handler: RequestHandler
+        :type request: HTTPRequest
+        :type environment: MutableMapping
+        :rtype: str
+        """
+        variables = handler.get_observed_variables()
+        if variables is None:
+            self.uncacheable += 1
+            return handler.rewrite(request.path, environment)
+
+        key = (id(handler), request.path) + \
+            tuple(environment.get(variable) for variable in variables)
+
+        entries = self._entries
+        entry = entries.get(key)
+        if entry is not None:
+            entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+        self.misses += 1
+        result = handler.rewrite(request.path, environment)
+        self._store(handler, key, result)
+        return result
+
+    def clear(self):
+        self._entries.clear()
+        self._handlers.clear()
+        self.size = 0
+
+    def _store(self, handler, key, result):
+        """
+        :type handler: RequestHandler
+        :type key: tuple
+        :type result: str
+        """
+        size = ENTRY_OVERHEAD + sys.getsizeof(result) + \
+            sum(sys.getsizeof(part) for part in key)
+        if size > self.max_bytes:
+            return
+
+        self._handlers[key[0]] = handler
+        self._entries[key] = result, size
+        self.size += size
+
+        while self.size > self.max_bytes:
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+            self.size -= evicted_size
+            self.evictions += 1
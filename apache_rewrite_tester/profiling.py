@@ -0,0 +1,169 @@
+"""
+Per-directive counters and timings for compiled rule programs, so that hot
+rules can be found and reordered or rewritten.
+
+Profiling is opt in, through MainContext.compile(profile=Profile()); the
+programs of unprofiled contexts carry no instrumentation at all.
+"""
+import csv
+import io
+import json
+
+__author__ = 'jwilner'
+
+
+FIELDS = "index", "kind", "filename", "line_number", "attempts", "matches", \
+    "condition_failures", "nanoseconds"
+
+PROMETHEUS_PREFIX = "apache_rewrite"
+
+# counter -> help text
+PROMETHEUS_COUNTERS = (
+    ("attempts", "Times the directive was tried."),
+    ("matches", "Times the directive's pattern matched."),
+    ("condition_failures",
+     "Times a rule's pattern matched but its conditions didn't hold."),
+    ("nanoseconds", "Time spent in the directive."),
+)
+
+PROMETHEUS_SAMPLE_TEMPLATE = '{name}{{index="{stats.index}",' \
+                             'kind="{stats.kind}",file={filename},' \
+                             'line="{line_number}"}} {value}'
+
+
+class DirectiveStats(object):
+    __slots__ = "index", "kind", "filename", "line_number", "attempts", \
+        "matches", "condition_failures", "nanoseconds"
+
+    def __init__(self, index, kind, filename, line_number):
+        """
+        :param index: distinguishes directives without a known source
+        :type index: int
+        :type kind: str
+        :type filename: str
+        :type line_number: int
+        """
+        self.index = index
+        self.kind = kind
+        self.filename = filename
+        self.line_number = line_number
+        self.attempts = 0
+        self.matches = 0
+        self.condition_failures = 0
+        self.nanoseconds = 0
+
+    def as_dict(self):
+        """
+        :rtype: dict[str, object]
+        """
+        return {field: getattr(self, field) for field in FIELDS}
+
+
+class Profile(object):
+    """
+    Stats for each profiled directive, in the order they were compiled.
+    """
+    def __init__(self):
+        # directives compare by value, so two identical rules on different
+        # lines would otherwise share stats
+        self._stats = {}
+
+    def get_stats(self, directive, kind):
+        """
+        The directive's stats, created on first use; recompiling a
+        directive keeps adding to the same ones.
+
+        :type directive: Directive
+        :type kind: str
+        :rtype: DirectiveStats
+        """
+        try:
+            stats, _ = self._stats[id(directive)]
+        except KeyError:
+            source = directive.source
+            stats = DirectiveStats(len(self._stats), kind,
+                                   None if source is None else source.filename,
+                                   None if source is None
+                                   else source.line_number)
+            # holding on to the directive keeps its id from being reused
+            self._stats[id(directive)] = stats, directive
+
+        return stats
+
+    @property
+    def stats(self):
+        """
+        :rtype: list[DirectiveStats]
+        """
+        return [stats for stats, _ in self._stats.values()]
+
+    def get_hottest(self, count=10):
+        """
+        :type count: int
+        :rtype: list[DirectiveStats]
+        """
+        return sorted(self.stats, key=lambda stats: stats.nanoseconds,
+                      reverse=True)[:count]
+
+    def to_json(self):
+        """
+        :rtype: str
+        """
+        return json.dumps([stats.as_dict() for stats in self.stats], indent=2)
+
+    def to_csv(self):
+        """
+        :rtype: str
+        """
+        output = io.StringIO()
+        writer = csv.DictWriter(output, FIELDS, lineterminator="\n")
+        writer.writeheader()
+        writer.writerows(stats.as_dict() for stats in self.stats)
+        return output.getvalue()
+
+    def to_prometheus(self):
+        """
+        A snapshot in Prometheus' text exposition format.
+
+        :rtype: str
+        """
+        lines = []
+        for counter, help_text in PROMETHEUS_COUNTERS:
+            name = "{}_{}_total".format(PROMETHEUS_PREFIX, counter)
+            lines.append("# HELP {} {}".format(name, help_text))
+            lines.append("# TYPE {} counter".format(name))
+            for stats in self.stats:
+                lines.append(PROMETHEUS_SAMPLE_TEMPLATE.format(
+                    name=name, stats=stats,
+                    filename=_quote_label(stats.filename or ""),
+                    line_number=stats.line_number or "",
+                    value=getattr(stats, counter)))
+
+        return "\n".join(lines) + "\n"
+
+    def write(self, filename):
+        """
+        Write a report, in a format chosen by the file's extension: .json,
+        .csv, or otherwise Prometheus text.
+
+        :type filename: str
+        """
+        if filename.endswith(".json"):
+            report = self.to_json()
+        elif filename.endswith(".csv"):
+            report = self.to_csv()
+        else:
+            report = self.to_prometheus()
+
+        with open(filename, "w") as report_file:
+            report_file.write(report)
+
+
+def _quote_label(value):
+    """
+    :type value: object
+    :rtype: str
+    """
+    escaped = str(value).replace("\\", "\\\\").replace("\n", "\\n") \
+        .replace('"', '\\"')
+    return '"{}"'.format(escaped)
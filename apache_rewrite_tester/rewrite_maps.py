@@ -0,0 +1,858 @@
+"""
+Lookups for the maps RewriteMap defines: txt and rnd files, dbm files, the
+int functions, and prg programs.
+
+Small text maps are read into a dict. Large ones are built once into a
+hashed index file, which is memory-mapped and probed in place, so even
+millions of entries stay out of the Python heap; the index is rebuilt
+whenever its map file changes. dbm maps are read from such an index built
+ahead of time, like httxt2dbm does for Apache:
+
+    python -m apache_rewrite_tester.rewrite_maps map.txt map.index
+
+or else from whatever dbm file Python's own dbm module can open.
+
+Every file-backed map keeps its hottest lookups in an LRU, as does every
+program map, whose programs are started once and kept running.
+"""
+import argparse
+import array
+import collections
+import concurrent.futures
+import dbm
+import functools
+import hashlib
+import mmap
+import os
+import random
+import shlex
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import urllib.parse
+import zlib
+
+__author__ = 'jwilner'
+
+
+INDEX_MAGIC = b"ARTMAP\x00\x01"
+
+# magic, the source's mtime and size when built, entries, slots, and where
+# the slots start
+INDEX_HEADER = struct.Struct("<8sQQQQQ")
+
+# an entry's key and value lengths, followed by both
+RECORD_HEADER = struct.Struct("<II")
+
+# the offset of an entry's record, or 0 for an empty slot
+SLOT = struct.Struct("<Q")
+
+INDEX_SUFFIX = ".map-index"
+
+# text maps bigger than this are indexed rather than read into a dict
+IN_MEMORY_LIMIT = 1 << 20
+
+DEFAULT_CACHE_SIZE = 4096
+
+# how many copies of a map's program may run at once
+DEFAULT_POOL_SIZE = 4
+
+# how long to wait for a program's answer, in seconds
+DEFAULT_TIMEOUT = 5.
+
+# what a program answers for a key it has no value for
+PROGRAM_NOT_FOUND = "NULL"
+
+DEFAULT_INDEX_DIRECTORY = os.path.join(tempfile.gettempdir(),
+                                       "apache-rewrite-tester-maps")
+
+ENCODING = "utf-8"
+
+# what ap_escape_uri leaves alone
+URI_SAFE_CHARACTERS = "$-_.+!*'(),:@&=/~"
+
+
+def _encode(string):
+    """
+    :type string: str
+    :rtype: bytes
+    """
+    return string.encode(ENCODING, "surrogateescape")
+
+
+def _decode(data):
+    """
+    :type data: bytes
+    :rtype: str
+    """
+    return data.decode(ENCODING, "surrogateescape")
+
+
+def _stamp(filename):
+    """
+    :type filename: str
+    :rtype: (int, int)
+    """
+    stat = os.stat(filename)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def read_text_map(filename):
+    """
+    Each key and value, in order: one pair per line, separated by
+    whitespace; anything after the value, blank lines and lines starting
+    with a # are ignored.
+
+    :type filename: str
+    :rtype: __generator[(str, str)]
+    """
+    with open(filename, encoding=ENCODING, errors="surrogateescape") as \
+            map_file:
+        for line in map_file:
+            fields = line.split(None, 2)
+            if len(fields) < 2 or fields[0].startswith("#"):
+                continue
+            yield fields[0], fields[1]
+
+
+def _get_slot_count(entry_count):
+    """
+    A power of two, so probing wraps with a mask, and at most half full.
+
+    :type entry_count: int
+    :rtype: int
+    """
+    slot_count = 8
+    while slot_count < 2 * entry_count:
+        slot_count <<= 1
+    return slot_count
+
+
+def _get_record_key(mapped, offset):
+    """
+    :type mapped: mmap.mmap
+    :type offset: int
+    :rtype: bytes
+    """
+    key_length, _ = RECORD_HEADER.unpack_from(mapped, offset)
+    start = offset + RECORD_HEADER.size
+    return mapped[start:start + key_length]
+
+
+def build_index(entries, filename, stamp=(0, 0)):
+    """
+    Write the entries out as an open-addressed hash table, keyed by the
+    CRC32 of the key and probed linearly. Of entries with the same key, the
+    first is kept, as a text map's lookups would find.
+
+    :type entries: Iterable[(str, str)]
+    :type filename: str
+    :param stamp: the modification time and size of what the entries were
+        read from, to tell when the index is stale
+    :type stamp: (int, int)
+    """
+    directory = os.path.dirname(filename) or "."
+    os.makedirs(directory, exist_ok=True)
+
+    # written aside and renamed into place, so a concurrent reader never
+    # maps half an index
+    handle, temporary = tempfile.mkstemp(dir=directory)
+    try:
+        with os.fdopen(handle, "w+b") as index_file:
+            index_file.write(bytes(INDEX_HEADER.size))
+
+            # kept compactly, since there may be millions
+            hashes, offsets = array.array("I"), array.array("Q")
+            offset = INDEX_HEADER.size
+            for key, value in entries:
+                key, value = _encode(key), _encode(value)
+                index_file.write(RECORD_HEADER.pack(len(key), len(value)))
+                index_file.write(key)
+                index_file.write(value)
+                hashes.append(zlib.crc32(key))
+                offsets.append(offset)
+                offset += RECORD_HEADER.size + len(key) + len(value)
+            index_file.flush()
+
+            slot_count = _get_slot_count(len(offsets))
+            mask = slot_count - 1
+            slots = array.array("Q", bytes(SLOT.size * slot_count))
+            entry_count = 0
+            with mmap.mmap(index_file.fileno(), 0,
+                           access=mmap.ACCESS_READ) as mapped:
+                for key_hash, record_offset in zip(hashes, offsets):
+                    key = None
+                    slot = key_hash & mask
+                    while slots[slot]:
+                        if key is None:
+                            key = _get_record_key(mapped, record_offset)
+                        if _get_record_key(mapped, slots[slot]) == key:
+                            break
+                        slot = (slot + 1) & mask
+                    else:
+                        slots[slot] = record_offset
+                        entry_count += 1
+
+            slots_offset = offset + -offset % SLOT.size
+            index_file.write(bytes(slots_offset - offset))
+            if sys.byteorder != "little":
+                slots.byteswap()
+            slots.tofile(index_file)
+
+            index_file.seek(0)
+            index_file.write(INDEX_HEADER.pack(INDEX_MAGIC, stamp[0],
+                                               stamp[1], entry_count,
+                                               slot_count, slots_offset))
+        os.replace(temporary, filename)
+    except BaseException:
+        os.remove(temporary)
+        raise
+
+
+def is_index(filename):
+    """
+    :type filename: str
+    :rtype: bool
+    """
+    try:
+        with open(filename, "rb") as index_file:
+            return index_file.read(len(INDEX_MAGIC)) == INDEX_MAGIC
+    except OSError:
+        return False
+
+
+class HashedIndex(object):
+    """
+    A memory-mapped index built by build_index; looking a key up touches
+    only the pages holding its slots and record.
+    """
+    def __init__(self, filename):
+        """
+        :type filename: str
+        """
+        self.filename = filename
+        with open(filename, "rb") as index_file:
+            self._mapped = mmap.mmap(index_file.fileno(), 0,
+                                     access=mmap.ACCESS_READ)
+
+        magic, mtime_ns, size, self.entry_count, slot_count, \
+            self._slots_offset = INDEX_HEADER.unpack_from(self._mapped)
+        if magic != INDEX_MAGIC:
+            self.close()
+            raise ValueError("Not a map index: {}".format(filename))
+
+        self.stamp = mtime_ns, size
+        self._mask = slot_count - 1
+
+    def __len__(self):
+        return self.entry_count
+
+    def get(self, key):
+        """
+        :type key: str
+        :rtype: str
+        :returns: None if there's no such key
+        """
+        key = _encode(key)
+        key_length = len(key)
+        mapped, mask, slots_offset = self._mapped, self._mask, \
+            self._slots_offset
+
+        slot = zlib.crc32(key) & mask
+        while True:
+            offset, = SLOT.unpack_from(mapped, slots_offset +
+                                       SLOT.size * slot)
+            if not offset:
+                return None
+
+            stored_key_length, value_length = \
+                RECORD_HEADER.unpack_from(mapped, offset)
+            start = offset + RECORD_HEADER.size
+            if stored_key_length == key_length and \
+                    mapped[start:start + key_length] == key:
+                start += key_length
+                return _decode(mapped[start:start + value_length])
+
+            slot = (slot + 1) & mask
+
+    def close(self):
+        self._mapped.close()
+
+
+class RewriteMapLookup(object):
+    """
+    A map, opened; `lookup` gives a key's value, or None if there's none.
+    """
+    def lookup(self, key):
+        """
+        :type key: str
+        :rtype: str
+        """
+        raise NotImplementedError()
+
+    def close(self):
+        pass
+
+
+class CachedLookup(RewriteMapLookup):
+    """
+    Keeps the most recently looked up keys' values in an LRU.
+    """
+    def __init__(self, get, cache_size=DEFAULT_CACHE_SIZE):
+        """
+        :param get: looks a key up uncached
+        :type get: (str) -> str
+        :type cache_size: int
+        """
+        self.lookup = functools.lru_cache(cache_size)(get)
+
+    def cache_info(self):
+        """
+        :rtype: functools._CacheInfo
+        """
+        return self.lookup.cache_info()
+
+
+class TextMap(CachedLookup):
+    """
+    txt: a file of keys and values.
+    """
+    def __init__(self, filename, index_directory=DEFAULT_INDEX_DIRECTORY,
+                 cache_size=DEFAULT_CACHE_SIZE):
+        """
+        :type filename: str
+        :param index_directory: where to build the index of a large map
+        :type index_directory: str
+        :type cache_size: int
+        """
+        self.filename = filename
+        self._index = None
+
+        stamp = _stamp(filename)
+        _, size = stamp
+        if size <= IN_MEMORY_LIMIT:
+            entries = {}
+            for key, value in read_text_map(filename):
+                entries.setdefault(key, value)
+            get = entries.get
+        else:
+            self._index = self._open_index(index_directory, stamp)
+            get = self._index.get
+
+        super(TextMap, self).__init__(get, cache_size)
+
+    def _open_index(self, index_directory, stamp):
+        """
+        :type index_directory: str
+        :type stamp: (int, int)
+        :rtype: HashedIndex
+        """
+        name = hashlib.sha256(_encode(os.path.abspath(self.filename))) \
+            .hexdigest()
+        index_filename = os.path.join(index_directory, name + INDEX_SUFFIX)
+
+        try:
+            index = HashedIndex(index_filename)
+        except (OSError, ValueError, struct.error):
+            index = None
+
+        if index is not None and index.stamp == stamp:
+            return index
+
+        if index is not None:
+            index.close()
+        build_index(read_text_map(self.filename), index_filename, stamp)
+        return HashedIndex(index_filename)
+
+    def close(self):
+        if self._index is not None:
+            self._index.close()
+
+
+class RandomMap(TextMap):
+    """
+    rnd: a text map whose values are |-separated alternatives, one of which
+    is picked at random for every lookup; it's the alternatives which are
+    cached.
+    """
+    def __init__(self, filename, index_directory=DEFAULT_INDEX_DIRECTORY,
+                 cache_size=DEFAULT_CACHE_SIZE):
+        """
+        :type filename: str
+        :type index_directory: str
+        :type cache_size: int
+        """
+        super(RandomMap, self).__init__(filename, index_directory,
+                                        cache_size)
+        self._lookup_alternatives = self.lookup
+        self.lookup = self._choose
+
+    def _choose(self, key):
+        """
+        :type key: str
+        :rtype: str
+        """
+        value = self._lookup_alternatives(key)
+        return None if value is None else random.choice(value.split("|"))
+
+    def cache_info(self):
+        return self._lookup_alternatives.cache_info()
+
+
+class DbmMap(CachedLookup):
+    """
+    dbm: an index built by this module, or a file of any dbm kind Python
+    supports.
+    """
+    def __init__(self, filename, cache_size=DEFAULT_CACHE_SIZE):
+        """
+        :type filename: str
+        :type cache_size: int
+        """
+        self.filename = filename
+        self._index = self._database = None
+        if is_index(filename):
+            self._index = HashedIndex(filename)
+            get = self._index.get
+        else:
+            self._database = dbm.open(filename, "r")
+            get = self._get_from_database
+
+        super(DbmMap, self).__init__(get, cache_size)
+
+    def _get_from_database(self, key):
+        """
+        :type key: str
+        :rtype: str
+        """
+        value = self._database.get(_encode(key))
+        return None if value is None else _decode(value)
+
+    def close(self):
+        if self._index is not None:
+            self._index.close()
+        if self._database is not None:
+            self._database.close()
+
+
+def _unescape(string):
+    """
+    :type string: str
+    :rtype: str
+    """
+    return urllib.parse.unquote(string, ENCODING, "surrogateescape")
+
+
+class InternalMap(RewriteMapLookup):
+    """
+    int: one of mod_rewrite's built in functions.
+    """
+    FUNCTIONS = {
+        "toupper": str.upper,
+        "tolower": str.lower,
+        "escape": functools.partial(urllib.parse.quote,
+                                    safe=URI_SAFE_CHARACTERS,
+                                    encoding=ENCODING,
+                                    errors="surrogateescape"),
+        "unescape": _unescape,
+    }
+
+    def __init__(self, function_name):
+        """
+        :type function_name: str
+        """
+        try:
+            self.lookup = self.FUNCTIONS[function_name]
+        except KeyError:
+            raise ValueError("Unknown internal map function: {}".format(
+                function_name))
+
+
+class ProgramWorker(object):
+    """
+    One running copy of a map's program, which reads a key per line on its
+    stdin and answers each with a line on its stdout, in order. Keys are
+    written as soon as they're submitted, without waiting on the answers to
+    those before them; a thread reads the answers back and hands each to
+    the oldest key still waiting.
+    """
+    def __init__(self, command):
+        """
+        :type command: list[str]
+        """
+        self.command = command
+        self.alive = True
+
+        self._process = subprocess.Popen(command, stdin=subprocess.PIPE,
+                                         stdout=subprocess.PIPE)
+        self._pending = collections.deque()
+        self._lock = threading.Lock()
+
+        # keeps keys queued in the order they're written, without holding
+        # up the reader while a long write waits on the program to read
+        self._write_lock = threading.Lock()
+
+        self._reader = threading.Thread(target=self._read, daemon=True)
+        self._reader.start()
+
+    @property
+    def pending(self):
+        """
+        How many keys are still waiting on answers.
+
+        :rtype: int
+        """
+        return len(self._pending)
+
+    def submit(self, keys):
+        """
+        :type keys: Sequence[str]
+        :returns: the answers to come, in the same order; None where there
+            was no value, or no answer
+        :rtype: list[concurrent.futures.Future]
+        """
+        replies = [concurrent.futures.Future() for _ in keys]
+        lines = b"".join(_encode(key) + b"\n" for key in keys)
+
+        with self._write_lock:
+            with self._lock:
+                if self.alive:
+                    self._pending.extend(replies)
+                else:
+                    for reply in replies:
+                        reply.set_result(None)
+                    return replies
+
+            try:
+                self._process.stdin.write(lines)
+                self._process.stdin.flush()
+            except (OSError, ValueError):
+                # the program's exited, or been closed
+                with self._lock:
+                    self._fail_pending()
+
+        return replies
+
+    def _read(self):
+        for line in iter(self._process.stdout.readline, b""):
+            with self._lock:
+                if not self._pending:
+                    # nothing asked for it
+                    continue
+                reply = self._pending.popleft()
+
+            value = _decode(line.rstrip(b"\r\n"))
+            reply.set_result(None if value == PROGRAM_NOT_FOUND else value)
+
+        with self._lock:
+            self._fail_pending()
+
+    def _fail_pending(self):
+        """
+        Once the program's gone, nothing it was asked will be answered.
+        """
+        self.alive = False
+        while self._pending:
+            self._pending.popleft().set_result(None)
+
+    def kill(self):
+        """
+        Stop the program at once, e.g. after it's failed to answer in time,
+        so that any answers it did give would be out of step.
+        """
+        with self._lock:
+            self._fail_pending()
+        self._process.kill()
+        self.close()
+
+    def close(self, timeout=DEFAULT_TIMEOUT):
+        """
+        :param timeout: how long to let the program exit of its own accord
+            once its stdin is closed, before killing it
+        :type timeout: float
+        """
+        with self._lock:
+            self.alive = False
+        try:
+            self._process.stdin.close()
+        except OSError:
+            pass
+
+        try:
+            self._process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            self._process.kill()
+            self._process.wait()
+
+        self._reader.join()
+        self._process.stdout.close()
+
+    def abandon(self):
+        """
+        Let go of a program started by the process this one was forked
+        from, leaving it to that process; closing our copies of its pipes
+        lets it see the end of its input once the original closes them.
+        """
+        self.alive = False
+        self._process.stdin.close()
+        self._process.stdout.close()
+
+
+class ProgramMap(CachedLookup):
+    """
+    prg: a program looking up keys, rather than a file. Copies of the
+    program are started as lookups need them, up to the size of the pool,
+    and kept running between lookups rather than started for each. The
+    program is assumed to give the same answer for the same key, so its
+    answers are cached like any other map's; a cache size of 0 asks it
+    every time.
+
+    A program which fails to answer within the timeout is killed, and its
+    lookups give nothing, as if it had answered NULL; so do lookups when
+    the program can't be started at all.
+    """
+    def __init__(self, command, pool_size=DEFAULT_POOL_SIZE,
+                 timeout=DEFAULT_TIMEOUT, cache_size=DEFAULT_CACHE_SIZE):
+        """
+        :param command: the program and its arguments
+        :type command: list[str]
+        :type pool_size: int
+        :param timeout: the longest to wait for any one answer, in seconds
+        :type timeout: float
+        :type cache_size: int
+        """
+        self.command = command
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.timeouts = 0
+        self.start_failures = 0
+
+        self._workers = []
+        self._workers_pid = os.getpid()
+        self._lock = threading.Lock()
+
+        # answers looked up together by lookup_many, on their way into the
+        # cache
+        self._prefetched = {}
+
+        super(ProgramMap, self).__init__(self._get, cache_size)
+
+    def _check_workers(self):
+        """
+        Forget workers which have died, or which belong to the process this
+        one was forked from.
+        """
+        if self._workers_pid != os.getpid():
+            for worker in self._workers:
+                worker.abandon()
+            self._workers = []
+            self._workers_pid = os.getpid()
+            return
+
+        for worker in self._workers:
+            if not worker.alive:
+                worker.close()
+        self._workers = [worker for worker in self._workers if worker.alive]
+
+    def _start_worker(self):
+        """
+        :rtype: ProgramWorker
+        :returns: None if the program can't be started
+        """
+        try:
+            worker = ProgramWorker(self.command)
+        except OSError:
+            self.start_failures += 1
+            return None
+
+        self._workers.append(worker)
+        return worker
+
+    def _choose_worker(self):
+        """
+        The least busy worker, unless all are busy and there's room for
+        another.
+
+        :rtype: ProgramWorker
+        :returns: None if there's none, and the program can't be started
+        """
+        with self._lock:
+            self._check_workers()
+            worker = min(self._workers, key=lambda each: each.pending,
+                         default=None)
+            if worker is None or \
+                    (worker.pending and len(self._workers) < self.pool_size):
+                worker = self._start_worker() or worker
+            return worker
+
+    def _fill_pool(self):
+        """
+        :rtype: list[ProgramWorker]
+        """
+        with self._lock:
+            self._check_workers()
+            while len(self._workers) < self.pool_size and \
+                    self._start_worker() is not None:
+                pass
+            return list(self._workers)
+
+    def _wait(self, worker, reply):
+        """
+        :type worker: ProgramWorker
+        :type reply: concurrent.futures.Future
+        :rtype: str
+        """
+        try:
+            return reply.result(self.timeout)
+        except concurrent.futures.TimeoutError:
+            self.timeouts += 1
+            worker.kill()
+            return None
+
+    def _get(self, key):
+        """
+        :type key: str
+        :rtype: str
+        """
+        try:
+            return self._prefetched.pop(key)
+        except KeyError:
+            pass
+
+        worker = self._choose_worker()
+        if worker is None:
+            return None
+
+        reply, = worker.submit([key])
+        return self._wait(worker, reply)
+
+    def lookup_many(self, keys):
+        """
+        Look many keys up at once, split across the whole pool, with every
+        key written before any answer is waited on.
+
+        :type keys: Iterable[str]
+        :rtype: list[str]
+        """
+        keys = list(keys)
+        unique_keys = list(collections.OrderedDict.fromkeys(keys))
+        workers = self._fill_pool()
+        if not workers:
+            return [None] * len(keys)
+
+        submitted = [(worker, worker.submit(unique_keys[index::len(workers)]))
+                     for index, worker in enumerate(workers)]
+        for index, (worker, replies) in enumerate(submitted):
+            for key, reply in zip(unique_keys[index::len(workers)], replies):
+                self._prefetched[key] = self._wait(worker, reply)
+
+        try:
+            return [self.lookup(key) for key in keys]
+        finally:
+            self._prefetched.clear()
+
+    def close(self):
+        with self._lock:
+            self._check_workers()
+            for worker in self._workers:
+                worker.close()
+            self._workers = []
+
+
+def open_map(directive, index_directory=DEFAULT_INDEX_DIRECTORY,
+             cache_size=DEFAULT_CACHE_SIZE, pool_size=DEFAULT_POOL_SIZE,
+             timeout=DEFAULT_TIMEOUT):
+    """
+    :type directive: RewriteMap
+    :type index_directory: str
+    :type cache_size: int
+    :param pool_size: how many copies of a prg map's program may run
+    :type pool_size: int
+    :param timeout: how long to wait on a prg map's program, in seconds
+    :type timeout: float
+    :rtype: RewriteMapLookup
+    """
+    map_type, source = directive.map_type, directive.map_source
+    if map_type == "txt":
+        return TextMap(source, index_directory, cache_size)
+    if map_type == "rnd":
+        return RandomMap(source, index_directory, cache_size)
+    if map_type == "dbm":
+        return DbmMap(source, cache_size)
+    if map_type == "int":
+        return InternalMap(source)
+    if map_type == "prg":
+        return ProgramMap(shlex.split(source), pool_size, timeout,
+                          cache_size)
+
+    raise ValueError("Unsupported RewriteMap type: {}".format(map_type))
+
+
+class RewriteMaps(object):
+    """
+    The maps a context defines, by name, each opened on first use; as with
+    Apache, a later definition of a name replaces an earlier one.
+    """
+    def __init__(self, directives, index_directory=DEFAULT_INDEX_DIRECTORY,
+                 cache_size=DEFAULT_CACHE_SIZE, pool_size=DEFAULT_POOL_SIZE,
+                 timeout=DEFAULT_TIMEOUT):
+        """
+        :type directives: Iterable[RewriteMap]
+        :type index_directory: str
+        :type cache_size: int
+        :type pool_size: int
+        :type timeout: float
+        """
+        self.directives = {directive.name: directive
+                           for directive in directives}
+        self.index_directory = index_directory
+        self.cache_size = cache_size
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self._opened = {}
+
+    def __contains__(self, name):
+        return name in self.directives
+
+    def get(self, name):
+        """
+        :type name: str
+        :rtype: RewriteMapLookup
+        :returns: None if there's no map of that name
+        """
+        try:
+            return self._opened[name]
+        except KeyError:
+            pass
+
+        directive = self.directives.get(name)
+        if directive is None:
+            return None
+
+        self._opened[name] = rewrite_map = open_map(
+            directive, self.index_directory, self.cache_size, self.pool_size,
+            self.timeout)
+        return rewrite_map
+
+    def close(self):
+        for rewrite_map in self._opened.values():
+            rewrite_map.close()
+        self._opened.clear()
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description="Build a text map into an index for dbm: maps.")
+    parser.add_argument("text_map")
+    parser.add_argument("index")
+    args = parser.parse_args(args)
+
+    build_index(read_text_map(args.text_map), args.index,
+                _stamp(args.text_map))
+    print("{}: {} entries".format(args.index, len(HashedIndex(args.index))))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,191 @@
+import re
+
+from apache_rewrite_tester.rewrite_objects.rule import RuleFlag
+
+__author__ = 'jwilner'
+
+
+# rules jumping, restarting or chaining can't be looked up independently
+UNFUSABLE_FLAGS = RuleFlag.CHAIN, RuleFlag.SKIP, RuleFlag.NEXT
+
+# constructs which mean something else once embedded in a larger regex:
+# named groups (which must be unique), group references (which would need
+# renumbering) and global inline flags (which must come first).
+UNFUSABLE_PATTERN_REGEX = re.compile(r"""
+                                     \(\?P|
+                                     \(\?\(|
+                                     \\\d|
+                                     \(\?[a-zA-Z]+\)
+                                     """, re.VERBOSE)
+
+MINIMUM_RUN_LENGTH = 4
+
+# past a point, compiling the regex costs more than it saves
+MAXIMUM_RUN_LENGTH = 256
+
+# how many times cheaper trying one more alternative of a fused regex is
+# than trying one more rule on its own; runs with too few of their rules
+# left as candidates are better tried rule by rule.
+FUSION_RATIO = 16
+
+
+class RemappedMatch(object):
+    """
+    The part of a match of a fused regex belonging to one rule, with its
+    groups numbered as the rule's own regex would number them.
+    """
+    __slots__ = "match", "offset", "group_numbers"
+
+    def __init__(self, match, offset, group_count):
+        """
+        :type match: __Match
+        :param offset: how many groups precede the rule's own
+        :type offset: int
+        :type group_count: int
+        """
+        self.match = match
+        self.offset = offset
+        self.group_numbers = tuple(range(offset + 1,
+                                         offset + 1 + group_count))
+
+    def group(self, index=0):
+        """
+        :type index: int
+        :rtype: str
+        """
+        if index == 0:  # the rule's alternative was the whole match
+            return self.match.group(0)
+
+        if not 0 < index <= len(self.group_numbers):
+            raise IndexError("no such group")
+
+        return self.match.group(self.offset + index)
+
+    def groups(self, default=None):
+        """
+        :param default: for groups which took no part in the match
+        :type default: str
+        :rtype: tuple[str]
+        """
+        # not match.groups(), which would copy every rule's groups
+        numbers = self.group_numbers
+        if not numbers:
+            return ()
+
+        groups = (self.match.group(numbers[0]),) if len(numbers) == 1 \
+            else self.match.group(*numbers)
+        if default is not None and None in groups:
+            return tuple(default if group is None else group
+                         for group in groups)
+        return groups
+
+
+class FusedRules(object):
+    """
+    A run of consecutive, independent rules whose patterns are tried in one
+    pass of a single regex: an alternation of them all, in order. A regex
+    alternation takes the first alternative which can match, so which
+    alternative matched identifies the first rule which would have.
+
+    Each alternative ends with an empty group marking it; being last, that's
+    the match's `lastindex`. Marking the end rather than wrapping the whole
+    alternative keeps failed alternatives from setting any groups, which
+    would make re save and restore them at every later branch.
+    """
+    __slots__ = "start", "end", "regex", "alternatives"
+
+    @staticmethod
+    def is_fusable(rule, previous_rule):
+        """
+        :type rule: CompiledRule
+        :type previous_rule: CompiledRule
+        :rtype: bool
+        """
+        if rule.conditions or rule.negated:
+            return False
+
+        if previous_rule is not None and \
+                RuleFlag.CHAIN in previous_rule.directive.flags:
+            return False
+
+        flags = rule.directive.flags
+        if any(flag in flags for flag in UNFUSABLE_FLAGS):
+            return False
+
+        return UNFUSABLE_PATTERN_REGEX.search(rule.directive.pattern.pattern) \
+            is None
+
+    @classmethod
+    def find_runs(cls, rules):
+        """
+        The run each rule belongs to, if any.
+
+        :type rules: tuple[CompiledRule]
+        :rtype: tuple[FusedRules]
+        """
+        runs = [None] * len(rules)
+
+        start = 0
+        for index in range(len(rules) + 1):
+            previous = rules[index - 1] if index else None
+            fusable = index < len(rules) and \
+                cls.is_fusable(rules[index], previous)
+            if fusable and index - start < MAXIMUM_RUN_LENGTH:
+                continue
+
+            if index - start >= MINIMUM_RUN_LENGTH:
+                run = cls(rules, start, index)
+                runs[start:index] = [run] * (index - start)
+
+            start = index if fusable else index + 1
+
+        return tuple(runs)
+
+    def __init__(self, rules, start, end):
+        """
+        :type rules: tuple[CompiledRule]
+        :type start: int
+        :type end: int
+        """
+        self.start = start
+        self.end = end
+
+        # marking group -> (rule index, groups preceding the rule's own,
+        # the rule's own group count)
+        self.alternatives = {}
+
+        parts, offset = [], 0
+        for rule_index in range(start, end):
+            rule = rules[rule_index]
+            parts.append("(?{}:{})()".format("i" if rule.ignore_case else "",
+                                             rule.directive.pattern.pattern))
+
+            group_count = rule.regex.groups
+            marker = offset + group_count + 1
+            self.alternatives[marker] = rule_index, offset, group_count
+            offset = marker
+
+        self.regex = re.compile("|".join(parts))
+
+    def is_worthwhile(self, candidate_count):
+        """
+        Whether to use the fused regex, or just try the candidates.
+
+        :param candidate_count: rules of the run which might match
+        :type candidate_count: int
+        :rtype: bool
+        """
+        return candidate_count * FUSION_RATIO >= self.end - self.start
+
+    def match(self, path):
+        """
+        :type path: str
+        :rtype: (int, RemappedMatch)
+        :returns: the first rule of the run to match, and its match
+        """
+        match = self.regex.match(path)
+        if match is None:
+            return None, None
+
+        rule_index, offset, group_count = self.alternatives[match.lastindex]
+        return rule_index, RemappedMatch(match, offset, group_count)
@@ -0,0 +1,329 @@
+"""
+Static analysis of the rules in a context, finding those which can never
+fire so they can be reported, or pruned from compiled programs.
+
+Everything here is conservative: a rule is only reported when it provably
+can't fire, so plenty of dead rules will still go unnoticed.
+"""
+import collections
+import enum
+import functools
+import operator
+import re
+
+from apache_rewrite_tester.environment import CondBackreference, MapExpansion
+from apache_rewrite_tester.rewrite_objects.condition import ConditionFlag
+from apache_rewrite_tester.rewrite_objects.pattern import \
+    LexicographicalCondPattern, RegexCondPattern
+from apache_rewrite_tester.rewrite_objects.control_flow import \
+    STOPPING_FLAGS
+from apache_rewrite_tester.rewrite_objects.program import NO_SUBSTITUTION, \
+    pair_rules_with_conditions
+from apache_rewrite_tester.rewrite_objects.rule import RuleFlag
+
+__author__ = 'jwilner'
+
+
+class DeadRuleReason(enum.Enum):
+    ENGINE_OFF = "RewriteEngine is off"
+    NEVER_MATCHES = "pattern can never match"
+    UNSATISFIABLE_CONDITIONS = "conditions can never all hold"
+    SHADOWED = "shadowed by an earlier rule"
+    CHAINED_TO_DEAD_RULE = "chained to a rule which never fires"
+
+
+Finding = collections.namedtuple("Finding",
+                                 "handler index rule reason cause prunable")
+
+
+def find_dead_rules(handler):
+    """
+    A finding for each rule of the handler which can never fire. Dead rules
+    are prunable unless removing them would change what an [S=n] skips or
+    what a [C] chains to.
+
+    :type handler: RequestHandler
+    :rtype: list[Finding]
+    """
+    rules = list(pair_rules_with_conditions(handler.children))
+
+    if not handler.rewrite_engine.on:
+        return [Finding(handler, index, rule, DeadRuleReason.ENGINE_OFF, None,
+                        True)
+                for index, (rule, _) in enumerate(rules)]
+
+    dead = collections.OrderedDict(_find_dead_rules(rules))
+
+    has_skips = any(RuleFlag.SKIP in rule.flags for rule, _ in rules)
+
+    findings = []
+    for index, (reason, cause) in dead.items():
+        rule, _ = rules[index]
+        if has_skips:
+            prunable = False
+        elif index and RuleFlag.CHAIN in rules[index - 1][0].flags:
+            # only if what chains to it is going too
+            prunable = index - 1 in dead and findings[-1].prunable
+        else:
+            prunable = True
+
+        findings.append(Finding(handler, index, rule, reason, cause, prunable))
+
+    return findings
+
+
+def _find_dead_rules(rules):
+    """
+    :type rules: list[(RewriteRule, tuple[RewriteCondition])]
+    :rtype: __generator[(int, (DeadRuleReason, Directive))]
+    """
+    dead = set()
+
+    # unconditional, terminating rules which every later rule's path must
+    # have failed to match, so long as nothing's changed the path since.
+    shadowing_rules = []
+
+    # the last rule any [S=n] so far could jump to
+    skip_reach = -1
+
+    for index, (rule, conditions) in enumerate(rules):
+        chained = index > 0 and RuleFlag.CHAIN in rules[index - 1][0].flags
+
+        if chained and index - 1 in dead:
+            dead_because = DeadRuleReason.CHAINED_TO_DEAD_RULE, \
+                rules[index - 1][0]
+        elif _never_matches(rule.pattern):
+            dead_because = DeadRuleReason.NEVER_MATCHES, None
+        else:
+            shadowing_rule = next((earlier for earlier in shadowing_rules
+                                   if _shadows(earlier, rule)), None)
+            if shadowing_rule is not None:
+                dead_because = DeadRuleReason.SHADOWED, shadowing_rule
+            else:
+                condition = _find_unsatisfiable_condition(conditions)
+                dead_because = None if condition is None else \
+                    (DeadRuleReason.UNSATISFIABLE_CONDITIONS, condition)
+
+        if dead_because is not None:
+            dead.add(index)
+            yield index, dead_because
+            continue
+
+        if RuleFlag.SKIP in rule.flags:
+            skip_reach = max(skip_reach,
+                             index + rule.flags[RuleFlag.SKIP]["number"])
+
+        terminal = any(flag in rule.flags for flag in STOPPING_FLAGS)
+        if terminal:
+            if not conditions and not chained and index > skip_reach:
+                shadowing_rules.append(rule)
+        elif RuleFlag.NEXT not in rule.flags and \
+                rule.substitution.components != (NO_SUBSTITUTION,):
+            # later rules may see a path the earlier ones never did
+            shadowing_rules = []
+
+
+def _never_matches(pattern):
+    """
+    :type pattern: CondPattern
+    :rtype: bool
+    """
+    return isinstance(pattern, RegexCondPattern) and pattern.negated and \
+        pattern.matches_everything
+
+
+def _shadows(earlier, later):
+    """
+    Whether every path the later rule's pattern matches would also match the
+    earlier rule's.
+
+    :type earlier: RewriteRule
+    :type later: RewriteRule
+    :rtype: bool
+    """
+    if earlier.pattern == later.pattern:
+        if earlier.regex_flags == later.regex_flags:
+            return True
+
+        # ignoring case matches more, so its negation matches less
+        return (RuleFlag.NO_CASE in earlier.flags) is not \
+            earlier.pattern.negated
+
+    if earlier.pattern.negated or not earlier.pattern.accepts_any_suffix:
+        return False
+
+    prefix, _ = earlier.pattern.split_literal_prefix()
+    if not prefix:
+        return True
+
+    if later.pattern.negated:
+        return False
+
+    later_prefix, _ = later.pattern.split_literal_prefix()
+    if RuleFlag.NO_CASE in earlier.flags:
+        return later_prefix.lower().startswith(prefix.lower())
+
+    if RuleFlag.NO_CASE in later.flags and prefix.lower() != prefix.upper():
+        return False
+
+    return later_prefix.startswith(prefix)
+
+
+def _find_unsatisfiable_condition(conditions):
+    """
+    A condition which can't hold whenever those it's ANDed with do. Only
+    conditions up to the first [OR] group are considered, since after that
+    they aren't all necessarily evaluated.
+
+    :type conditions: tuple[RewriteCondition]
+    :rtype: RewriteCondition
+    """
+    groups = []
+    for condition in conditions:
+        if groups and ConditionFlag.OR_NEXT in groups[-1][-1].flags:
+            groups[-1].append(condition)
+        else:
+            groups.append([condition])
+
+    first_alternatives = next((index for index, group in enumerate(groups)
+                               if len(group) > 1), len(groups))
+    groups = groups[:first_alternatives + 1]
+
+    # values forced on test strings by conditions which must all hold
+    known_values = {}
+
+    # the regexes tested against each test string, and whether negated
+    tested = {}
+
+    for group in groups:
+        if len(group) > 1:
+            continue
+
+        condition, = group
+        key = _get_stable_key(condition.test_string)
+        if key is None:
+            continue
+
+        pattern = condition.cond_pattern
+        if isinstance(pattern, LexicographicalCondPattern) and \
+                pattern.operator is operator.eq and not pattern.negated:
+            known_values.setdefault(key, pattern.body)
+
+        if isinstance(pattern, RegexCondPattern):
+            regex_key = key, pattern.pattern, condition.regex_flags
+            if tested.setdefault(regex_key, pattern.negated) is not \
+                    pattern.negated:
+                return condition
+
+    for group in groups:
+        if all(_is_never_true(condition, known_values)
+               for condition in group):
+            return group[0]
+
+    return None
+
+
+def _get_stable_key(test_string):
+    """
+    Test strings which expand to the same value for every condition of a
+    rule are keyed by their components; %N backreferences change from one
+    condition to the next, and maps needn't give the same answer twice.
+
+    :type test_string: FormatString
+    :rtype: tuple
+    """
+    if any(isinstance(component, (CondBackreference, MapExpansion))
+           for component in test_string.components):
+        return None
+
+    return test_string.components
+
+
+def _is_never_true(condition, known_values):
+    """
+    :type condition: RewriteCondition
+    :type known_values: dict[tuple, str]
+    :rtype: bool
+    """
+    components = condition.test_string.components
+    if all(isinstance(component, str) for component in components):
+        value = "".join(components)
+    else:
+        key = _get_stable_key(condition.test_string)
+        value = None if key is None else known_values.get(key)
+
+    if value is None:
+        return _never_matches(condition.cond_pattern)
+
+    compiler = functools.partial(re.compile, flags=condition.regex_flags)
+    try:
+        return not condition.cond_pattern.match(value,
+                                                regex_compiler=compiler)
+    except (ValueError, re.error):  # e.g. comparing a word as an integer
+        return False
+
+
+class AnalysisReport(object):
+    """
+    The dead rules of a set of handlers, and how much of the whole they are.
+    """
+    def __init__(self, handlers):
+        """
+        :type handlers: Iterable[RequestHandler]
+        """
+        self.rule_count = 0
+
+        findings = []
+        for handler in handlers:
+            self.rule_count += sum(
+                1 for _ in pair_rules_with_conditions(handler.children))
+            findings.extend(find_dead_rules(handler))
+
+        self.findings = tuple(findings)
+
+    @property
+    def dead_rule_count(self):
+        """
+        :rtype: int
+        """
+        return len(self.findings)
+
+    @property
+    def prunable_rule_count(self):
+        """
+        :rtype: int
+        """
+        return sum(1 for finding in self.findings if finding.prunable)
+
+    def __str__(self):
+        lines = ["{}: {}{}".format(_describe(finding.rule, finding),
+                                   finding.reason.value,
+                                   "" if finding.cause is None
+                                   else " ({})".format(
+                                       _describe(finding.cause, finding)))
+                 for finding in self.findings]
+
+        dead_fraction = self.dead_rule_count / self.rule_count \
+            if self.rule_count else 0.
+        lines.append("{} of {} rules can never fire ({:.1%}); {} can be "
+                     "pruned".format(self.dead_rule_count, self.rule_count,
+                                     dead_fraction, self.prunable_rule_count))
+
+        return "\n".join(lines)
+
+
+def _describe(directive, finding):
+    """
+    Where the directive came from, when known.
+
+    :type directive: Directive
+    :type finding: Finding
+    :rtype: str
+    """
+    if directive.source is not None:
+        return "{0.filename}:{0.line_number}".format(directive.source)
+
+    if directive is finding.rule:
+        return "{!r} rule {}".format(finding.handler, finding.index)
+
+    return directive.__class__.__name__
@@ -33,19 +33,28 @@ class RewriteCondition(SingleLineDirective):
     @classmethod
     def chain(cls, rewrite_conditions, environment):
         """
+        Conditions joined by [OR] bind tighter than the implicit AND, so
+        `A [OR], B, C` means `(A or B) and C`.
+
         :type rewrite_conditions: Iterable[RewriteCondition]
         :rtype: bool
         """
         status = True
 
+        # whether the rest of an [OR] group is already satisfied
+        skipping = False
+
         for rewrite_condition in rewrite_conditions:
+            or_next = ConditionFlag.OR_NEXT in rewrite_condition.flags
+            if skipping:
+                skipping = or_next
+                continue
+
             status = rewrite_condition.evaluate(environment)
 
-            if ConditionFlag.OR_NEXT in rewrite_condition.flags:
-                if status:
-                    return True
-                else:
-                    continue
+            if or_next:
+                skipping = status
+                continue
 
             if not status:
                 return False
@@ -62,6 +71,13 @@ class RewriteCondition(SingleLineDirective):
         self.test_string = test_string
         self.cond_pattern = cond_pattern
 
+    @property
+    def regex_flags(self):
+        """
+        :rtype: int
+        """
+        return re.IGNORECASE if ConditionFlag.NO_CASE in self.flags else 0
+
     def evaluate(self, environment):
         """
         :type environment: MutableMapping
@@ -72,8 +88,7 @@ class RewriteCondition(SingleLineDirective):
             functools.partial(CondBackreference.update_environment,
                               environment=environment)
 
-        flags = re.IGNORECASE if ConditionFlag.NO_CASE in self.flags else 0
-        compiler = functools.partial(re.compile, flags=flags)
+        compiler = functools.partial(re.compile, flags=self.regex_flags)
 
         return self.cond_pattern.match(string, regex_compiler=compiler,
                                        match_callback=environment_updater)
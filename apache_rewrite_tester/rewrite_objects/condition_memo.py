@@ -0,0 +1,111 @@
+__author__ = 'jwilner'
+
+
+DEFAULT_MAX_ENTRIES = 1 << 16
+
+STATS_TEMPLATE = "{hits} of {lookups} condition regex matches answered " \
+                 "from the memo ({hit_rate:.1%}) over {requests} requests"
+
+
+class ConditionMemo(object):
+    """
+    The matches of condition regexes against the test strings they've been
+    tried on. The same condition is often repeated across many rules and
+    virtual hosts, e.g. a check of %{HTTP_HOST}; only the first attempt at
+    any given pattern and string needs running. Matches are kept whole, so
+    the condition's backreferences are set from them just the same.
+
+    By default the memo is cleared for every request. Kept across requests,
+    it's cleared whenever it fills up.
+    """
+    def __init__(self, across_requests=False,
+                 max_entries=DEFAULT_MAX_ENTRIES):
+        """
+        :type across_requests: bool
+        :type max_entries: int
+        """
+        self.across_requests = across_requests
+        self.max_entries = max_entries
+
+        self.requests = 0
+        self.hits = 0
+        self.misses = 0
+
+        # pattern -> the small int it's keyed on; equal patterns compare
+        # equal, but hashing one rehashes its whole compiled code
+        self._pattern_keys = {}
+
+        # (pattern key, test string) -> match, or None
+        self._matches = {}
+
+    def __getstate__(self):
+        """
+        Matches can't be pickled, so a pickled memo starts out empty.
+
+        :rtype: dict
+        """
+        return {"across_requests": self.across_requests,
+                "max_entries": self.max_entries}
+
+    def __setstate__(self, state):
+        """
+        :type state: dict
+        """
+        self.__init__(**state)
+
+    def __len__(self):
+        return len(self._matches)
+
+    def __str__(self):
+        return STATS_TEMPLATE.format(hits=self.hits,
+                                     lookups=self.hits + self.misses,
+                                     hit_rate=self.hit_rate,
+                                     requests=self.requests)
+
+    @property
+    def hit_rate(self):
+        """
+        :rtype: float
+        """
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.
+
+    def get_key(self, regex):
+        """
+        What a condition's regex is to be looked up by; conditions with the
+        same pattern and flags share one.
+
+        :type regex: __Regex
+        :rtype: int
+        """
+        return self._pattern_keys.setdefault(regex, len(self._pattern_keys))
+
+    def start_request(self):
+        self.requests += 1
+        if not self.across_requests and self._matches:
+            self._matches.clear()
+
+    def match(self, key, regex, string):
+        """
+        :param key: the regex's key, from get_key
+        :type key: int
+        :type regex: __Regex
+        :type string: str
+        :rtype: __Match
+        """
+        matches = self._matches
+        memo_key = key, string
+        try:
+            match = matches[memo_key]
+        except KeyError:
+            pass
+        else:
+            self.hits += 1
+            return match
+
+        self.misses += 1
+        match = regex.match(string)
+        if len(matches) >= self.max_entries:
+            matches.clear()
+        matches[memo_key] = match
+        return match
@@ -0,0 +1,175 @@
+from apache_rewrite_tester.environment import CondBackreference, MapExpansion
+from apache_rewrite_tester.rewrite_objects.condition import ConditionFlag
+
+__author__ = 'jwilner'
+
+
+class ConditionCounters(object):
+    """
+    How much work evaluating condition trees took, and how much they saved
+    over evaluating every condition and formatting every test string.
+    """
+    __slots__ = "chains", "conditions_evaluated", "conditions_skipped", \
+        "test_strings_formatted", "test_strings_reused", "early_failures"
+
+    def __init__(self):
+        for name in self.__slots__:
+            setattr(self, name, 0)
+
+    def __iadd__(self, other):
+        """
+        :type other: ConditionCounters
+        :rtype: ConditionCounters
+        """
+        for name in self.__slots__:
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+        return self
+
+    def __str__(self):
+        return "{} chains: {} conditions evaluated, {} skipped; {} test " \
+               "strings formatted, {} reused; {} failed on a cheap check " \
+               "first".format(self.chains, self.conditions_evaluated,
+                              self.conditions_skipped,
+                              self.test_strings_formatted,
+                              self.test_strings_reused, self.early_failures)
+
+
+def _is_stable(test_string):
+    """
+    Whether the test string comes out the same wherever it's evaluated in
+    a chain: %N backreferences change with every matching condition, and
+    maps needn't give the same answer twice.
+
+    :type test_string: FormatString
+    :rtype: bool
+    """
+    return not any(isinstance(component, (CondBackreference, MapExpansion))
+                   for component in test_string.components)
+
+
+def _is_cheap(condition):
+    """
+    Cheap checks are comparisons rather than regexes, so set no
+    backreferences, and don't depend on any either; nor do they look
+    anything up in a map.
+
+    :type condition: CompiledCondition
+    :rtype: bool
+    """
+    return condition.regex is None and not any(
+        isinstance(component, (CondBackreference, MapExpansion))
+        for component in condition.directive.test_string.components)
+
+
+class ConditionTree(object):
+    """
+    A rule's conditions compiled into an AND of [OR] groups, as Apache
+    reads them.
+
+    Groups made up only of cheap checks go first, so a failing comparison
+    saves running the regexes before it. That's safe since cheap checks
+    don't touch backreferences, and the regexes still run in their own
+    order whenever the rule goes on to fire. Test strings which can't
+    change within the chain, like %{HTTP_HOST}, are formatted once.
+    """
+    __slots__ = "groups", "hoisted", "slot_count", "condition_count", \
+        "counters"
+
+    def __init__(self, conditions):
+        """
+        :type conditions: tuple[CompiledCondition]
+        """
+        slots = {}
+        groups = []
+        for index, condition in enumerate(conditions):
+            test_string = condition.directive.test_string
+            slot = slots.setdefault(test_string.components, len(slots)) \
+                if _is_stable(test_string) else None
+
+            if index and ConditionFlag.OR_NEXT in conditions[index - 1].flags:
+                groups[-1].append((condition, slot))
+            else:
+                groups.append([(condition, slot)])
+
+        self.groups = tuple(map(tuple, groups))
+        self.slot_count = len(slots)
+        self.condition_count = len(conditions)
+
+        # cheap groups worth moving ahead of regexes
+        self.hoisted = tuple(
+            index for index, group in enumerate(self.groups)
+            if all(_is_cheap(condition) for condition, _ in group) and
+            not all(_is_cheap(condition) for earlier in self.groups[:index]
+                    for condition, _ in earlier))
+
+        self.counters = ConditionCounters()
+
+    def evaluate(self, environment):
+        """
+        :type environment: MutableMapping
+        :rtype: bool
+        """
+        counters = self.counters
+        counters.chains += 1
+        evaluated = counters.conditions_evaluated
+
+        values = [None] * self.slot_count
+        passed = ()
+
+        result = True
+        if self.hoisted:
+            passed = set()
+            for index in self.hoisted:
+                try:
+                    group_passed = self._evaluate_group(self.groups[index],
+                                                        environment, values)
+                except ValueError:
+                    # e.g. an integer comparison of a word; if it's going
+                    # to raise, let it do so in its proper place
+                    continue
+
+                if not group_passed:
+                    counters.early_failures += 1
+                    result = False
+                    break
+
+                passed.add(index)
+
+        if result:
+            for index, group in enumerate(self.groups):
+                if index not in passed and \
+                        not self._evaluate_group(group, environment, values):
+                    result = False
+                    break
+
+        counters.conditions_skipped += max(
+            0, self.condition_count - (counters.conditions_evaluated -
+                                       evaluated))
+        return result
+
+    def _evaluate_group(self, group, environment, values):
+        """
+        :type group: tuple[(CompiledCondition, int)]
+        :type environment: MutableMapping
+        :type values: list[str]
+        :rtype: bool
+        """
+        counters = self.counters
+        for condition, slot in group:
+            if slot is None:
+                string = condition.format_test_string(environment)
+                counters.test_strings_formatted += 1
+            else:
+                string = values[slot]
+                if string is None:
+                    string = values[slot] = \
+                        condition.format_test_string(environment)
+                    counters.test_strings_formatted += 1
+                else:
+                    counters.test_strings_reused += 1
+
+            counters.conditions_evaluated += 1
+            if condition.test(string, environment):
+                return True
+
+        return False
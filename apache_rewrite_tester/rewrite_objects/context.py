@@ -1,10 +1,23 @@
+import re
+
 import requests
 
+from apache_rewrite_tester.environment import MapExpansion, ServerVariable
+from apache_rewrite_tester.rewrite_maps import RewriteMaps
+from apache_rewrite_tester.rewrite_objects.analysis import find_dead_rules
 from apache_rewrite_tester.rewrite_objects.object import RewriteObject, \
     Directive
+from apache_rewrite_tester.rewrite_objects.program import RuleProgram, \
+    pair_rules_with_conditions
+from apache_rewrite_tester.rewrite_objects.simple_directives import \
+    RewriteMap
 
 __author__ = 'jwilner'
 
+# skipping a whole word at a time, rather than a character, keeps us from
+# retrying every directive type at every letter of unrecognized text.
+UNRECOGNIZED_REGEX = re.compile(r"(?:\w+|.)\s*", re.DOTALL)
+
 
 class ContextDirective(RewriteObject, Directive):
     START_REGEX = None
@@ -13,59 +26,147 @@ class ContextDirective(RewriteObject, Directive):
     INNER_DIRECTIVE_TYPES = ()
 
     @classmethod
-    def consume(cls, string):
+    def consume_from(cls, string, position=0):
         """
         :type string: str
-        :rtype: (ContextDirective, str)
+        :type position: int
+        :rtype: (ContextDirective, int)
+        """
+        (start_match, end_match), children, position = \
+            cls._consume(string, position, cls._get_inner_directive_types())
+        if start_match is None:
+            return None, position
+
+        kwargs = cls._parse(start_match)
+        kwargs.update(cls._parse(end_match))
+
+        return cls(children=children, **kwargs), position
+
+    @classmethod
+    def consume_lines(cls, lines):
+        """
+        Parse a context from a stream of logical lines, the first meaningful
+        one of which should open it. Lines are only pulled as far as the end
+        of the context.
+
+        :type lines: Iterable[SourceLine]
+        :rtype: ContextDirective
+        """
+        lines = iter(lines)
+        for line in lines:
+            if not cls.is_ignorable_line(line.text.strip()):
+                return cls.consume_line(line, lines)
+
+        return None
+
+    @classmethod
+    def consume_line(cls, line, lines):
+        """
+        :type line: SourceLine
+        :type lines: Iterator[SourceLine]
+        :rtype: ContextDirective
         """
-        (start_match, end_match), children, string = \
-            cls._consume(string, cls._get_inner_directive_types())
+        start_match = cls.START_REGEX.match(line.text.strip())
         if start_match is None:
-            return None, string
+            return None
+
+        return cls._consume_lines(start_match, line, lines)
+
+    @classmethod
+    def _consume_lines(cls, start_match, source, lines):
+        """
+        One directive per logical line, as with Apache; comments and
+        unrecognized directives are skipped whole.
+
+        :type start_match: __Match
+        :type source: SourceLine
+        :type lines: Iterator[SourceLine]
+        :rtype: ContextDirective
+        """
+        directives, end_match = cls.consume_children(lines)
+        if end_match is None:
+            # only contexts which may end with the input can end here
+            end_match = cls.END_REGEX.match("")
+            if end_match is None:
+                raise ValueError("Unterminated context directive")
 
         kwargs = cls._parse(start_match)
         kwargs.update(cls._parse(end_match))
 
-        return cls(children=children, **kwargs), string
+        context = cls(children=directives, **kwargs)
+        context._source = source
+        return context
+
+    @classmethod
+    def consume_children(cls, lines):
+        """
+        Parse the directives of this context from lines, up to its end line
+        or the end of the lines.
+
+        :type lines: Iterator[SourceLine]
+        :rtype: (tuple[Directive], __Match)
+        :returns: the directives, and the end line's match, if one was found
+        """
+        inner_directive_types = cls._get_inner_directive_types()
+
+        directives = []
+        for line in lines:
+            text = line.text.strip()
+            if cls.is_ignorable_line(text):
+                continue
+
+            end_match = cls.END_REGEX.match(text)
+            if end_match is not None:
+                return tuple(directives), end_match
+
+            for inner_directive_type in inner_directive_types:
+                directive = inner_directive_type.consume_line(line, lines)
+                if directive is not None:
+                    directives.append(directive)
+                    break
+
+        return tuple(directives), None
 
     @classmethod
     def _get_inner_directive_types(cls):
         return cls.INNER_DIRECTIVE_TYPES
 
     @classmethod
-    def _consume(cls, string, inner_directive_types):
+    def _consume(cls, string, position, inner_directive_types):
         """
         Get delimiting matches and the internal directives from a string
 
         :type string: str
-        :rtype: ((__Match, __Match), tuple[Directive], str)
+        :type position: int
+        :rtype: ((__Match, __Match), tuple[Directive], int)
         """
-        start_match = cls.START_REGEX.match(string)
+        start_match = cls.START_REGEX.match(string, position)
         if start_match is None:
-            return (None, None), None, string
+            return (None, None), None, position
 
-        string = cls._get_remainder(string, start_match.end())
+        position = cls._skip_whitespace(string, start_match.end())
+        length = len(string)
 
         directives = []
-        end_match = cls.END_REGEX.match(string)
+        end_match = cls.END_REGEX.match(string, position)
         while end_match is None:
-            if not string:
+            if position >= length:
                 raise ValueError("Unterminated context directive")
 
             for inner_directive_type in inner_directive_types:
-                directive, string = inner_directive_type.consume(string)
+                directive, position = \
+                    inner_directive_type.consume_from(string, position)
                 if directive is not None:
                     directives.append(directive)
                     break
             else:
                 # always advance, and starting whitespace will never be
                 # significant so lop it off if present
-                string = string[1:].lstrip()
+                position = UNRECOGNIZED_REGEX.match(string, position).end()
 
-            end_match = cls.END_REGEX.match(string)
+            end_match = cls.END_REGEX.match(string, position)
 
-        return (start_match, end_match), tuple(directives), \
-            string[end_match.end():]
+        return (start_match, end_match), tuple(directives), end_match.end()
 
     def __init__(self, children):
         """
@@ -73,6 +174,24 @@ class ContextDirective(RewriteObject, Directive):
         """
         self.children = children
 
+    def with_children(self, children):
+        """
+        A copy of this context, from the same source, with other children.
+
+        :type children: tuple[Directive]
+        :rtype: ContextDirective
+        """
+        context = self._copy_with_children(children)
+        context._source = self.source
+        return context
+
+    def _copy_with_children(self, children):
+        """
+        :type children: tuple[Directive]
+        :rtype: ContextDirective
+        """
+        return type(self)(children=children)
+
 
 class RecursiveContextDirective(ContextDirective):
     @classmethod
@@ -81,6 +200,146 @@ class RecursiveContextDirective(ContextDirective):
 
 
 class RequestHandler(object):
+    """
+    Expects to be mixed into a ContextDirective with a `rewrite_engine`.
+    """
+    # whether to leave rules which can never fire out of the program; unlike
+    # the program itself, this survives pickling.
+    _prune_dead_rules = False
+
+    # where the program counts and times its directives, if anywhere; a
+    # profile can't be shared with other processes, so isn't pickled.
+    _profile = None
+
+    # where conditions remember their regexes' matches, if anywhere
+    _condition_memo = None
+
+    def __getstate__(self):
+        """
+        Programs are recompiled after unpickling, e.g. in worker processes.
+
+        :rtype: dict
+        """
+        state = self.__dict__.copy()
+        state.pop("_program", None)
+        state.pop("_profile", None)
+        state.pop("_maps", None)
+        return state
+
+    @property
+    def program(self):
+        """
+        Compiled lazily, once, from the context's own directives.
+
+        :rtype: RuleProgram
+        """
+        try:
+            return self._program
+        except AttributeError:
+            self._program = RuleProgram.compile(self.children,
+                                                self._get_excluded_rules(),
+                                                self._profile,
+                                                self._condition_memo,
+                                                self.maps)
+            return self._program
+
+    @property
+    def maps(self):
+        """
+        The maps the context's RewriteMap directives define, opened as
+        they're first used; like the program, they're reopened after
+        unpickling.
+
+        :rtype: RewriteMaps
+        """
+        try:
+            return self._maps
+        except AttributeError:
+            self._maps = RewriteMaps(directive for directive in self.children
+                                     if isinstance(directive, RewriteMap))
+            return self._maps
+
+    def get_observed_variables(self):
+        """
+        Every server variable the context's rules and conditions can read, in
+        a fixed order; with the path, these are all a rewrite depends on.
+
+        :rtype: tuple[ServerVariable]
+        :returns: None if any of them looks up a map, whose answers needn't
+            depend on the request alone
+        """
+        try:
+            return self._observed_variables
+        except AttributeError:
+            pass
+
+        variables = set()
+        for rule, conditions in pair_rules_with_conditions(self.children):
+            format_strings = [rule.substitution]
+            format_strings.extend(condition.test_string
+                                  for condition in conditions)
+            for format_string in format_strings:
+                for component in format_string.components:
+                    if isinstance(component, MapExpansion):
+                        self._observed_variables = None
+                        return None
+                    if isinstance(component, ServerVariable):
+                        variables.add(component)
+
+        self._observed_variables = tuple(
+            sorted(variables, key=lambda variable: variable.id))
+        return self._observed_variables
+
+    def prune_dead_rules(self):
+        """
+        Recompile the program without the rules analysis shows can never
+        fire.
+        """
+        self._prune_dead_rules = True
+        self.__dict__.pop("_program", None)
+
+    def profile(self, profile):
+        """
+        Recompile the program to count and time its directives.
+
+        :type profile: Profile
+        """
+        self._profile = profile
+        self.__dict__.pop("_program", None)
+
+    def memoize_conditions(self, condition_memo):
+        """
+        Recompile the program for its conditions to look up their regexes'
+        matches in the memo before running them.
+
+        :type condition_memo: ConditionMemo
+        """
+        self._condition_memo = condition_memo
+        self.__dict__.pop("_program", None)
+
+    def _get_excluded_rules(self):
+        """
+        :rtype: list[RewriteRule]
+        """
+        if not self._prune_dead_rules:
+            return []
+
+        return [finding.rule for finding in find_dead_rules(self)
+                if finding.prunable]
+
+    def rewrite(self, path, environment):
+        """
+        :type path: str
+        :type environment: MutableMapping
+        :rtype: str
+        """
+        if not self.rewrite_engine.on:
+            return path
+
+        if self._condition_memo is not None:
+            self._condition_memo.start_request()
+
+        return self.program.apply(path, environment)
 
     def handle_request(self, request, environment):
         """
@@ -0,0 +1,108 @@
+"""
+The flags which decide which rule runs next, worked out once per program
+rather than looked up on every rule of every request.
+
+Like mod_rewrite's own loop, after a rule fires:
+
+- [END], [L], [P], [F] and [G] stop the ruleset;
+- [N] starts it over on the new path, at most [N=max] rounds (32000 by
+  default);
+- [S=n] jumps over the next n rules;
+
+and after a rule fails to fire, a [C] jumps over every rule chained to it.
+"""
+from apache_rewrite_tester.rewrite_objects.rule import RuleFlag
+
+__author__ = 'jwilner'
+
+
+STOPPING_FLAGS = RuleFlag.END, RuleFlag.LAST, RuleFlag.PROXY, \
+    RuleFlag.FORBIDDEN, RuleFlag.GONE
+
+DEFAULT_MAXIMUM_ROUNDS = 32000
+
+# fire targets which aren't rule indices
+STOP = -1
+RESTART = -2
+
+
+class RewriteLoopError(RuntimeError):
+    """
+    A rule's [N] went round more times than it allows; Apache gives up on
+    the request with a 500.
+    """
+    STATUS = 500
+
+    def __init__(self, rule, path, maximum):
+        """
+        :type rule: RewriteRule
+        :type path: str
+        :type maximum: int
+        """
+        super(RewriteLoopError, self).__init__(
+            "RewriteRule {!r} and URI {!r} exceeded maximum number of rounds "
+            "({}) via the [N] flag".format(rule.pattern.pattern, path,
+                                           maximum))
+        self.rule = rule
+        self.path = path
+        self.maximum = maximum
+
+
+class ControlFlow(object):
+    """
+    Three arrays indexed by rule: where to go once it fires, where to go
+    when it doesn't, and for [N] rules, how many rounds are allowed. A
+    target of len(rules) is the end of the ruleset.
+    """
+    __slots__ = "fire_targets", "fail_targets", "round_limits"
+
+    @classmethod
+    def compile(cls, rules):
+        """
+        :type rules: Sequence[RewriteRule]
+        :rtype: ControlFlow
+        """
+        end = len(rules)
+        fire_targets = []
+        fail_targets = []
+        round_limits = []
+
+        for index, rule in enumerate(rules):
+            flags = rule.flags
+
+            # the precedence mod_rewrite gives them
+            round_limit = None
+            if any(flag in flags for flag in STOPPING_FLAGS):
+                fire_target = STOP
+            elif RuleFlag.NEXT in flags:
+                fire_target = RESTART
+                round_limit = flags[RuleFlag.NEXT].get("maximum") or \
+                    DEFAULT_MAXIMUM_ROUNDS
+            elif RuleFlag.SKIP in flags:
+                fire_target = min(end,
+                                  index + 1 + flags[RuleFlag.SKIP]["number"])
+            else:
+                fire_target = index + 1
+
+            # past the last rule of the chain, the first without a [C]
+            fail_target = index
+            while fail_target < end and \
+                    RuleFlag.CHAIN in rules[fail_target].flags:
+                fail_target += 1
+
+            fire_targets.append(fire_target)
+            fail_targets.append(min(end, fail_target + 1))
+            round_limits.append(round_limit)
+
+        return cls(fire_targets, fail_targets, round_limits)
+
+    def __init__(self, fire_targets, fail_targets, round_limits):
+        """
+        :type fire_targets: Iterable[int]
+        :type fail_targets: Iterable[int]
+        :type round_limits: Iterable[int]
+        """
+        self.fire_targets = tuple(fire_targets)
+        self.fail_targets = tuple(fail_targets)
+        self.round_limits = tuple(round_limits)
+
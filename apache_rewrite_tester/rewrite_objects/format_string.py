@@ -1,17 +1,28 @@
 import re
 
-from apache_rewrite_tester.environment import CondBackreference, \
-    RuleBackreference, MapExpansion, ServerVariable
+from apache_rewrite_tester.environment import Backreference, \
+    CondBackreference, RuleBackreference, MapExpansion, ServerVariable
 from apache_rewrite_tester.utils import EqualityMixin
 
 __author__ = 'jwilner'
 
 
 class FormatString(EqualityMixin):
-    COMPONENTS = (re.compile(r"^\$(\d)"), RuleBackreference.from_string),\
-        (re.compile(r"^%(\d)"), CondBackreference.from_string),\
-        (re.compile(r"^\$\{(.+?)\}"), MapExpansion.from_string),\
-        (re.compile(r"^%\{(.+?)\}"), ServerVariable.__getitem__)
+    TOKEN_REGEX = re.compile(r"""
+                             \$(?P<rule_backreference>\d)|
+                             %(?P<cond_backreference>\d)|
+                             # a map's key and default may hold variables
+                             \$\{(?P<map_expansion>(?:%\{[^}]*\}|[^}])+)\}|
+                             %\{(?P<server_variable>.+?)\}|
+                             # anything else is literal, including a lone
+                             # dollar or percent sign
+                             (?P<literal>[^$%]+|[$%])
+                             """, re.VERBOSE)
+
+    PARSERS = {"rule_backreference": RuleBackreference.from_string,
+               "cond_backreference": CondBackreference.from_string,
+               "map_expansion": MapExpansion.from_string,
+               "server_variable": ServerVariable.__getitem__}
 
     @classmethod
     def parse(cls, string):
@@ -24,22 +35,27 @@ class FormatString(EqualityMixin):
     @classmethod
     def _parse(cls, string):
         """
+        A single pass over the string; consecutive literal text comes out as
+        one string component.
+
         :type string: str
         :rtype: __generator[Hashable]
         """
-        while string:
-            for regex, parser in cls.COMPONENTS:
-                match = regex.match(string)
-                if match is not None:
-                    string = string[match.end():]
-                    component = parser(match.group(1))
-                    break
-            else:
-                # woo, python 3
-                component, *characters = string
-                string = "".join(characters)  # unpacking makes a list, so undo
+        literals = []
+        for match in cls.TOKEN_REGEX.finditer(string):
+            kind = match.lastgroup
+            if kind == "literal":
+                literals.append(match.group(kind))
+                continue
+
+            if literals:
+                yield "".join(literals)
+                literals = []
+
+            yield cls.PARSERS[kind](match.group(kind))
 
-            yield component
+        if literals:
+            yield "".join(literals)
 
     def __init__(self, components):
         """
@@ -47,18 +63,140 @@ class FormatString(EqualityMixin):
         """
         self.components = tuple(components)
 
+    def __getstate__(self):
+        """
+        Generated functions can't be pickled; they're regenerated on demand.
+
+        :rtype: dict
+        """
+        state = self.__dict__.copy()
+        state.pop("_compiled", None)
+        return state
+
+    @property
+    def has_map_expansions(self):
+        """
+        :rtype: bool
+        """
+        return any(isinstance(component, MapExpansion)
+                   for component in self.components)
+
     def format(self, environment):
         """
+        Maps can't be expanded without knowing which are defined; see
+        `compile`. As in Apache, a backreference to nothing is empty.
+
         :type environment: MutableMapping
         :rtype: str
         """
         parts = []
         for component in self.components:
-            if isinstance(str, component):
+            if isinstance(component, str):
                 part = component  # it's a literal
             else:
-                part = environment[component]
+                try:
+                    part = environment[component]
+                except KeyError:
+                    if not isinstance(component, Backreference):
+                        raise
+                    part = ""
 
             parts.append(part)
 
         return "".join(parts)
+
+    def compile(self, maps=None):
+        """
+        A function specialized to this format string, equivalent to `format`
+        but without the per-component branching; generated once, then cached.
+
+        :param maps: where to look up map expansions; the function is then
+            generated afresh, for those maps
+        :type maps: RewriteMaps
+        :rtype: (MutableMapping) -> str
+        """
+        if maps is not None and self.has_map_expansions:
+            return self._generate_function(maps)
+
+        try:
+            return self._compiled
+        except AttributeError:
+            self._compiled = self._generate_function()
+            return self._compiled
+
+    def _generate_function(self, maps=None):
+        """
+        :type maps: RewriteMaps
+        :rtype: (MutableMapping) -> str
+        """
+        # backreferences are looked up directly, and only if one's missing
+        # is the whole string formatted again with it left empty
+        namespace, parts, fallback_parts = {}, [], []
+        for index, component in enumerate(self.components):
+            name = "c{}".format(index)
+            if isinstance(component, str):
+                namespace[name] = component
+                part = fallback_part = name
+            elif maps is not None and isinstance(component, MapExpansion):
+                namespace[name] = _compile_map_expansion(component, maps)
+                part = fallback_part = "{}(environment)".format(name)
+            else:
+                namespace[name] = component
+                part = fallback_part = "environment[{}]".format(name)
+                if isinstance(component, Backreference):
+                    fallback_part = 'environment.get({}, "")'.format(name)
+
+            parts.append(part)
+            fallback_parts.append(fallback_part)
+
+        expression = self._join(parts)
+        if parts == fallback_parts:
+            source = "def format(environment):\n" \
+                     "    return {}\n".format(expression)
+        else:
+            source = "def format(environment):\n" \
+                     "    try:\n" \
+                     "        return {}\n" \
+                     "    except KeyError:\n" \
+                     "        return {}\n".format(expression,
+                                                self._join(fallback_parts))
+        exec(source, namespace)
+        return namespace["format"]
+
+    def _join(self, parts):
+        """
+        :type parts: list[str]
+        :rtype: str
+        """
+        if not parts:
+            return '""'
+        if len(parts) == 1 and isinstance(self.components[0], str):
+            return parts[0]
+        return '"".join(({},))'.format(", ".join(parts))
+
+
+def _compile_map_expansion(map_expansion, maps):
+    """
+    Like mod_rewrite, a key which isn't found, or a map which isn't defined,
+    gives the default, or else nothing. The map itself isn't opened until
+    it's first looked up in.
+
+    :type map_expansion: MapExpansion
+    :type maps: RewriteMaps
+    :rtype: (MutableMapping) -> str
+    """
+    format_key = FormatString.parse(map_expansion.lookup_key).compile(maps)
+    format_default = FormatString.parse(map_expansion.default or "") \
+        .compile(maps)
+
+    map_name = map_expansion.map_name
+    if map_name not in maps:
+        return format_default
+
+    get_map = maps.get
+
+    def expand(environment):
+        value = get_map(map_name).lookup(format_key(environment))
+        return format_default(environment) if value is None else value
+
+    return expand
@@ -0,0 +1,164 @@
+import collections
+
+from apache_rewrite_tester.rewrite_objects.ip_and_port import \
+    IpWildcardPattern, PortWildcardPattern
+from apache_rewrite_tester.utils import KeyedEqualityMixin, MatchType
+
+__author__ = 'jwilner'
+
+
+def _get_key(value):
+    """
+    Patterns compare by their keys, but can't be hashed themselves.
+
+    :type value: object
+    :rtype: object
+    """
+    return value.equality_key if isinstance(value, KeyedEqualityMixin) \
+        else value
+
+
+def _compatible(host_value, requested_value, wildcard):
+    """
+    :type host_value: object
+    :type requested_value: object
+    :type wildcard: object
+    :rtype: bool
+    """
+    return host_value == requested_value or wildcard in (host_value,
+                                                          requested_value)
+
+
+class _Bucket(object):
+    """
+    The virtual hosts listening on one exact (ip, port).
+    """
+    def __init__(self, ip, port):
+        self.ip = ip
+        self.port = port
+
+        # (position, virtual host) pairs; only the first of each kind can
+        # ever win a tie, so that's all we keep.
+        self.first = None
+        self.first_unnamed = None
+        self.first_by_name = {}
+
+    def add(self, position, virtual_host):
+        """
+        :type position: int
+        :type virtual_host: VirtualHost
+        """
+        entry = position, virtual_host
+        if self.first is None:
+            self.first = entry
+
+        if virtual_host.server_name is None:
+            if self.first_unnamed is None:
+                self.first_unnamed = entry
+        else:
+            self.first_by_name.setdefault(
+                virtual_host.server_name.server_name, entry)
+
+    def get_candidates(self, requested_hostname, default_name_match):
+        """
+        :type requested_hostname: str
+        :type default_name_match: MatchType
+        :rtype: __generator[(MatchType, int, VirtualHost)]
+        """
+        named = self.first_by_name.get(requested_hostname)
+        if named is not None:
+            yield (MatchType.STRICT,) + named
+
+        if self.first_unnamed is not None:
+            yield (default_name_match,) + self.first_unnamed
+
+        position, virtual_host = self.first
+        if virtual_host.server_name is None:
+            yield default_name_match, position, virtual_host
+        elif virtual_host.server_name.server_name == requested_hostname:
+            yield MatchType.STRICT, position, virtual_host
+        else:
+            yield MatchType.NONE, position, virtual_host
+
+
+class VirtualHostIndex(object):
+    """
+    Buckets virtual hosts by the exact (ip, port) they were declared with,
+    and within those by ServerName, so that finding the host for a request
+    needs at most four bucket lookups rather than ranking every host.
+    """
+    def __init__(self, virtual_hosts):
+        """
+        :type virtual_hosts: Iterable[VirtualHost]
+        """
+        self._buckets = collections.OrderedDict()
+        for position, virtual_host in enumerate(virtual_hosts):
+            key = _get_key(virtual_host.ip), _get_key(virtual_host.port)
+            try:
+                bucket = self._buckets[key]
+            except KeyError:
+                bucket = self._buckets[key] = _Bucket(*key)
+            bucket.add(position, virtual_host)
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def find(self, ip, port, requested_hostname, default_name_match):
+        """
+        Same ranking as MainContext used to do by sorting: an exact ip and
+        port beats any wildcard, then a matching name, then whichever host
+        was declared first.
+
+        :type ip: IpWildcardPattern
+        :type port: PortWildcardPattern
+        :type requested_hostname: str
+        :type default_name_match: MatchType
+        :rtype: VirtualHost
+        """
+        ip, port = _get_key(ip), _get_key(port)
+
+        exact = self._buckets.get((ip, port))
+        if exact is not None:
+            return self._best(exact, requested_hostname=requested_hostname,
+                              default_name_match=default_name_match)
+
+        return self._best(*self._get_wildcard_buckets(ip, port),
+                          requested_hostname=requested_hostname,
+                          default_name_match=default_name_match)
+
+    def _get_wildcard_buckets(self, ip, port):
+        """
+        :type ip: str
+        :type port: int
+        :rtype: list[_Bucket]
+        """
+        ip_wildcard = IpWildcardPattern.WILDCARD
+        port_wildcard = PortWildcardPattern.WILDCARD
+
+        if ip != ip_wildcard and port != port_wildcard:
+            keys = (ip, port_wildcard), (ip_wildcard, port), \
+                (ip_wildcard, port_wildcard)
+            return [self._buckets[key] for key in keys if key in self._buckets]
+
+        # a wildcard request could match nearly anything
+        return [bucket for bucket in self._buckets.values()
+                if _compatible(bucket.ip, ip, ip_wildcard) and
+                _compatible(bucket.port, port, port_wildcard)]
+
+    @staticmethod
+    def _best(*buckets, requested_hostname, default_name_match):
+        """
+        :type buckets: tuple[_Bucket]
+        :type requested_hostname: str
+        :type default_name_match: MatchType
+        :rtype: VirtualHost
+        """
+        best = None
+        for bucket in buckets:
+            for name_match, position, virtual_host in \
+                    bucket.get_candidates(requested_hostname,
+                                          default_name_match):
+                if best is None or (name_match, -position) > best[:2]:
+                    best = name_match, -position, virtual_host
+
+        return None if best is None else best[2]
@@ -1,12 +1,20 @@
 import re
 
+from apache_rewrite_tester import batch
+from apache_rewrite_tester.environment import ServerVariable
 from apache_rewrite_tester.rewrite_objects import VirtualHost, \
     RewriteCondition, RewriteRule
+from apache_rewrite_tester.rewrite_objects.analysis import AnalysisReport
 from apache_rewrite_tester.rewrite_objects.context import ContextDirective, \
     RequestHandler
+from apache_rewrite_tester.rewrite_objects.host_index import \
+    VirtualHostIndex
+from apache_rewrite_tester.rewrite_objects.ip_and_port import \
+    IpWildcardPattern, PortWildcardPattern
 from apache_rewrite_tester.rewrite_objects.simple_directives import \
-    RewriteEngine, ServerName
-from apache_rewrite_tester.utils import MatchType, compare
+    RewriteEngine, RewriteMap, ServerName
+from apache_rewrite_tester.utils import compare, \
+    read_directive_lines
 
 
 __author__ = 'jwilner'
@@ -14,12 +22,39 @@ __author__ = 'jwilner'
 
 class MainContext(ContextDirective, RequestHandler):
     INNER_DIRECTIVE_TYPES = VirtualHost, RewriteCondition, RewriteRule, \
-        RewriteEngine, ServerName
+        RewriteEngine, RewriteMap, ServerName
 
     # we want this to consume the whole string
     START_REGEX = re.compile(r'^')
     END_REGEX = re.compile(r'$')
 
+    # where rewrites are remembered, if anywhere; see cache_outcomes
+    _outcome_cache = None
+
+    @classmethod
+    def consume_lines(cls, lines):
+        """
+        The main context has no opening line; it's everything.
+
+        :type lines: Iterable[SourceLine]
+        :rtype: MainContext
+        """
+        return cls._consume_lines(cls.START_REGEX.match(""), None, iter(lines))
+
+    @classmethod
+    def from_file(cls, filename, server_root=None, include_graph=None):
+        """
+        Stream a config file, and everything it includes, into a MainContext.
+
+        :type filename: str
+        :type server_root: str
+        :param include_graph: where to record the files read
+        :type include_graph: IncludeGraph
+        :rtype: MainContext
+        """
+        return cls.consume_lines(read_directive_lines(filename, server_root,
+                                                      include_graph))
+
     def __init__(self, children):
         """
         :type children: tuple[Directive]
@@ -34,6 +69,13 @@ class MainContext(ContextDirective, RequestHandler):
         if self.server_name is None:
             raise ValueError("Backwards ip lookup or whatever not supported.")
 
+        self.rewrite_engine = next((directive for directive
+                                    in reversed(children)
+                                    if isinstance(directive, RewriteEngine)),
+                                   RewriteEngine.get_default())
+
+        self._host_index = VirtualHostIndex(self.virtual_hosts)
+
         # self.name_virtual_hosts = {directive for directive in children
         #                            if isinstance(directive, NameVirtualHost)}
 
@@ -46,32 +88,62 @@ class MainContext(ContextDirective, RequestHandler):
         """
         default_name_match = compare(requested_hostname, self.server_name)
 
-        virtual_hosts = tuple(directive for directive in self.children
-                              if isinstance(directive, VirtualHost))
-
-        if not virtual_hosts:
-            return self
-
-        matches = (v_host.match_request(ip, port, requested_hostname)
-                   for v_host in virtual_hosts)
+        host = self._host_index.find(ip, port, requested_hostname,
+                                     default_name_match)
 
-        ip_port_matches, name_matches = zip(*matches)
+        return self if host is None else host
 
-        safe_name_matches = [(name_match if name_match is not None
-                              else default_name_match)
-                             for name_match in name_matches]
-
-        rankings = zip(ip_port_matches, safe_name_matches)
+    def compile(self, prune=False, profile=None, condition_memo=None):
+        """
+        Eagerly compile the rule programs of this context and all of its
+        virtual hosts, and find the variables each can observe, rather than
+        on their first request.
+
+        :param prune: whether to leave out rules which can never fire
+        :type prune: bool
+        :param profile: where to count and time every directive, if anywhere
+        :type profile: Profile
+        :param condition_memo: where conditions remember their regexes'
+            matches, if anywhere; shared by every handler
+        :type condition_memo: ConditionMemo
+        :rtype: MainContext
+        """
+        for handler in self.handlers:
+            if prune and not handler._prune_dead_rules:
+                handler.prune_dead_rules()
+            if profile is not None and handler._profile is not profile:
+                handler.profile(profile)
+            if condition_memo is not None and \
+                    handler._condition_memo is not condition_memo:
+                handler.memoize_conditions(condition_memo)
+            handler.program
+            handler.get_observed_variables()
+
+        return self
+
+    def analyze(self):
+        """
+        Find the rules of this context and its virtual hosts which can never
+        fire.
 
-        # sort by rankings
-        ranked_hosts = sorted(zip(virtual_hosts, rankings), key=lambda k: k[1],
-                              reverse=True)
+        :rtype: AnalysisReport
+        """
+        return AnalysisReport(self.handlers)
 
-        # only hosts that matched on IP and port at all are acceptable
-        filtered_hosts = (host for host, (ip_port_match, _) in ranked_hosts
-                          if ip_port_match > MatchType.NONE)
+    @property
+    def handlers(self):
+        """
+        :rtype: tuple[RequestHandler]
+        """
+        return (self,) + self.virtual_hosts
 
-        return next(filtered_hosts, self)
+    @property
+    def virtual_hosts(self):
+        """
+        :rtype: tuple[VirtualHost]
+        """
+        return tuple(directive for directive in self.children
+                     if isinstance(directive, VirtualHost))
 
     def handle_request(self, request, environment):
         """
@@ -81,4 +153,66 @@ class MainContext(ContextDirective, RequestHandler):
         :type environment: MutableMapping
         :rtype: str
         """
-        path = request.path
+        host = self.select_handler(request, environment)
+
+        if self._outcome_cache is not None:
+            return self._outcome_cache.rewrite(host, request, environment)
+
+        if host is self:
+            return self.rewrite(request.path, environment)
+
+        return host.handle_request(request, environment)
+
+    def select_handler(self, request, environment):
+        """
+        The virtual host to handle a request, or else this context.
+
+        The listening address is taken from the SERVER_ADDR and SERVER_PORT
+        variables of the environment, falling back on wildcards when they're
+        unknown.
+
+        :type request: HTTPRequest
+        :type environment: MutableMapping
+        :rtype: RequestHandler
+        """
+        ip = environment.get(ServerVariable.SERVER_ADDR) or \
+            IpWildcardPattern.WILDCARD
+        port = environment.get(ServerVariable.SERVER_PORT)
+        port = int(port) if port else PortWildcardPattern.WILDCARD
+
+        return self.find_host(IpWildcardPattern(ip),
+                              PortWildcardPattern(port),
+                              request.headers.get("Host"))
+
+    def cache_outcomes(self, outcome_cache):
+        """
+        Remember rewrites in the cache, and answer from it any request which
+        the rules couldn't tell apart from one already handled.
+
+        :param outcome_cache: None to stop caching
+        :type outcome_cache: OutcomeCache
+        :rtype: MainContext
+        """
+        self._outcome_cache = outcome_cache
+        return self
+
+    def handle_requests(self, requests, make_environment=None, workers=None,
+                        chunk_size=batch.DEFAULT_CHUNK_SIZE, throughput=None,
+                        failures=batch.REQUEST_FAILURES):
+        """
+        Lazily handle a stream of requests, yielding results in order; see
+        batch.handle_requests.
+
+        :type requests: Iterable[HTTPRequest]
+        :type make_environment: (HTTPRequest) -> MutableMapping
+        :type workers: int
+        :type chunk_size: int
+        :type throughput: Throughput
+        :type failures: tuple[type]
+        :rtype: __generator[str | RequestFailure]
+        """
+        return batch.handle_requests(self.compile(), requests,
+                                     make_environment=make_environment,
+                                     workers=workers, chunk_size=chunk_size,
+                                     throughput=throughput,
+                                     failures=failures)
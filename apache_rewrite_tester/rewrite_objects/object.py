@@ -1,7 +1,11 @@
+import re
+
 from apache_rewrite_tester.utils import EqualityMixin
 
 __author__ = 'jwilner'
 
+WHITESPACE_REGEX = re.compile(r"\s*")
+
 
 class RewriteObject(EqualityMixin):
     DEFAULTS = ()
@@ -37,16 +41,34 @@ class RewriteObject(EqualityMixin):
 
 
 class Directive(object):
+    # where the directive was read from, when parsed from SourceLines
+    _source = None
+
+    @property
+    def source(self):
+        """
+        :rtype: SourceLine
+        """
+        return self._source
+
     @staticmethod
-    def _get_remainder(string, index):
+    def is_ignorable_line(text):
+        """
+        :type text: str
+        :rtype: bool
+        """
+        return not text or text.startswith("#")
+
+    @staticmethod
+    def _skip_whitespace(string, position):
         """
         We want to drop leading whitespace whenever possible.
 
         :type string: str
-        :type index: int
-        :rtype: str
+        :type position: int
+        :rtype: int
         """
-        return string[index:].lstrip()
+        return WHITESPACE_REGEX.match(string, position).end()
 
     @classmethod
     def consume(cls, string):
@@ -54,8 +76,38 @@ class Directive(object):
         :type string: str
         :rtype: (Directive, str)
         """
+        directive, position = cls.consume_from(string)
+        return directive, string[position:]
+
+    @classmethod
+    def consume_from(cls, string, position=0):
+        """
+        Parse a directive starting at `position` without slicing the string,
+        returning the position parsing stopped at; this is what keeps parsing
+        linear in the size of the config.
+
+        :type string: str
+        :type position: int
+        :rtype: (Directive, int)
+        """
         raise NotImplementedError()
 
+    @classmethod
+    def consume_line(cls, line, lines):
+        """
+        Parse a directive from a logical line; contexts go on to pull their
+        remaining lines from `lines`.
+
+        :type line: SourceLine
+        :type lines: Iterator[SourceLine]
+        :rtype: Directive
+        """
+        text = line.text.strip()
+        directive, _ = cls.consume_from(text)
+        if directive is not None:
+            directive._source = line
+        return directive
+
 
 class MakeableRewriteObject(RewriteObject):
     REGEX = None
@@ -75,15 +127,17 @@ class MakeableRewriteObject(RewriteObject):
 
 class SingleLineDirective(MakeableRewriteObject, Directive):
     @classmethod
-    def consume(cls, string):
+    def consume_from(cls, string, position=0):
         """
         :type string: str
-        :rtype: (SingleLineDirective, str)
+        :type position: int
+        :rtype: (SingleLineDirective, int)
         """
-        match = cls.REGEX.match(string)
+        match = cls.REGEX.match(string, position)
         if match is None:
-            return None, string
+            return None, position
 
-        return cls(**cls._parse(match)), cls._get_remainder(string, match.end())
+        return cls(**cls._parse(match)), \
+            cls._skip_whitespace(string, match.end())
 
 
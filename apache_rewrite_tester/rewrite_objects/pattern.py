@@ -6,6 +6,14 @@ from apache_rewrite_tester.rewrite_objects.object import MakeableRewriteObject
 
 __author__ = 'jwilner'
 
+# characters with a meaning to re outside of a character class
+REGEX_METACHARACTERS = frozenset(".^$*+?{}[]\\|()")
+
+QUANTIFIERS = frozenset("*+?{")
+
+# what may follow a literal prefix for a regex to accept any continuation
+ANY_SUFFIX_REGEX = re.compile(r"(?:(?:\.\*|\(\.\*\))\$?)?\Z")
+
 
 class CondPattern(MakeableRewriteObject):
     PRECEDENCE = None
@@ -25,6 +33,15 @@ class CondPattern(MakeableRewriteObject):
 
         return None
 
+    def compile(self, flags=0):
+        """
+        Only regular expressions have anything worth compiling.
+
+        :type flags: int
+        :rtype: __Regex
+        """
+        return None
+
     def match(self, string, match_callback=None, regex_compiler=re.compile):
         """
         :type string: str
@@ -49,6 +66,64 @@ class RegexCondPattern(CondPattern):
         self.negated = negated
         self.pattern = pattern
 
+    def compile(self, flags=0):
+        """
+        :type flags: int
+        :rtype: __Regex
+        """
+        return re.compile(self.pattern, flags)
+
+    def split_literal_prefix(self):
+        """
+        Split the pattern into the literal text every match must start with
+        and whatever follows it. Conservative: alternations and anything
+        unusual just give an empty prefix.
+
+        :rtype: (str, str)
+        """
+        pattern = self.pattern
+        if "|" in pattern:
+            return "", pattern
+
+        position = 1 if pattern.startswith("^") else 0
+        literal = []
+        while position < len(pattern):
+            char, width = pattern[position], 1
+            if char == "\\":
+                char, width = pattern[position + 1:position + 2], 2
+                if not char or char.isalnum():  # a class or a backreference
+                    break
+            elif char in REGEX_METACHARACTERS:
+                break
+
+            # a quantified character is optional or repeated
+            if pattern[position + width:position + width + 1] in QUANTIFIERS:
+                break
+
+            literal.append(char)
+            position += width
+
+        return "".join(literal), pattern[position:]
+
+    @property
+    def accepts_any_suffix(self):
+        """
+        Whether the pattern matches any string starting with its literal
+        prefix.
+
+        :rtype: bool
+        """
+        _, rest = self.split_literal_prefix()
+        return ANY_SUFFIX_REGEX.match(rest) is not None
+
+    @property
+    def matches_everything(self):
+        """
+        :rtype: bool
+        """
+        prefix, _ = self.split_literal_prefix()
+        return not prefix and self.accepts_any_suffix
+
     def match(self, string, match_callback=None, regex_compiler=re.compile):
         """
         :type string: str
@@ -0,0 +1,86 @@
+import bisect
+
+__author__ = 'jwilner'
+
+
+# marks the rules whose prefix ends at a trie node; never a path character
+RULES_KEY = ""
+
+
+def _insert(trie, prefix, index):
+    """
+    :type trie: dict
+    :type prefix: str
+    :type index: int
+    """
+    node = trie
+    for char in prefix:
+        node = node.setdefault(char, {})
+    node.setdefault(RULES_KEY, []).append(index)
+
+
+def _walk(trie, path, found):
+    """
+    Collect the rules of every prefix of the path in the trie.
+
+    :type trie: dict
+    :type path: str
+    :type found: list[int]
+    """
+    node = trie
+    for char in path:
+        node = node.get(char)
+        if node is None:
+            return
+        found.extend(node.get(RULES_KEY, ()))
+
+
+class PrefixIndex(object):
+    """
+    A trie of the literal prefixes compiled rules require, so that a path
+    need only be tried against the regexes of rules whose prefix it starts
+    with, along with those which have no usable prefix.
+    """
+    def __init__(self, rules):
+        """
+        :type rules: Iterable[CompiledRule]
+        """
+        self._unprefixed = []
+        self._trie = {}
+
+        # case-insensitive rules, keyed by their lowercased prefixes
+        self._folded_trie = {}
+        self._folded = []
+
+        for index, rule in enumerate(rules):
+            if rule.prefix is None:
+                self._unprefixed.append(index)
+            elif not rule.ignore_case:
+                _insert(self._trie, rule.prefix, index)
+            elif rule.prefix.isascii():
+                _insert(self._folded_trie, rule.prefix.lower(), index)
+                self._folded.append(index)
+            else:
+                # re folds case more widely than str.lower does
+                self._unprefixed.append(index)
+
+    def get_candidates(self, path, start=0):
+        """
+        The indices of the rules the path might match, in order.
+
+        :type path: str
+        :param start: the first index worth returning
+        :type start: int
+        :rtype: list[int]
+        """
+        candidates = list(self._unprefixed)
+        _walk(self._trie, path, candidates)
+
+        if path.isascii():
+            _walk(self._folded_trie, path.lower(), candidates)
+        else:
+            # outside ascii, more than the lowercase can match; try them all
+            candidates.extend(self._folded)
+
+        candidates.sort()
+        return candidates[bisect.bisect_left(candidates, start):]
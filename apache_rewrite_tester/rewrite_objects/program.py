@@ -0,0 +1,442 @@
+import bisect
+import re
+import time
+
+from apache_rewrite_tester.environment import CondBackreference, \
+    RuleBackreference
+from apache_rewrite_tester.rewrite_objects.alternation import FusedRules
+from apache_rewrite_tester.rewrite_objects.condition import RewriteCondition
+from apache_rewrite_tester.rewrite_objects.condition_tree import \
+    ConditionCounters, ConditionTree
+from apache_rewrite_tester.rewrite_objects.control_flow import ControlFlow, \
+    RESTART, RewriteLoopError, STOP, STOPPING_FLAGS
+from apache_rewrite_tester.rewrite_objects.prefix_index import PrefixIndex
+from apache_rewrite_tester.rewrite_objects.rule import RewriteRule, RuleFlag
+
+__author__ = 'jwilner'
+
+
+NO_SUBSTITUTION = "-"
+
+
+def pair_rules_with_conditions(directives):
+    """
+    Each rule along with the conditions which precede it; conditions
+    trailing the last rule apply to nothing and are dropped.
+
+    :type directives: Iterable[Directive]
+    :rtype: __generator[(RewriteRule, tuple[RewriteCondition])]
+    """
+    conditions = []
+    for directive in directives:
+        if isinstance(directive, RewriteCondition):
+            conditions.append(directive)
+        elif isinstance(directive, RewriteRule):
+            yield directive, tuple(conditions)
+            conditions = []
+
+
+class CompiledCondition(object):
+    """
+    A RewriteCondition whose pattern was compiled, with NC folded in, once.
+    """
+    __slots__ = "directive", "flags", "format_test_string", "cond_pattern", \
+        "regex", "memo", "memo_key"
+
+    def __init__(self, directive, memo=None, maps=None):
+        """
+        :type directive: RewriteCondition
+        :param memo: where to look up the regex's earlier matches, if
+            anywhere
+        :type memo: ConditionMemo
+        :param maps: the maps the test string can expand
+        :type maps: RewriteMaps
+        """
+        self.directive = directive
+        self.flags = directive.flags
+        self.format_test_string = directive.test_string.compile(maps)
+        self.cond_pattern = directive.cond_pattern
+        self.regex = directive.cond_pattern.compile(directive.regex_flags)
+
+        # comparisons are cheaper than looking them up
+        self.memo = None if self.regex is None else memo
+        self.memo_key = None if self.memo is None \
+            else memo.get_key(self.regex)
+
+    def evaluate(self, environment):
+        """
+        Same contract as RewriteCondition.evaluate, so the two can be
+        chained interchangeably.
+
+        :type environment: MutableMapping
+        :rtype: bool
+        """
+        return self.test(self.format_test_string(environment), environment)
+
+    def test(self, string, environment):
+        """
+        Evaluate the condition against an already formatted test string.
+
+        :type string: str
+        :type environment: MutableMapping
+        :rtype: bool
+        """
+        if self.regex is None:
+            return self.cond_pattern.match(string)
+
+        memo = self.memo
+        match = self.regex.match(string) if memo is None \
+            else memo.match(self.memo_key, self.regex, string)
+        if match is None:
+            return self.cond_pattern.negated
+
+        if self.cond_pattern.negated:
+            return False
+
+        CondBackreference.update_environment(match, environment)
+        return True
+
+
+class CompiledRule(object):
+    """
+    A RewriteRule bundled with the conditions which precede it.
+    """
+    __slots__ = "directive", "regex", "negated", "format_substitution", \
+        "conditions", "condition_tree", "terminal", "prefix", "ignore_case"
+
+    def __init__(self, directive, conditions=(), maps=None):
+        """
+        :type directive: RewriteRule
+        :type conditions: tuple[CompiledCondition]
+        :param maps: the maps the substitution can expand
+        :type maps: RewriteMaps
+        """
+        self.directive = directive
+        self.regex = directive.pattern.compile(directive.regex_flags)
+        self.negated = directive.pattern.negated
+        self.conditions = conditions
+        self.condition_tree = ConditionTree(conditions) if conditions \
+            else None
+        self.terminal = any(flag in directive.flags
+                            for flag in STOPPING_FLAGS)
+
+        # what any path the rule matches must start with; a negated rule
+        # matches exactly those paths which don't, so can't have one. A rule
+        # with [C] is never passed over, since failing it is a jump.
+        prefix, _ = directive.pattern.split_literal_prefix()
+        self.prefix = None \
+            if self.negated or RuleFlag.CHAIN in directive.flags \
+            else prefix or None
+        # inline flags count too
+        self.ignore_case = bool(self.regex.flags & re.IGNORECASE)
+
+        substitution = directive.substitution
+        self.format_substitution = None \
+            if substitution.components == (NO_SUBSTITUTION,) \
+            else substitution.compile(maps)
+
+    def apply(self, path, environment):
+        """
+        :type path: str
+        :type environment: MutableMapping
+        :rtype: str
+        :returns: the new path, or None if the rule did not fire
+        """
+        match = self.regex.match(path)
+        if (match is None) is not self.negated:
+            return None
+
+        return self.fire(match, path, environment)
+
+    def fire(self, match, path, environment):
+        """
+        The rest of `apply`, once the pattern's known to have matched.
+
+        :type match: __Match
+        :type path: str
+        :type environment: MutableMapping
+        :rtype: str
+        """
+        if match is not None:
+            RuleBackreference.update_environment(match, environment)
+
+        # Apache only looks at the conditions once the pattern has matched
+        if self.condition_tree is not None and \
+                not self.condition_tree.evaluate(environment):
+            return None
+
+        if self.format_substitution is None:
+            return path
+
+        return self.format_substitution(environment)
+
+
+class ProfiledCondition(CompiledCondition):
+    """
+    A CompiledCondition which counts and times its tests.
+    """
+    __slots__ = "stats",
+
+    def __init__(self, directive, profile, memo=None, maps=None):
+        """
+        :type directive: RewriteCondition
+        :type profile: Profile
+        :type memo: ConditionMemo
+        :type maps: RewriteMaps
+        """
+        super(ProfiledCondition, self).__init__(directive, memo, maps)
+        self.stats = profile.get_stats(directive, "condition")
+
+    def test(self, string, environment):
+        """
+        :type string: str
+        :type environment: MutableMapping
+        :rtype: bool
+        """
+        stats = self.stats
+        start = time.perf_counter_ns()
+
+        result = super(ProfiledCondition, self).test(string, environment)
+
+        stats.nanoseconds += time.perf_counter_ns() - start
+        stats.attempts += 1
+        if result:
+            stats.matches += 1
+        return result
+
+
+class ProfiledRule(CompiledRule):
+    """
+    A CompiledRule which counts and times its attempts, including the time
+    spent on its conditions.
+    """
+    __slots__ = "stats",
+
+    def __init__(self, directive, conditions, profile, maps=None):
+        """
+        :type directive: RewriteRule
+        :type conditions: tuple[ProfiledCondition]
+        :type profile: Profile
+        :type maps: RewriteMaps
+        """
+        super(ProfiledRule, self).__init__(directive, conditions, maps)
+        self.stats = profile.get_stats(directive, "rule")
+
+    def apply(self, path, environment):
+        """
+        :type path: str
+        :type environment: MutableMapping
+        :rtype: str
+        """
+        stats = self.stats
+        start = time.perf_counter_ns()
+
+        match = self.regex.match(path)
+        if (match is None) is not self.negated:
+            new_path = None
+        else:
+            new_path = self._fire(match, path, environment)
+
+        stats.nanoseconds += time.perf_counter_ns() - start
+        stats.attempts += 1
+        return new_path
+
+    def fire(self, match, path, environment):
+        """
+        Only called directly for rules found by a fused regex, which counts
+        as an attempt of its own.
+
+        :type match: __Match
+        :type path: str
+        :type environment: MutableMapping
+        :rtype: str
+        """
+        stats = self.stats
+        start = time.perf_counter_ns()
+
+        new_path = self._fire(match, path, environment)
+
+        stats.nanoseconds += time.perf_counter_ns() - start
+        stats.attempts += 1
+        return new_path
+
+    def _fire(self, match, path, environment):
+        """
+        :type match: __Match
+        :type path: str
+        :type environment: MutableMapping
+        :rtype: str
+        """
+        self.stats.matches += 1
+        new_path = CompiledRule.fire(self, match, path, environment)
+        if new_path is None:
+            self.stats.condition_failures += 1
+        return new_path
+
+
+class RuleProgram(object):
+    """
+    An immutable, precompiled form of the rewrite directives in a context.
+    """
+    __slots__ = "rules", "index", "runs", "control_flow"
+
+    @classmethod
+    def compile(cls, directives, excluded=(), profile=None,
+                condition_memo=None, maps=None):
+        """
+        :type directives: Iterable[Directive]
+        :param excluded: rules to leave out, along with their conditions
+        :type excluded: Iterable[RewriteRule]
+        :param profile: where to count and time each directive, if anywhere
+        :type profile: Profile
+        :param condition_memo: where conditions' regexes remember their
+            matches, if anywhere
+        :type condition_memo: ConditionMemo
+        :param maps: the maps rules and conditions can expand
+        :type maps: RewriteMaps
+        :rtype: RuleProgram
+        """
+        # directives compare by value, but it's these very rules we want out
+        excluded = {id(rule) for rule in excluded}
+
+        rules = []
+        for rule, conditions in pair_rules_with_conditions(directives):
+            if id(rule) in excluded:
+                continue
+
+            if profile is None:
+                rules.append(CompiledRule(
+                    rule, tuple(CompiledCondition(condition, condition_memo,
+                                                  maps)
+                                for condition in conditions), maps))
+            else:
+                rules.append(ProfiledRule(
+                    rule, tuple(ProfiledCondition(condition, profile,
+                                                  condition_memo, maps)
+                                for condition in conditions), profile, maps))
+
+        return cls(rules)
+
+    def __init__(self, rules):
+        """
+        :type rules: Iterable[CompiledRule]
+        """
+        self.rules = tuple(rules)
+        self.index = PrefixIndex(self.rules)
+        self.runs = FusedRules.find_runs(self.rules)
+        self.control_flow = ControlFlow.compile(
+            [rule.directive for rule in self.rules])
+
+    def __len__(self):
+        return len(self.rules)
+
+    def get_condition_counters(self):
+        """
+        The counters of every rule's conditions, summed.
+
+        :rtype: ConditionCounters
+        """
+        counters = ConditionCounters()
+        for rule in self.rules:
+            if rule.condition_tree is not None:
+                counters += rule.condition_tree.counters
+        return counters
+
+    def apply(self, path, environment):
+        """
+        Only rules whose literal prefix the path starts with are tried; when
+        a rule changes the path, the rest are looked up again. Within a run
+        of fused rules, one regex finds the first which matches. Which rule
+        comes next is read off the control flow's arrays.
+
+        :type path: str
+        :type environment: MutableMapping
+        :rtype: str
+        """
+        rules, runs = self.rules, self.runs
+        fire_targets = self.control_flow.fire_targets
+        fail_targets = self.control_flow.fail_targets
+
+        rounds = 1
+        start = 0
+
+        # a run's regex finds its earliest match, which is no use once
+        # we're part of the way through the run
+        sequential_until = 0
+
+        while True:
+            # candidates before this have been jumped over
+            next_index = start
+
+            candidates = self.index.get_candidates(path, start)
+            for position, rule_index in enumerate(candidates):
+                if rule_index < next_index:
+                    continue
+
+                run = runs[rule_index]
+                if run is None or rule_index < sequential_until:
+                    new_path = rules[rule_index].apply(path, environment)
+                else:
+                    sequential_until = run.end
+                    rule_index, new_path = self._apply_run(
+                        run, rule_index, candidates, position, path,
+                        environment)
+                    if rule_index is None:
+                        next_index = run.end
+                        continue
+
+                if new_path is None:
+                    next_index = fail_targets[rule_index]
+                    continue
+
+                target = fire_targets[rule_index]
+                if target == STOP:
+                    return new_path
+
+                if target == RESTART:
+                    rounds += 1
+                    round_limit = self.control_flow.round_limits[rule_index]
+                    if rounds >= round_limit:
+                        raise RewriteLoopError(rules[rule_index].directive,
+                                               new_path, round_limit)
+                    path = new_path
+                    start = sequential_until = 0
+                    break
+
+                if new_path != path:
+                    path = new_path
+                    start = target
+                    break
+
+                next_index = target
+            else:
+                return path
+
+    def _apply_run(self, run, rule_index, candidates, position, path,
+                   environment):
+        """
+        :type run: FusedRules
+        :param rule_index: the first candidate in the run
+        :type rule_index: int
+        :type candidates: list[int]
+        :param position: the first candidate's position in candidates
+        :type position: int
+        :type path: str
+        :type environment: MutableMapping
+        :rtype: (int, str)
+        :returns: the rule applied, if any did match, and its result
+        """
+        end = bisect.bisect_left(candidates, run.end, position)
+        if not run.is_worthwhile(end - position):
+            return rule_index, self.rules[rule_index].apply(path, environment)
+
+        matched_index, match = run.match(path)
+        if matched_index is None:
+            return None, None
+
+        if matched_index < rule_index:
+            # an earlier rule of the run matches; we're past it, though
+            return rule_index, self.rules[rule_index].apply(path, environment)
+
+        return matched_index, self.rules[matched_index].fire(match, path,
+                                                             environment)
@@ -82,6 +82,13 @@ class RewriteRule(SingleLineDirective):
         self.substitution = substitution
         self.flags = flags
 
+    @property
+    def regex_flags(self):
+        """
+        :rtype: int
+        """
+        return re.IGNORECASE if RuleFlag.NO_CASE in self.flags else 0
+
     def apply(self, path, environment):
         """
         :type path: str
@@ -91,13 +98,12 @@ class RewriteRule(SingleLineDirective):
         match_callback = functools.partial(RuleBackreference.update_environment,
                                            environment=environment)
 
-        flags = re.IGNORECASE if RuleFlag.NO_CASE in self.flags else 0
-        compiler = functools.partial(re.compile, flags=flags)
+        compiler = functools.partial(re.compile, flags=self.regex_flags)
 
         match = self.pattern.match(path, regex_compiler=compiler,
                                    match_callback=match_callback)
 
-        if match is None:  # do not apply substitutions or flags
+        if not match:  # do not apply substitutions or flags
             return path
 
         new_path = self.substitution.format(environment)
@@ -39,3 +39,36 @@ class NameVirtualHost(SingleLineDirective):
     REGEX = re.compile(r"NameVirtualHost\s+(?P<ip_address>\S+)")
 
     PARSERS = ("ip_address", IpWildcardPattern.make)
+
+
+class RewriteMap(SingleLineDirective):
+    REGEX = re.compile(r"""
+                       RewriteMap\s+
+                       (?P<name>\S+)\s+
+                       (")?  # group 2; quoted, the source may have spaces
+                       (?P<map_type>\w+)(?:=(?P<subtype>\w+))?:
+                       (?P<map_source>(?(2)[^"]+|\S+))
+                       (?(2)")
+                       (?:[ \t]+(?P<options>\S.*))?
+                       """, re.VERBOSE)
+
+    def __init__(self, name, map_type, subtype, map_source, options):
+        """
+        :type name: str
+        :param map_type: e.g. txt, rnd, dbm or int
+        :type map_type: str
+        :param subtype: e.g. the dbm's kind in dbm=sdbm
+        :type subtype: str
+        :param map_source: a filename, or an int map's function name
+        :type map_source: str
+        :type options: str
+        """
+        self.name = name
+        self.map_type = map_type
+        self.subtype = subtype
+        self.map_source = map_source
+        self.options = options
+
+    def __repr__(self):
+        return "{0.__class__.__name__}({0.name}, " \
+               "{0.map_type}:{0.map_source})".format(self)
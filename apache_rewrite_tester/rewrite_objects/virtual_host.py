@@ -7,7 +7,7 @@ from apache_rewrite_tester.rewrite_objects.ip_and_port import \
     PortWildcardPattern, IpWildcardPattern
 from apache_rewrite_tester.rewrite_objects.rule import RewriteRule
 from apache_rewrite_tester.rewrite_objects.simple_directives import \
-    RewriteEngine, ServerName
+    RewriteEngine, RewriteMap, ServerName
 from apache_rewrite_tester.utils import compare
 
 
@@ -31,7 +31,7 @@ class VirtualHost(RequestHandler, ContextDirective):
     DEFAULTS = ('port', PortWildcardPattern(PortWildcardPattern.WILDCARD)),
 
     INNER_DIRECTIVE_TYPES = RewriteCondition, RewriteRule, ServerName, \
-        RewriteEngine
+        RewriteEngine, RewriteMap
 
     def __init__(self, ip, port, children):
         """
@@ -50,6 +50,13 @@ class VirtualHost(RequestHandler, ContextDirective):
                                 if isinstance(directive, RewriteEngine)] \
             or (RewriteEngine.get_default(),)
 
+    def _copy_with_children(self, children):
+        """
+        :type children: tuple[SingleLineDirective]
+        :rtype: VirtualHost
+        """
+        return type(self)(self.ip, self.port, children)
+
     def __repr__(self):
         return "<{0.__class__.__name__}: " \
                "({0.server_name!r}, {0.ip!r}, {0.port!r})>".format(self)
@@ -71,4 +78,12 @@ class VirtualHost(RequestHandler, ContextDirective):
             return ip_port_match, None
 
         return ip_port_match, compare(self.server_name,
-                                      ServerName(requested_hostname))
\ No newline at end of file
+                                      ServerName(requested_hostname))
+
+    def handle_request(self, request, environment):
+        """
+        :type request: HTTPRequest
+        :type environment: MutableMapping
+        :rtype: str
+        """
+        return self.rewrite(request.path, environment)
@@ -1,3 +1,7 @@
+import collections
+import glob
+import itertools
+import os
 import re
 import enum
 
@@ -24,6 +28,9 @@ class EqualityMixin(object):
     """
     http://stackoverflow.com/questions/390250/
     elegant-ways-to-support-equivalence-equality-in-python-classes
+
+    Attributes with a leading underscore hold derived state (compiled
+    programs, caches) and are left out of comparisons.
     """
     def __eq__(self, other):
         """
@@ -34,7 +41,7 @@ class EqualityMixin(object):
         if type(self) != type(other):
             return NotImplemented
 
-        return self.__dict__ == other.__dict__
+        return self._get_public_state() == other._get_public_state()
 
     def __ne__(self, other):
         """
@@ -43,6 +50,13 @@ class EqualityMixin(object):
         """
         return not self.__eq__(other)
 
+    def _get_public_state(self):
+        """
+        :rtype: dict[str, object]
+        """
+        return {key: value for key, value in self.__dict__.items()
+                if not key.startswith('_')}
+
 
 class KeyedEqualityMixin(EqualityMixin):
     def __eq__(self, other):
@@ -66,30 +80,17 @@ def compare(a, b, wildcard=WILDCARD_DEFAULT):
     return MatchType.NONE
 
 
+SourceLine = collections.namedtuple("SourceLine",
+                                    "text filename line_number")
+
+
 def join_continued_lines(string):
     """
     :type string: str
     :rtype: str
     """
-    return "\n".join(_join_continued_lines(string.splitlines()))
-
-
-def _join_continued_lines(lines):
-    """
-    :type lines: Iterable[str]
-    :rtype: __generator[str]
-    """
-    previous = []
-    for line in lines:
-        if line.endswith('\\'):
-            previous.append(line[:-1])
-        else:
-            previous.append(line)
-            yield "".join(previous)
-            previous = []
-
-    if previous:
-        raise ValueError("Ended on a continued line.")
+    return "\n".join(line.text for line in
+                     join_continued_source_lines(split_source_lines(string)))
 
 
 def expand_includes(string, filenames_to_contents):
@@ -107,8 +108,76 @@ def _expand_includes(string, filenames_to_contents):
     :type filenames_to_contents: Mapping[str, str]
     :rtype: __generator[str]
     """
-    for line in string.splitlines():
-        match = INCLUDE_REGEX.match(line)
+    def get_included_lines(filename):
+        contents = filenames_to_contents.get(filename)
+        if contents is None:
+            return None
+        return split_source_lines(contents, filename)
+
+    for line in expand_source_includes(split_source_lines(string),
+                                       get_included_lines):
+        yield line.text
+
+
+def split_source_lines(string, filename=None):
+    """
+    :type string: str
+    :type filename: str
+    :rtype: __generator[SourceLine]
+    """
+    for line_number, line in enumerate(string.splitlines(), 1):
+        yield SourceLine(line, filename, line_number)
+
+
+def read_source_lines(filename):
+    """
+    Lazily read a file, a line at a time.
+
+    :type filename: str
+    :rtype: __generator[SourceLine]
+    """
+    with open(filename) as lines:
+        for line_number, line in enumerate(lines, 1):
+            yield SourceLine(line.rstrip("\r\n"), filename, line_number)
+
+
+def join_continued_source_lines(source_lines):
+    """
+    Joined lines keep the location of the first line they were joined from.
+
+    :type source_lines: Iterable[SourceLine]
+    :rtype: __generator[SourceLine]
+    """
+    first, previous = None, []
+    for line in source_lines:
+        if first is None:
+            first = line
+
+        if line.text.endswith('\\'):
+            previous.append(line.text[:-1])
+        else:
+            previous.append(line.text)
+            yield first._replace(text="".join(previous)) \
+                if len(previous) > 1 else line
+            first, previous = None, []
+
+    if previous:
+        raise ValueError("Ended on a continued line.")
+
+
+def expand_source_includes(source_lines, get_included_lines, recursive=True):
+    """
+    :type source_lines: Iterable[SourceLine]
+    :param get_included_lines: gives the lines of an included file, or None
+        if there's no such file
+    :type get_included_lines: (str) -> Iterable[SourceLine]
+    :param recursive: whether to expand includes within included lines too,
+        rather than get_included_lines having done so
+    :type recursive: bool
+    :rtype: __generator[SourceLine]
+    """
+    for line in source_lines:
+        match = INCLUDE_REGEX.match(line.text)
         if match is None:  # line doesn't have any includes
             yield line
             continue
@@ -117,11 +186,83 @@ def _expand_includes(string, filenames_to_contents):
         filename = groups["include_file"]
         optional = bool(groups["optional"])
 
-        contents = filenames_to_contents.get(filename)
+        included_lines = get_included_lines(filename)
+
+        if included_lines is None:
+            if not optional:  # line is dropped if optional
+                raise KeyError(filename)
+        elif recursive:
+            yield from expand_source_includes(included_lines,
+                                              get_included_lines)
+        else:
+            yield from included_lines
+
+
+class IncludeGraph(object):
+    """
+    The files a config was read from, and the files each of its Include
+    patterns matched: whatever decides the lines reading it again would give.
+    """
+    def __init__(self):
+        self.filenames = []
+
+        # (the including file, pattern, the filenames it matched), in the
+        # order they were included
+        self.includes = []
+
+    def add_include(self, including_filename, pattern, filenames):
+        """
+        :type including_filename: str
+        :type pattern: str
+        :type filenames: list[str]
+        """
+        self.includes.append((including_filename, pattern, tuple(filenames)))
+
+    def get_parents(self):
+        """
+        :rtype: dict[str, str]
+        :returns: the file which included each file
+        """
+        return {filename: including_filename
+                for including_filename, _, filenames in self.includes
+                for filename in filenames}
+
+
+def read_directive_lines(filename, server_root=None, include_graph=None):
+    """
+    Stream the logical lines of a config file, with continuations joined and
+    includes expanded, without ever holding more than a directive in memory.
+
+    :type filename: str
+    :param server_root: what relative includes are resolved against; the
+        working directory by default
+    :type server_root: str
+    :param include_graph: where to record the files read, as they're read
+    :type include_graph: IncludeGraph
+    :rtype: __generator[SourceLine]
+    """
+    def read_file(filename):
+        def get_included_lines(pattern):
+            if server_root is not None:
+                pattern = os.path.join(server_root, pattern)
+
+            filenames = sorted(glob.glob(pattern))
+            if include_graph is not None:
+                include_graph.add_include(filename, pattern, filenames)
+
+            if not filenames:
+                return None
+
+            return itertools.chain.from_iterable(
+                read_file(included) for included in filenames)
 
-        if contents is not None:
-            yield from _expand_includes(contents, filenames_to_contents)
-        elif not optional:  # line is dropped if optional
-            raise KeyError(filename)
+        if include_graph is not None:
+            include_graph.filenames.append(filename)
 
+        # each file expands its own includes, so that they're recorded
+        # against it
+        return expand_source_includes(
+            join_continued_source_lines(read_source_lines(filename)),
+            get_included_lines, recursive=False)
 
+    return read_file(filename)
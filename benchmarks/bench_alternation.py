@@ -0,0 +1,51 @@
+"""
+Requests per second through a flat ruleset of condition-free rules: every
+rule tried in turn, only those the prefix index picks out, and those with
+runs of rules fused into single regexes.
+
+    python -m benchmarks.bench_alternation --rules 4000 --anchored 0
+"""
+import argparse
+
+from apache_rewrite_tester.rewrite_objects.main_context import MainContext
+from benchmarks.bench_prefix_index import try_every_rule
+from benchmarks.bench_program import measure
+from benchmarks.synthetic import generate_config, generate_mixed_rules, \
+    generate_paths
+
+__author__ = 'jwilner'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rules", type=int, default=4000)
+    parser.add_argument("--anchored", type=float, default=0.)
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+
+    rules = generate_mixed_rules(args.rules, args.anchored)
+    context, _ = MainContext.consume(generate_config(args.rules, rules=rules))
+    program = context.compile().program
+    paths = generate_paths(args.rules, args.requests)
+
+    fused = measure(program.apply, paths)
+    runs = program.runs
+    fused_count = sum(1 for run in runs if run is not None)
+
+    program.runs = (None,) * len(program)
+    indexed = measure(program.apply, paths)
+    program.runs = runs
+
+    every_rule = measure(lambda path, environment:
+                         try_every_rule(program, path, environment), paths)
+
+    print("rules: {}, fused: {}".format(len(program), fused_count))
+    print("every rule:  {:10.1f} requests/s".format(every_rule))
+    print("indexed:     {:10.1f} requests/s ({:.1f}x)".format(
+        indexed, indexed / every_rule))
+    print("fused:       {:10.1f} requests/s ({:.1f}x)".format(
+        fused, fused / every_rule))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""
+Backreference capture on rule-match-heavy workloads: an entry per group in
+a dict against one tuple of groups in an Environment.
+
+    python -m benchmarks.bench_backreferences
+"""
+import argparse
+import re
+import timeit
+
+from apache_rewrite_tester.environment import Environment, RuleBackreference
+from apache_rewrite_tester.rewrite_objects.main_context import MainContext
+from benchmarks.synthetic import generate_config, generate_paths
+
+__author__ = 'jwilner'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--number", type=int, default=100000)
+    parser.add_argument("--rules", type=int, default=50)
+    args = parser.parse_args()
+
+    match = re.match(r"^/(\w+)/(\w+)/(\w+)/(.*)$", "/a/b/c/rest/of/path")
+    dictionary, environment = {}, Environment()
+
+    for label, mapping in (("dict", dictionary),
+                           ("Environment", environment)):
+        seconds = timeit.timeit(
+            lambda: RuleBackreference.update_environment(match, mapping),
+            number=args.number)
+        print("capture, {:12} {:8.3f} us".format(
+            label, seconds * 1e6 / args.number))
+
+    # a full program, where each request captures for the rule it matches
+    context, _ = MainContext.consume(generate_config(args.rules))
+    program = context.compile().program
+    paths = generate_paths(args.rules, 100)
+    rounds = max(1, args.number // 1000)
+
+    def run(make_environment):
+        for path in paths:
+            program.apply(path, make_environment())
+
+    def reuse():
+        environment.reset()
+        return environment
+
+    for label, make_environment in (("dict", dict), ("Environment", reuse)):
+        seconds = timeit.timeit(lambda: run(make_environment), number=rounds)
+        print("rules, {:14} {:8.3f} us per request".format(
+            label, seconds * 1e6 / (rounds * len(paths))))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""
+FormatString parsing and formatting on long substitutions and
+query-string-heavy rules, against the old character-at-a-time parser, and
+the interpreted FormatString.format against its compiled function.
+
+    python -m benchmarks.bench_format_string
+"""
+import argparse
+import timeit
+
+from apache_rewrite_tester.environment import RuleBackreference, \
+    CondBackreference, ServerVariable
+from apache_rewrite_tester.rewrite_objects.format_string import FormatString
+
+__author__ = 'jwilner'
+
+SUBSTITUTIONS = {
+    "query string heavy": "/search/$1?q=$2&page=%{QUERY_STRING}"
+                          "&host=%{HTTP_HOST}&ref=%{HTTP_REFERER}&lang=%1",
+    "long literal": "/" + "/".join("segment{}".format(i) for i in range(40)) +
+                    "/$1",
+}
+
+
+def legacy_parse(string):
+    """
+    The parser FormatString used to have: one literal character at a time.
+
+    :type string: str
+    :rtype: __generator[Hashable]
+    """
+    prefixes = ("$", RuleBackreference.from_string), \
+        ("%", CondBackreference.from_string)
+    while string:
+        for prefix, parser in prefixes:
+            if string.startswith(prefix) and string[1:2].isdigit():
+                component, string = parser(string[1]), string[2:]
+                break
+        else:
+            if string.startswith("%{"):
+                end = string.index("}")
+                component = ServerVariable[string[2:end]]
+                string = string[end + 1:]
+            else:
+                component, *characters = string
+                string = "".join(characters)
+
+        yield component
+
+
+def format_components(components, environment):
+    """
+    :type components: tuple[Hashable]
+    :type environment: Mapping
+    :rtype: str
+    """
+    return "".join(component if isinstance(component, str)
+                   else environment[component] for component in components)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--number", type=int, default=20000)
+    args = parser.parse_args()
+
+    environment = {RuleBackreference(1): "thing", RuleBackreference(2): "x",
+                   CondBackreference(1): "en",
+                   ServerVariable.QUERY_STRING: "a=b",
+                   ServerVariable.HTTP_HOST: "example.com",
+                   ServerVariable.HTTP_REFERER: "http://example.com/"}
+
+    for name, substitution in sorted(SUBSTITUTIONS.items()):
+        legacy = tuple(legacy_parse(substitution))
+        current = FormatString.parse(substitution)
+        compiled = current.compile()
+
+        timings = (
+            ("parse, legacy", lambda: tuple(legacy_parse(substitution))),
+            ("parse", lambda: FormatString.parse(substitution)),
+            ("format, legacy",
+             lambda: format_components(legacy, environment)),
+            ("format", lambda: current.format(environment)),
+            ("format, compiled", lambda: compiled(environment)),
+        )
+
+        print("{} ({} -> {} components)".format(name, len(legacy),
+                                                len(current.components)))
+        for label, function in timings:
+            seconds = timeit.timeit(function, number=args.number)
+            print("    {:16} {:8.2f} us".format(
+                label, seconds * 1e6 / args.number))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""
+Lookups per second in a txt: map, built into a hashed index: probing the
+memory-mapped index for every key, and through the LRU kept for hot keys.
+The index is built whatever the map's size, though TextMap would load one
+small enough into memory instead. Keys are drawn with a skew, as real traffic's are, so that a minority
+of them make up most lookups.
+
+    python -m benchmarks.bench_maps --entries 2000000 --lookups 10000000
+"""
+import argparse
+import itertools
+import os
+import random
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+from apache_rewrite_tester.rewrite_maps import build_index, \
+    read_text_map, CachedLookup, DEFAULT_CACHE_SIZE, HashedIndex, \
+    INDEX_SUFFIX
+
+__author__ = 'jwilner'
+
+# keys are drawn in advance, then cycled through
+KEY_POOL_SIZE = 1 << 20
+
+
+def _write_map(filename, entries):
+    """
+    :type filename: str
+    :type entries: int
+    """
+    with open(filename, "w") as map_file:
+        for index in range(entries):
+            map_file.write("user{0} /home/{0:x}/profile\n".format(index))
+
+
+def _draw_keys(entries, skew, seed=0):
+    """
+    :type entries: int
+    :param skew: the Pareto shape; the smaller, the more skewed
+    :type skew: float
+    :rtype: list[str]
+    """
+    generator = random.Random(seed)
+    return ["user{}".format(int(generator.paretovariate(skew) - 1) % entries)
+            for _ in range(KEY_POOL_SIZE)]
+
+
+def _time_lookups(lookup, keys, lookups):
+    """
+    :type lookup: (str) -> str
+    :type keys: list[str]
+    :type lookups: int
+    :returns: lookups per second
+    :rtype: float
+    """
+    start = time.perf_counter()
+    for key in itertools.islice(itertools.cycle(keys), lookups):
+        lookup(key)
+    return lookups / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--entries", type=int, default=2000000)
+    parser.add_argument("--lookups", type=int, default=10000000)
+    parser.add_argument("--skew", type=float, default=.3)
+    parser.add_argument("--cache-size", type=int, default=DEFAULT_CACHE_SIZE)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(directory, "users.txt")
+        index_filename = os.path.join(directory, "users" + INDEX_SUFFIX)
+        _write_map(filename, args.entries)
+
+        start = time.perf_counter()
+        build_index(read_text_map(filename), index_filename)
+        built = time.perf_counter() - start
+
+        keys = _draw_keys(args.entries, args.skew)
+
+        # the map's entries never reach the heap, only the LRU's
+        tracemalloc.start()
+        start = time.perf_counter()
+        index = HashedIndex(index_filename)
+        reopened = time.perf_counter() - start
+        cached_lookup = CachedLookup(index.get, args.cache_size)
+        for key in keys[:args.cache_size * 4]:
+            cached_lookup.lookup(key)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        cached_lookup.lookup.cache_clear()
+
+        uncached = _time_lookups(index.get, keys, args.lookups)
+        cached = _time_lookups(cached_lookup.lookup, keys, args.lookups)
+        cache_info = cached_lookup.cache_info()
+        index.close()
+
+        print("entries: {}, map: {:.1f} MB, index: {:.1f} MB".format(
+            args.entries, os.path.getsize(filename) / 1e6,
+            os.path.getsize(index_filename) / 1e6))
+        print("built in {:.2f}s, reopened in {:.2f}ms, peak heap while "
+              "looking up {:.1f} MB".format(built, reopened * 1e3,
+                                            peak / 1e6))
+        print("index:    {:12.1f} lookups/s".format(uncached))
+        print("with LRU: {:12.1f} lookups/s ({:.1f}x, {:.1%} hits)".format(
+            cached, cached / uncached,
+            cache_info.hits / (cache_info.hits + cache_info.misses)))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,35 @@
+"""
+Parsing time for growing configs; the time per KB should stay flat if
+parsing is linear.
+
+    python -m benchmarks.bench_parser --sizes 10000 100000 1000000 10000000
+"""
+import argparse
+import time
+
+from apache_rewrite_tester.rewrite_objects.main_context import MainContext
+from benchmarks.synthetic import generate_config_of_size
+
+__author__ = 'jwilner'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+",
+                        default=(10000, 100000, 1000000, 10000000))
+    args = parser.parse_args()
+
+    print("{:>12} {:>10} {:>12}".format("bytes", "seconds", "us per KB"))
+    for size in args.sizes:
+        config = generate_config_of_size(size)
+
+        start = time.perf_counter()
+        MainContext.consume(config)
+        elapsed = time.perf_counter() - start
+
+        print("{:>12} {:>10.3f} {:>12.1f}".format(
+            len(config), elapsed, elapsed * 1e6 / (len(config) / 1000)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""
+Requests per second through a ruleset where most rules are anchored on a
+literal prefix: every rule tried in turn versus only those the prefix index
+picks out.
+
+    python -m benchmarks.bench_prefix_index --rules 4000 --anchored .95
+"""
+import argparse
+
+from apache_rewrite_tester.rewrite_objects.main_context import MainContext
+from benchmarks.bench_program import measure
+from benchmarks.synthetic import generate_config, generate_mixed_rules, \
+    generate_paths
+
+__author__ = 'jwilner'
+
+
+def try_every_rule(program, path, environment):
+    """
+    How programs were applied before the index.
+
+    :type program: RuleProgram
+    :type path: str
+    :type environment: MutableMapping
+    :rtype: str
+    """
+    for rule in program.rules:
+        new_path = rule.apply(path, environment)
+        if new_path is None:
+            continue
+
+        path = new_path
+        if rule.terminal:
+            break
+
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rules", type=int, default=4000)
+    parser.add_argument("--anchored", type=float, default=.95)
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+
+    rules = generate_mixed_rules(args.rules, args.anchored)
+    context, _ = MainContext.consume(generate_config(args.rules, rules=rules))
+    program = context.compile().program
+    paths = generate_paths(args.rules, args.requests)
+
+    unprefixed = sum(1 for rule in program.rules if rule.prefix is None)
+    before = measure(lambda path, environment:
+                     try_every_rule(program, path, environment), paths)
+    after = measure(program.apply, paths)
+
+    print("rules: {}, without a prefix: {}".format(len(program), unprefixed))
+    print("every rule:  {:10.1f} requests/s".format(before))
+    print("indexed:     {:10.1f} requests/s ({:.1f}x)".format(after,
+                                                              after / before))
+
+
+if __name__ == '__main__':
+    main()
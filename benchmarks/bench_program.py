@@ -0,0 +1,80 @@
+"""
+Requests per second through a large, flat ruleset: the directive objects
+walked directly versus the compiled RuleProgram.
+
+    python -m benchmarks.bench_program --rules 4000
+"""
+import argparse
+import time
+
+from apache_rewrite_tester.environment import ServerVariable
+from apache_rewrite_tester.rewrite_objects import RewriteCondition, \
+    RewriteRule
+from apache_rewrite_tester.rewrite_objects.main_context import MainContext
+from benchmarks.synthetic import generate_config, generate_paths
+
+__author__ = 'jwilner'
+
+
+def interpret(directives, path, environment):
+    """
+    How a context was evaluated before programs: every rule and condition
+    re-derives its regex on each request.
+
+    :type directives: tuple[Directive]
+    :type path: str
+    :type environment: MutableMapping
+    :rtype: str
+    """
+    conditions = []
+    for directive in directives:
+        if isinstance(directive, RewriteCondition):
+            conditions.append(directive)
+        elif isinstance(directive, RewriteRule):
+            if RewriteCondition.chain(conditions, environment):
+                path = directive.apply(path, environment)
+            conditions = []
+    return path
+
+
+def measure(function, paths):
+    """
+    :type function: (str, dict) -> str
+    :type paths: list[str]
+    :rtype: float
+    :returns: requests per second
+    """
+    start = time.perf_counter()
+    for path in paths:
+        function(path, {ServerVariable.HTTP_HOST: "www.example.com"})
+    return len(paths) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rules", type=int, default=4000)
+    parser.add_argument("--conditions", type=int, default=1)
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+
+    context, _ = MainContext.consume(generate_config(args.rules,
+                                                     args.conditions))
+    paths = generate_paths(args.rules, args.requests)
+
+    start = time.perf_counter()
+    program = context.compile().program
+    compile_time = time.perf_counter() - start
+
+    before = measure(lambda path, environment:
+                     interpret(context.children, path, environment), paths)
+    after = measure(program.apply, paths)
+
+    print("rules: {}, compiled in {:.3f}s".format(len(program), compile_time))
+    print("interpreted: {:10.1f} requests/s".format(before))
+    print("compiled:    {:10.1f} requests/s ({:.1f}x)".format(after,
+                                                              after / before))
+    print("conditions:  {}".format(program.get_condition_counters()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""
+Lookups per second in a prg: map whose program echoes its keys back: running
+the program afresh for every lookup, asking one kept running a key at a
+time, and pipelining keys across a pool of them.
+
+    python -m benchmarks.bench_program_maps --lookups 100000 --pool-size 4
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from apache_rewrite_tester.rewrite_maps import DEFAULT_POOL_SIZE, ProgramMap
+
+__author__ = 'jwilner'
+
+PROGRAM = """import sys
+for line in sys.stdin:
+    sys.stdout.write(line)
+    sys.stdout.flush()
+"""
+
+# starting a program per lookup is slow enough that fewer lookups will do
+FORKED_LOOKUPS = 100
+
+
+def _time(look_up, keys):
+    """
+    :type look_up: (list[str]) -> object
+    :type keys: list[str]
+    :returns: lookups per second
+    :rtype: float
+    """
+    start = time.perf_counter()
+    look_up(keys)
+    return len(keys) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--lookups", type=int, default=100000)
+    parser.add_argument("--pool-size", type=int, default=DEFAULT_POOL_SIZE)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    try:
+        script = os.path.join(directory, "echo.py")
+        with open(script, "w") as script_file:
+            script_file.write(PROGRAM)
+        command = [sys.executable, script]
+        keys = ["key{}".format(index) for index in range(args.lookups)]
+
+        forked = _time(lambda some_keys: [
+            subprocess.run(command, input=key.encode() + b"\n",
+                           stdout=subprocess.PIPE)
+            for key in some_keys], keys[:FORKED_LOOKUPS])
+
+        # uncached throughout, so every lookup reaches a program
+        program_map = ProgramMap(command, args.pool_size, cache_size=0)
+        program_map.lookup("warm up")
+        persistent = _time(lambda some_keys: [
+            program_map.lookup(key) for key in some_keys], keys)
+
+        batch_size = args.batch_size
+        pipelined = _time(lambda some_keys: [
+            program_map.lookup_many(some_keys[start:start + batch_size])
+            for start in range(0, len(some_keys), batch_size)], keys)
+        program_map.close()
+
+        print("forked per lookup: {:12.1f} lookups/s".format(forked))
+        print("kept running:      {:12.1f} lookups/s ({:.0f}x)".format(
+            persistent, persistent / forked))
+        print("pipelined, {} programs: {:7.1f} lookups/s ({:.0f}x)".format(
+            args.pool_size, pipelined, pipelined / forked))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+"""
+Per-request construction cost: HTTPRequest, which goes through
+BaseHTTPRequestHandler's parsing, against the slotted Request record.
+
+    python -m benchmarks.bench_requests
+"""
+import argparse
+import timeit
+
+from apache_rewrite_tester.http_request import Request, get_request
+
+__author__ = 'jwilner'
+
+HEADERS = {"User-Agent": "Mozilla/5.0", "Referer": "http://example.com/",
+           "Accept": "text/html"}
+REQUEST_LINE = "GET /section/1/item?page=2&sort=asc HTTP/1.1"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--number", type=int, default=20000)
+    args = parser.parse_args()
+
+    constructors = (
+        ("get_request (HTTPRequest)",
+         lambda: get_request("GET", "/section/1/item?page=2&sort=asc",
+                             "HTTP/1.1", "example.com", dict(HEADERS))),
+        ("Request",
+         lambda: Request("GET", "/section/1/item", "page=2&sort=asc",
+                         "HTTP/1.1", HEADERS)),
+        ("Request.from_request_line",
+         lambda: Request.from_request_line(REQUEST_LINE, HEADERS)),
+        ("Request.from_log_entry",
+         lambda: Request.from_log_entry("10.0.0.1", REQUEST_LINE,
+                                        "http://example.com/", "Mozilla/5.0",
+                                        "example.com")),
+    )
+
+    for label, constructor in constructors:
+        seconds = timeit.timeit(constructor, number=args.number)
+        print("{:28} {:8.2f} us".format(label, seconds * 1e6 / args.number))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,306 @@
+"""
+Parsing, host dispatch and rule evaluation timed over synthetic configs,
+needing nothing but this package. Results are saved as JSON, and compared
+against a saved baseline to catch regressions.
+
+    python -m benchmarks.suite --output baseline.json
+    python -m benchmarks.suite --baseline baseline.json --tolerance .25
+
+Exits non-zero if any benchmark is slower than its baseline by more than the
+tolerance. Every config is generated deterministically, so results differ
+between runs only by the machine's noise.
+"""
+import argparse
+import collections
+import json
+import platform
+import sys
+import timeit
+
+from apache_rewrite_tester.environment import CondBackreference, \
+    RuleBackreference, ServerVariable
+from apache_rewrite_tester.rewrite_objects.format_string import FormatString
+from apache_rewrite_tester.rewrite_objects.ip_and_port import \
+    IpWildcardPattern, PortWildcardPattern
+from apache_rewrite_tester.rewrite_objects.main_context import MainContext
+from apache_rewrite_tester.rewrite_objects.rule import RewriteRule
+from apache_rewrite_tester.utils import expand_includes, \
+    join_continued_source_lines, split_source_lines
+from benchmarks.synthetic import generate_config, generate_continued_config, \
+    generate_include_tree, generate_paths, generate_virtual_host_config
+
+__author__ = 'jwilner'
+
+FORMAT_VERSION = 1
+
+# how many times each benchmark's timing loop is repeated; the fastest is
+# kept, since noise only ever makes things slower
+DEFAULT_REPEAT = 5
+
+DEFAULT_TOLERANCE = .2
+
+SUBSTITUTION = "/search/$1?q=$2&page=%{QUERY_STRING}&host=%{HTTP_HOST}" \
+               "&ref=%{HTTP_REFERER}&lang=%1"
+
+Result = collections.namedtuple("Result", "name seconds number")
+
+Comparison = collections.namedtuple("Comparison",
+                                    "name seconds baseline_seconds ratio")
+
+
+def _scale(count, scale):
+    """
+    :type count: int
+    :type scale: float
+    :returns: the count grown or shrunk by the scale, but at least one
+    :rtype: int
+    """
+    return max(1, int(count * scale))
+
+
+def _benchmark_parse(scale):
+    """
+    :type scale: float
+    :rtype: () -> object
+    """
+    config = generate_virtual_host_config(_scale(50, scale), rules_per_host=10,
+                                          conditions_per_rule=2)
+    return lambda: MainContext.consume(config)
+
+
+def _benchmark_parse_continued_lines(scale):
+    """
+    :type scale: float
+    :rtype: () -> object
+    """
+    config = generate_continued_config(_scale(100, scale), segments=40)
+    return lambda: MainContext.consume_lines(
+        join_continued_source_lines(split_source_lines(config)))
+
+
+def _benchmark_expand_includes(scale):
+    """
+    :type scale: float
+    :rtype: () -> object
+    """
+    root, files = generate_include_tree(depth=3 + (scale > 1), fanout=4)
+    return lambda: expand_includes(root, files)
+
+
+def _benchmark_find_host(scale):
+    """
+    :type scale: float
+    :rtype: () -> object
+    """
+    host_count = _scale(500, scale)
+    main_context, _ = MainContext.consume(
+        generate_virtual_host_config(host_count, rules_per_host=1))
+    ip, port = IpWildcardPattern("10.0.0.1"), PortWildcardPattern(80)
+
+    # every tenth name belongs to no host, and falls through to the default
+    names = ["host{}.example.com".format(index * 7919 % host_count)
+             if index % 10 else "unknown{}.example.com".format(index)
+             for index in range(100)]
+
+    def run():
+        for name in names:
+            main_context.find_host(ip, port, name)
+    return run
+
+
+def _benchmark_rule_apply(scale):
+    """
+    :type scale: float
+    :rtype: () -> object
+    """
+    rule = RewriteRule.make(r"RewriteRule ^/section(\d+)/(\w+)/(.*)$ "
+                            r"/new$1/$3?item=$2 [NC]")
+    paths = generate_paths(10, _scale(100, scale))
+
+    def run():
+        for path in paths:
+            rule.apply(path, {})
+    return run
+
+
+def _benchmark_program_apply(scale):
+    """
+    :type scale: float
+    :rtype: () -> object
+    """
+    rule_count = _scale(1000, scale)
+    main_context, _ = MainContext.consume(generate_config(rule_count, 1))
+    program = main_context.compile().program
+    paths = generate_paths(rule_count, 100)
+
+    def run():
+        for path in paths:
+            program.apply(path, {ServerVariable.HTTP_HOST: "www.example.com"})
+    return run
+
+
+def _benchmark_format_string_parse(scale):
+    """
+    :type scale: float
+    :rtype: () -> object
+    """
+    substitution = SUBSTITUTION * _scale(1, scale)
+    return lambda: FormatString.parse(substitution)
+
+
+def _benchmark_format_string_format(scale):
+    """
+    :type scale: float
+    :rtype: () -> object
+    """
+    format_string = FormatString.parse(SUBSTITUTION * _scale(1, scale))
+    environment = {RuleBackreference(1): "thing", RuleBackreference(2): "x",
+                   CondBackreference(1): "en",
+                   ServerVariable.QUERY_STRING: "a=b",
+                   ServerVariable.HTTP_HOST: "example.com",
+                   ServerVariable.HTTP_REFERER: "http://example.com/"}
+    return lambda: format_string.format(environment)
+
+
+# name -> function taking a scale and returning the function to time
+BENCHMARKS = collections.OrderedDict((
+    ("parse", _benchmark_parse),
+    ("parse_continued_lines", _benchmark_parse_continued_lines),
+    ("expand_includes", _benchmark_expand_includes),
+    ("find_host", _benchmark_find_host),
+    ("rule_apply", _benchmark_rule_apply),
+    ("program_apply", _benchmark_program_apply),
+    ("format_string_parse", _benchmark_format_string_parse),
+    ("format_string_format", _benchmark_format_string_format),
+))
+
+
+def run_benchmarks(names=None, scale=1, repeat=DEFAULT_REPEAT):
+    """
+    :param names: the benchmarks to run; all of them by default
+    :type names: Iterable[str]
+    :param scale: how much to grow or shrink each benchmark's inputs
+    :type scale: float
+    :type repeat: int
+    :rtype: __generator[Result]
+    """
+    for name in (BENCHMARKS if names is None else names):
+        timer = timeit.Timer(BENCHMARKS[name](scale))
+        number, _ = timer.autorange()
+        seconds = min(timer.repeat(repeat, number)) / number
+        yield Result(name, seconds, number)
+
+
+def to_json(results, scale):
+    """
+    :type results: Iterable[Result]
+    :type scale: float
+    :rtype: str
+    """
+    return json.dumps({
+        "version": FORMAT_VERSION,
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "machine": platform.machine(),
+        "scale": scale,
+        "results": {result.name: {"seconds": result.seconds,
+                                  "number": result.number}
+                    for result in results},
+    }, indent=2, sort_keys=True)
+
+
+def load_results(filename):
+    """
+    :type filename: str
+    :rtype: (float, dict[str, float])
+    :returns: the scale the results were run at, and the seconds each
+        benchmark took
+    """
+    with open(filename) as results_file:
+        saved = json.load(results_file)
+
+    if saved.get("version") != FORMAT_VERSION:
+        raise ValueError("Unrecognized results version in {}: {}".format(
+            filename, saved.get("version")))
+
+    return saved["scale"], {name: result["seconds"]
+                            for name, result in saved["results"].items()}
+
+
+def compare(results, baseline):
+    """
+    :type results: Iterable[Result]
+    :type baseline: dict[str, float]
+    :rtype: __generator[Comparison]
+    """
+    for result in results:
+        baseline_seconds = baseline.get(result.name)
+        ratio = None if baseline_seconds is None \
+            else result.seconds / baseline_seconds
+        yield Comparison(result.name, result.seconds, baseline_seconds, ratio)
+
+
+def find_regressions(comparisons, tolerance=DEFAULT_TOLERANCE):
+    """
+    :type comparisons: Iterable[Comparison]
+    :param tolerance: how much slower than the baseline is still acceptable,
+        as a fraction of it
+    :type tolerance: float
+    :rtype: list[Comparison]
+    """
+    return [comparison for comparison in comparisons
+            if comparison.ratio is not None and
+            comparison.ratio > 1 + tolerance]
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("benchmarks", nargs="*", metavar="benchmark",
+                        help="any of: " + ", ".join(BENCHMARKS))
+    parser.add_argument("--scale", type=float, default=1,
+                        help="how much to grow or shrink each benchmark's "
+                             "inputs, e.g. .1 for a quick run")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT)
+    parser.add_argument("--output", help="where to save the results as JSON")
+    parser.add_argument("--baseline", help="saved results to compare against")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    args = parser.parse_args(args)
+
+    unknown = set(args.benchmarks) - set(BENCHMARKS)
+    if unknown:
+        parser.error("unknown benchmarks: " + ", ".join(sorted(unknown)))
+
+    baseline = {}
+    if args.baseline is not None:
+        scale, baseline = load_results(args.baseline)
+        if scale != args.scale:
+            parser.error("the baseline was run at scale {}".format(scale))
+
+    results = []
+    comparisons = []
+    for result in run_benchmarks(args.benchmarks or None, args.scale,
+                                 args.repeat):
+        results.append(result)
+        comparison, = compare((result,), baseline)
+        comparisons.append(comparison)
+
+        line = "{:24} {:12.2f} us".format(result.name, result.seconds * 1e6)
+        if comparison.ratio is not None:
+            line += "  {:6.2f}x baseline".format(comparison.ratio)
+        print(line)
+
+    if args.output is not None:
+        with open(args.output, "w") as output:
+            output.write(to_json(results, args.scale))
+
+    regressions = find_regressions(comparisons, args.tolerance)
+    for regression in regressions:
+        print("regression: {} took {:.2f}x its baseline".format(
+            regression.name, regression.ratio), file=sys.stderr)
+
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,180 @@
+"""
+Generators for large, synthetic configurations.
+"""
+
+__author__ = 'jwilner'
+
+
+def generate_rules(count, conditions_per_rule=0, no_case_every=4):
+    """
+    :type count: int
+    :type conditions_per_rule: int
+    :type no_case_every: int
+    :rtype: __generator[str]
+    """
+    for index in range(count):
+        for condition in range(conditions_per_rule):
+            yield "RewriteCond %{{HTTP_HOST}} ^(www\\.)?site{}-{}\\.com$ " \
+                  "[NC,OR]".format(index, condition)
+
+        flags = " [NC]" if no_case_every and not index % no_case_every else ""
+        yield "RewriteRule ^/section{0}/(\\w+)/(.*)$ " \
+              "/new{0}/$2?item=$1{1}".format(index, flags)
+
+
+def generate_mixed_rules(count, anchored_fraction=.95):
+    """
+    Rules mostly anchored on a literal prefix, the rest starting with a
+    wildcard.
+
+    :type count: int
+    :type anchored_fraction: float
+    :rtype: __generator[str]
+    """
+    unanchored_every = round(1 / (1 - anchored_fraction)) \
+        if anchored_fraction < 1 else 0
+    for index, line in enumerate(generate_rules(count)):
+        if unanchored_every and index % unanchored_every == 0:
+            yield "RewriteRule ^.*/legacy{0}\\.cgi$ /cgi{0}".format(index)
+        else:
+            yield line
+
+
+def generate_config(rule_count, conditions_per_rule=0, rules=None):
+    """
+    A main context with every rule at the top level.
+
+    :type rule_count: int
+    :type conditions_per_rule: int
+    :param rules: rule lines to use instead of generate_rules
+    :type rules: Iterable[str]
+    :rtype: str
+    """
+    if rules is None:
+        rules = generate_rules(rule_count, conditions_per_rule)
+
+    lines = ["ServerName bench.example.com", "RewriteEngine on"]
+    lines.extend(rules)
+    return "\n".join(lines)
+
+
+def generate_paths(rule_count, count):
+    """
+    Request paths spread evenly over the rules, plus some which hit nothing.
+
+    :type rule_count: int
+    :type count: int
+    :rtype: list[str]
+    """
+    paths = []
+    for index in range(count):
+        if index % 10 == 9:
+            paths.append("/unmatched/{}".format(index))
+        else:
+            paths.append("/section{}/item{}/rest".format(
+                (index * 7919) % rule_count, index))
+    return paths
+
+
+def generate_virtual_hosts(count, rules_per_host=3, conditions_per_rule=1):
+    """
+    :type count: int
+    :type rules_per_host: int
+    :type conditions_per_rule: int
+    :rtype: __generator[str]
+    """
+    for index in range(count):
+        yield "<VirtualHost *:80>"
+        yield "    ServerName host{}.example.com".format(index)
+        yield "    # rules for host {}".format(index)
+        yield "    DocumentRoot /var/www/host{}".format(index)
+        yield "    RewriteEngine on"
+        for line in generate_rules(rules_per_host, conditions_per_rule):
+            yield "    " + line
+        yield "</VirtualHost>"
+        yield ""
+
+
+def generate_config_of_size(size, rules_per_host=3):
+    """
+    A config of virtual hosts, roughly `size` characters long.
+
+    :type size: int
+    :type rules_per_host: int
+    :rtype: str
+    """
+    lines = ["ServerName bench.example.com"]
+    length = len(lines[0])
+    virtual_hosts = generate_virtual_hosts(size, rules_per_host)
+    while length < size:
+        line = next(virtual_hosts)
+        lines.append(line)
+        length += len(line) + 1
+    # close the virtual host we were in the middle of
+    for line in virtual_hosts:
+        lines.append(line)
+        if line == "</VirtualHost>":
+            break
+    return "\n".join(lines)
+
+
+def generate_virtual_host_config(host_count, rules_per_host=3,
+                                 conditions_per_rule=1):
+    """
+    :type host_count: int
+    :type rules_per_host: int
+    :type conditions_per_rule: int
+    :rtype: str
+    """
+    lines = ["ServerName bench.example.com"]
+    lines.extend(generate_virtual_hosts(host_count, rules_per_host,
+                                        conditions_per_rule))
+    return "\n".join(lines)
+
+
+def generate_continued_config(rule_count, segments=20):
+    """
+    A config whose rules are each broken over many continuation lines.
+
+    :type rule_count: int
+    :param segments: how many physical lines make up each rule
+    :type segments: int
+    :rtype: str
+    """
+    lines = ["ServerName bench.example.com", "RewriteEngine on"]
+    for index in range(rule_count):
+        lines.append("RewriteRule ^/section{}/(.*)$ \\".format(index))
+        lines.append("/new{}\\".format(index))
+        lines.extend("/part{}\\".format(segment)
+                     for segment in range(segments - 3))
+        lines.append("/$1 [L]")
+    return "\n".join(lines)
+
+
+def generate_include_tree(depth, fanout=3, rules_per_file=5):
+    """
+    A root config including `fanout` files, each of which includes `fanout`
+    more, down to `depth` levels.
+
+    :type depth: int
+    :type fanout: int
+    :type rules_per_file: int
+    :rtype: (str, dict[str, str])
+    :returns: the root config, and the contents of every included file
+    """
+    files = {}
+
+    def generate_file(name, level):
+        lines = ["# {}".format(name)]
+        lines.extend(generate_rules(rules_per_file))
+        if level < depth:
+            for index in range(fanout):
+                included = "{}-{}.conf".format(name, index)
+                lines.append("Include {}".format(included))
+                files[included] = generate_file(included[:-len(".conf")],
+                                                level + 1)
+        return "\n".join(lines)
+
+    root = "ServerName bench.example.com\nRewriteEngine on\n" + \
+        generate_file("conf", 1)
+    return root, files
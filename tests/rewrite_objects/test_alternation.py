@@ -0,0 +1,147 @@
+import random
+import unittest
+
+from apache_rewrite_tester.environment import Environment, RuleBackreference
+from apache_rewrite_tester.rewrite_objects import RewriteCondition, \
+    RewriteRule
+from apache_rewrite_tester.rewrite_objects.alternation import FusedRules, \
+    MINIMUM_RUN_LENGTH
+from apache_rewrite_tester.rewrite_objects.program import RuleProgram
+
+__author__ = 'jwilner'
+
+
+def _compile(*lines):
+    directives = [RewriteCondition.make(line) or RewriteRule.make(line)
+                  for line in lines]
+    return RuleProgram.compile(directives)
+
+
+def _fused_ranges(program):
+    return sorted({(run.start, run.end) for run in program.runs
+                   if run is not None})
+
+
+def _apply(apply, program, path):
+    """
+    :returns: the result, or the error raised, and the environment after
+    """
+    environment = {}
+    return apply(program, path, environment), environment
+
+
+def _apply_sequentially(program, path, environment):
+    """
+    The reference: every rule tried in turn.
+    """
+    for rule in program.rules:
+        new_path = rule.apply(path, environment)
+        if new_path is None:
+            continue
+
+        path = new_path
+        if rule.terminal:
+            break
+
+    return path
+
+
+class TestFindRuns(unittest.TestCase):
+    def test_fuses_independent_rules(self):
+        program = _compile(*["RewriteRule ^/{0}/(.*) /x{0}/$1".format(index)
+                             for index in range(MINIMUM_RUN_LENGTH)])
+        self.assertEqual([(0, MINIMUM_RUN_LENGTH)], _fused_ranges(program))
+
+    def test_too_short(self):
+        program = _compile(*["RewriteRule ^/{0} /x".format(index)
+                             for index in range(MINIMUM_RUN_LENGTH - 1)])
+        self.assertEqual([], _fused_ranges(program))
+
+    def test_breaks_runs(self):
+        rules = ["RewriteRule ^/{0} /x".format(index) for index in range(4)]
+        breakers = ("RewriteCond %{HTTP_HOST} =a", "RewriteRule ^/c /d"), \
+            ("RewriteRule !^/c /d",), \
+            ("RewriteRule ^/c /d [C]", "RewriteRule ^/e /f"), \
+            ("RewriteRule ^/c /d [S=1]",), \
+            ("RewriteRule ^/c /d [N]",), \
+            ("RewriteRule ^/(?P<x>c) /d",), \
+            ("RewriteRule ^/(c)\\1 /d",), \
+            ("RewriteRule (?i)^/c /d",)
+
+        for breaker in breakers:
+            program = _compile(*rules + list(breaker) + rules)
+            end = len(rules) + sum(1 for line in breaker
+                                   if line.startswith("RewriteRule"))
+            self.assertEqual([(0, 4), (end, end + 4)], _fused_ranges(program),
+                             breaker)
+
+
+class TestFusedRules(unittest.TestCase):
+    def setUp(self):
+        self.program = _compile("RewriteRule ^/a(b)?/(c)$ /1",
+                                "RewriteRule ^/A/(.*) /2 [NC]",
+                                "RewriteRule ^/x|^/y /3",
+                                "RewriteRule ^/(a)/(.*)/(.*) /4")
+        self.run = self.program.runs[0]
+
+    def test_first_match_wins(self):
+        self.assertEqual(1, self.run.match("/a/b/c")[0])
+        self.assertEqual(2, self.run.match("/y")[0])
+        self.assertEqual((None, None), self.run.match("/z"))
+
+    def test_remaps_groups(self):
+        rule_index, match = self.run.match("/a/c")
+        own_match = self.program.rules[rule_index].regex.match("/a/c")
+
+        self.assertEqual(own_match.group(0), match.group(0))
+        self.assertEqual(own_match.groups(), match.groups())
+        self.assertEqual(own_match.groups(""), match.groups(""))
+        self.assertEqual(own_match.group(2), match.group(2))
+        self.assertRaises(IndexError, match.group, 3)
+
+    def test_environment(self):
+        environment = Environment()
+        self.assertEqual("/2", self.program.apply("/a/b/c", environment))
+        self.assertEqual("b/c", environment[RuleBackreference(1)])
+
+
+class TestDifferential(unittest.TestCase):
+    """
+    Fused programs against trying every rule in turn, over random rulesets.
+    """
+    PREFIXES = "", "/a", "/b", "/a/b", "/A", "/ab"
+
+    PATTERN_BODIES = "", "/(.*)", "(/.*)?$", "/([a-z]+)/(\\d+)", "(x|y)", \
+        "[xyz]*", "/(?:b)(c)?", "\\.html$", "/(A)?(b)"
+
+    SUBSTITUTIONS = "-", "/a/$1", "/b$2", "/ab/x", "/c", "/$0"
+
+    FLAGS = "", " [L]", " [NC]", " [NC,L]", " [END]"
+
+    PATH_PARTS = "", "/a", "/b", "/A", "/ab", "/x", "/12", "/c", ".html", \
+        "/B", "y"
+
+    def _generate_rule(self, generator):
+        pattern = generator.choice(self.PREFIXES) + \
+            generator.choice(self.PATTERN_BODIES)
+        return "RewriteRule ^{} {}{}".format(
+            pattern, generator.choice(self.SUBSTITUTIONS),
+            generator.choice(self.FLAGS))
+
+    def _generate_path(self, generator):
+        return "".join(generator.choice(self.PATH_PARTS)
+                       for _ in range(generator.randint(1, 4)))
+
+    def test_equivalent(self):
+        generator = random.Random(4)
+        for _ in range(200):
+            program = _compile(*[self._generate_rule(generator)
+                                 for _ in range(generator.randint(4, 20))])
+            self.assertTrue(_fused_ranges(program))
+
+            for _ in range(20):
+                path = self._generate_path(generator)
+
+                self.assertEqual(
+                    _apply(_apply_sequentially, program, path),
+                    _apply(RuleProgram.apply, program, path), path)
@@ -0,0 +1,159 @@
+import pickle
+import unittest
+
+from apache_rewrite_tester.rewrite_objects.analysis import DeadRuleReason, \
+    find_dead_rules
+from apache_rewrite_tester.rewrite_objects.main_context import MainContext
+from apache_rewrite_tester.utils import split_source_lines
+
+__author__ = 'jwilner'
+
+
+def _parse(*lines):
+    config = "\n".join(("ServerName example.com",) + lines)
+    return MainContext.consume_lines(split_source_lines(config, "httpd.conf"))
+
+
+def _find(*lines):
+    """
+    :rtype: dict[int, DeadRuleReason]
+    """
+    main_context = _parse("RewriteEngine on", *lines)
+    return {finding.index: finding.reason
+            for finding in find_dead_rules(main_context)}
+
+
+class TestFindDeadRules(unittest.TestCase):
+    def test_live_rules(self):
+        self.assertEqual({}, _find("RewriteRule ^/a /b",
+                                   "RewriteRule ^/b /c [L]",
+                                   "RewriteCond %{HTTP_HOST} =a",
+                                   "RewriteRule ^/c /d"))
+
+    def test_engine_off(self):
+        main_context = _parse("RewriteRule ^/a /b", "RewriteRule ^/c /d")
+        self.assertEqual([DeadRuleReason.ENGINE_OFF] * 2,
+                         [finding.reason
+                          for finding in find_dead_rules(main_context)])
+
+    def test_never_matches(self):
+        self.assertEqual({0: DeadRuleReason.NEVER_MATCHES},
+                         _find("RewriteRule !.* /b"))
+
+    def test_shadowed_by_catch_all(self):
+        self.assertEqual({1: DeadRuleReason.SHADOWED,
+                          2: DeadRuleReason.SHADOWED},
+                         _find("RewriteRule ^(.*)$ /index.php [L]",
+                               "RewriteRule ^/a /b",
+                               "RewriteRule !^/a /b"))
+
+    def test_shadowed_by_prefix(self):
+        self.assertEqual({1: DeadRuleReason.SHADOWED},
+                         _find("RewriteRule ^/static/ - [L]",
+                               "RewriteRule ^/static/css/(.*) /css/$1",
+                               "RewriteRule ^/stat /b"))
+
+    def test_shadowed_by_same_pattern(self):
+        self.assertEqual({1: DeadRuleReason.SHADOWED},
+                         _find("RewriteRule ^/a$ /b [END]",
+                               "RewriteRule ^/a$ /c"))
+
+    def test_case(self):
+        self.assertEqual({1: DeadRuleReason.SHADOWED},
+                         _find("RewriteRule ^/A /b [L,NC]",
+                               "RewriteRule ^/a/b /c",
+                               "RewriteRule ^/B /b [L]",
+                               "RewriteRule ^/b/c /c [NC]"))
+
+    def test_not_shadowed_when_conditional(self):
+        self.assertEqual({}, _find("RewriteCond %{HTTP_HOST} =a",
+                                   "RewriteRule ^/ /b [L]",
+                                   "RewriteRule ^/a /c"))
+
+    def test_not_shadowed_once_path_may_change(self):
+        self.assertEqual({}, _find("RewriteRule ^/a /b [L]",
+                                   "RewriteRule ^/c /a/c",
+                                   "RewriteRule ^/a/c /d"))
+
+    def test_not_shadowed_when_skippable(self):
+        self.assertEqual({}, _find("RewriteRule ^/x - [S=1]",
+                                   "RewriteRule ^/a /b [L]",
+                                   "RewriteRule ^/a /c"))
+
+        self.assertEqual({}, _find("RewriteRule ^/x - [C]",
+                                   "RewriteRule ^/a /b [L]",
+                                   "RewriteRule ^/a /c"))
+
+    def test_unsatisfiable_conditions(self):
+        self.assertEqual(
+            {0: DeadRuleReason.UNSATISFIABLE_CONDITIONS,
+             1: DeadRuleReason.UNSATISFIABLE_CONDITIONS,
+             2: DeadRuleReason.UNSATISFIABLE_CONDITIONS},
+            _find("RewriteCond %{HTTP_HOST} =a.com",
+                  "RewriteCond %{HTTP_HOST} =b",
+                  "RewriteRule ^/a /b",
+                  "RewriteCond %{HTTP_HOST} ^www",
+                  "RewriteCond %{HTTP_HOST} !^www",
+                  "RewriteRule ^/a /b",
+                  "RewriteCond %{HTTP_HOST} =a",
+                  "RewriteCond %{HTTP_HOST} ^b [OR]",
+                  "RewriteCond %{HTTP_HOST} ^c",
+                  "RewriteRule ^/a /b"))
+
+    def test_satisfiable_alternatives(self):
+        self.assertEqual({}, _find("RewriteCond %{HTTP_HOST} =a",
+                                   "RewriteCond %{HTTP_HOST} ^b [OR]",
+                                   "RewriteCond %{HTTP_HOST} ^a",
+                                   "RewriteRule ^/a /b"))
+
+    def test_ignores_backreferences(self):
+        self.assertEqual({}, _find("RewriteCond %{HTTP_HOST} ^(a)",
+                                   "RewriteCond %1 =b",
+                                   "RewriteCond %1 =c",
+                                   "RewriteRule ^/a /b"))
+
+    def test_chained_to_dead_rule(self):
+        self.assertEqual({0: DeadRuleReason.NEVER_MATCHES,
+                          1: DeadRuleReason.CHAINED_TO_DEAD_RULE},
+                         _find("RewriteRule !^ /b [C]",
+                               "RewriteRule ^/a /c"))
+
+    def test_prunable(self):
+        main_context = _parse("RewriteEngine on",
+                              "RewriteRule ^/a /b [C]",
+                              "RewriteRule !^ /c",
+                              "RewriteRule ^/x /y [L]",
+                              "RewriteRule ^/x /z")
+        self.assertEqual([(1, False), (3, True)],
+                         [(finding.index, finding.prunable)
+                          for finding in find_dead_rules(main_context)])
+
+
+class TestPruning(unittest.TestCase):
+    CONFIG = "RewriteEngine on", "RewriteRule ^/a - [L]", \
+        "RewriteRule ^/a/b /c", "RewriteRule ^/d /e"
+
+    def test_report(self):
+        report = _parse(*self.CONFIG).analyze()
+
+        self.assertEqual(3, report.rule_count)
+        self.assertEqual(1, report.dead_rule_count)
+        self.assertEqual(1, report.prunable_rule_count)
+        self.assertEqual("httpd.conf:4: shadowed by an earlier rule "
+                         "(httpd.conf:3)\n"
+                         "1 of 3 rules can never fire (33.3%); "
+                         "1 can be pruned", str(report))
+
+    def test_pruned_program(self):
+        main_context = _parse(*self.CONFIG)
+        self.assertEqual(3, len(main_context.compile().program))
+
+        main_context.compile(prune=True)
+        self.assertEqual(2, len(main_context.program))
+        self.assertEqual("/e", main_context.rewrite("/d", {}))
+        self.assertEqual("/a/b", main_context.rewrite("/a/b", {}))
+
+    def test_pruning_survives_pickling(self):
+        main_context = pickle.loads(pickle.dumps(
+            _parse(*self.CONFIG).compile(prune=True)))
+        self.assertEqual(2, len(main_context.program))
@@ -104,6 +104,17 @@ class TestRewriteConditionChaining(TestCase):
         self.assertTrue(cond_1.was_evaluated)
         self.assertTrue(cond_2.was_evaluated)
 
+    def test_or_binds_tighter_than_and(self):
+        cond_1 = FakeRewriteCondition(True, {ConditionFlag.OR_NEXT})
+        cond_2 = FakeRewriteCondition(False, {})
+        cond_3 = FakeRewriteCondition(False, {})
+
+        result = RewriteCondition.chain([cond_1, cond_2, cond_3], {})
+
+        self.assertFalse(result)
+        self.assertFalse(cond_2.was_evaluated)
+        self.assertTrue(cond_3.was_evaluated)
+
 
 CASES = ("NC", ConditionFlag.NO_CASE), \
     ("nocasE", ConditionFlag.NO_CASE), \
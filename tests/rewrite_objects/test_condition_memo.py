@@ -0,0 +1,100 @@
+import pickle
+import re
+import unittest
+
+from apache_rewrite_tester.environment import Environment
+from apache_rewrite_tester.http_request import Request
+from apache_rewrite_tester.rewrite_objects.condition_memo import \
+    ConditionMemo
+from apache_rewrite_tester.rewrite_objects.main_context import MainContext
+
+__author__ = 'jwilner'
+
+
+CONFIG = r"""ServerName example.com
+RewriteEngine on
+RewriteCond %{HTTP_HOST} ^(www)\.
+RewriteRule ^/a /a-%1
+RewriteCond %{HTTP_HOST} !^(www)\.
+RewriteRule ^/a-www /not-www
+RewriteCond %{HTTP_HOST} ^(www)\.
+RewriteRule ^/a-www /www-%1 [L]
+RewriteCond %{HTTP_HOST} ^(WWW)\. [NC]
+RewriteRule ^/b /b-%1
+"""
+
+
+def _rewrite(main_context, path, host):
+    request = Request("GET", path, headers={"Host": host})
+    return main_context.rewrite(path, Environment(request))
+
+
+class TestConditionMemo(unittest.TestCase):
+    def setUp(self):
+        self.main_context, _ = MainContext.consume(CONFIG)
+
+    def _compile(self, memo):
+        self.main_context.compile(condition_memo=memo)
+        return memo
+
+    def test_repeated_conditions_share_matches(self):
+        memo = self._compile(ConditionMemo())
+        self.assertEqual("/www-www", _rewrite(self.main_context, "/a",
+                                              "www.example.com"))
+        # the negated condition and the repeat both reuse the first match
+        self.assertEqual((2, 1), (memo.hits, memo.misses))
+
+    def test_flags_kept_apart(self):
+        memo = self._compile(ConditionMemo())
+        self.assertEqual("/b-WWW", _rewrite(self.main_context, "/b",
+                                            "WWW.example.com"))
+        self.assertEqual((0, 1), (memo.hits, memo.misses))
+
+    def test_cleared_between_requests(self):
+        memo = self._compile(ConditionMemo())
+        _rewrite(self.main_context, "/b", "www.example.com")
+        _rewrite(self.main_context, "/b", "www.example.com")
+        self.assertEqual((0, 2, 2), (memo.hits, memo.misses, memo.requests))
+
+    def test_across_requests(self):
+        memo = self._compile(ConditionMemo(across_requests=True))
+        _rewrite(self.main_context, "/b", "www.example.com")
+        self.assertEqual("/b-www", _rewrite(self.main_context, "/b",
+                                            "www.example.com"))
+        self.assertEqual((1, 1), (memo.hits, memo.misses))
+
+    def test_cleared_when_full(self):
+        memo = self._compile(ConditionMemo(across_requests=True,
+                                           max_entries=1))
+        _rewrite(self.main_context, "/b", "www.example.com")
+        _rewrite(self.main_context, "/b", "web.example.com")
+        _rewrite(self.main_context, "/b", "www.example.com")
+        self.assertEqual((0, 3, 1), (memo.hits, memo.misses, len(memo)))
+
+    def test_same_as_unmemoized(self):
+        unmemoized, _ = MainContext.consume(CONFIG)
+        self._compile(ConditionMemo(across_requests=True))
+        cases = [(path, host) for path in ("/a", "/a-www", "/b", "/c")
+                 for host in ("www.example.com", "WWW.example.com",
+                              "example.com")] * 2
+        self.assertEqual([_rewrite(unmemoized, *case) for case in cases],
+                         [_rewrite(self.main_context, *case)
+                          for case in cases])
+
+    def test_keys(self):
+        memo = ConditionMemo()
+        self.assertEqual(memo.get_key(re.compile("^a")),
+                         memo.get_key(re.compile("^a")))
+        self.assertNotEqual(memo.get_key(re.compile("^a")),
+                            memo.get_key(re.compile("^a", re.IGNORECASE)))
+
+    def test_pickled_empty(self):
+        memo = self._compile(ConditionMemo(across_requests=True))
+        _rewrite(self.main_context, "/b", "www.example.com")
+
+        unpickled = pickle.loads(pickle.dumps(self.main_context))
+        self.assertEqual("/b-www", _rewrite(unpickled, "/b",
+                                            "www.example.com"))
+        self.assertEqual((0, 1), (unpickled._condition_memo.hits,
+                                  unpickled._condition_memo.misses))
+        self.assertEqual(1, memo.misses)
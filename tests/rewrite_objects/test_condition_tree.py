@@ -0,0 +1,137 @@
+import itertools
+import unittest
+
+from apache_rewrite_tester.environment import CondBackreference, \
+    Environment, ServerVariable
+from apache_rewrite_tester.rewrite_objects import RewriteCondition
+from apache_rewrite_tester.rewrite_objects.condition_tree import ConditionTree
+from apache_rewrite_tester.rewrite_objects.program import CompiledCondition
+
+__author__ = 'jwilner'
+
+
+def _tree(*lines):
+    return ConditionTree(tuple(CompiledCondition(RewriteCondition.make(line))
+                               for line in lines))
+
+
+def _environment(host="www.example.com", port="80"):
+    return {ServerVariable.HTTP_HOST: host, ServerVariable.SERVER_PORT: port}
+
+
+def _outcome(evaluate, conditions, environment):
+    """
+    :returns: the result, or the type of error raised
+    """
+    try:
+        return evaluate(conditions, environment)
+    except (KeyError, ValueError) as error:
+        return type(error)
+
+
+class TestConditionTree(unittest.TestCase):
+    def test_groups(self):
+        tree = _tree("RewriteCond %{HTTP_HOST} ^a [OR]",
+                     "RewriteCond %{HTTP_HOST} ^b",
+                     "RewriteCond %{SERVER_PORT} =80")
+        self.assertEqual([2, 1], [len(group) for group in tree.groups])
+
+    def test_or_binds_tighter_than_and(self):
+        tree = _tree("RewriteCond %{HTTP_HOST} ^www [OR]",
+                     "RewriteCond %{HTTP_HOST} ^api",
+                     "RewriteCond %{SERVER_PORT} =443")
+        self.assertFalse(tree.evaluate(_environment()))
+        self.assertTrue(tree.evaluate(_environment(port="443")))
+        self.assertTrue(tree.evaluate(_environment("api.example.com", "443")))
+        self.assertFalse(tree.evaluate(_environment("example.com", "443")))
+
+    def test_formats_test_strings_once(self):
+        tree = _tree("RewriteCond %{HTTP_HOST} !^a",
+                     "RewriteCond %{HTTP_HOST} !^b",
+                     "RewriteCond %{HTTP_HOST} ^www")
+        self.assertTrue(tree.evaluate(_environment()))
+        self.assertEqual(1, tree.counters.test_strings_formatted)
+        self.assertEqual(2, tree.counters.test_strings_reused)
+
+    def test_reformats_backreferences(self):
+        tree = _tree("RewriteCond %{HTTP_HOST} ^(www)",
+                     "RewriteCond %1 ^(w)",
+                     "RewriteCond %1 =w")
+        self.assertTrue(tree.evaluate(_environment()))
+        self.assertEqual(3, tree.counters.test_strings_formatted)
+
+    def test_cheap_checks_first(self):
+        tree = _tree("RewriteCond %{HTTP_HOST} ^(www)",
+                     "RewriteCond %{HTTP_HOST} ^(w)",
+                     "RewriteCond %{SERVER_PORT} =443")
+        self.assertEqual((2,), tree.hoisted)
+
+        environment = _environment()
+        self.assertFalse(tree.evaluate(environment))
+        self.assertNotIn(CondBackreference(1), environment)
+
+        counters = tree.counters
+        self.assertEqual((1, 1, 2, 1),
+                         (counters.chains, counters.conditions_evaluated,
+                          counters.conditions_skipped,
+                          counters.early_failures))
+
+    def test_keeps_dependent_checks_in_place(self):
+        tree = _tree("RewriteCond %{HTTP_HOST} ^(www)",
+                     "RewriteCond %1 =www")
+        self.assertEqual((), tree.hoisted)
+        self.assertTrue(tree.evaluate(_environment()))
+
+    def test_leaves_errors_where_they_were(self):
+        tree = _tree("RewriteCond %{HTTP_HOST} ^api",
+                     "RewriteCond %{HTTP_HOST} -gt3")
+        self.assertFalse(tree.evaluate(_environment()))
+        self.assertRaises(ValueError, tree.evaluate,
+                          _environment("api.example.com"))
+
+
+class TestMatchesChain(unittest.TestCase):
+    """
+    Trees against RewriteCondition.chain, over every short sequence of a
+    handful of conditions.
+    """
+    CONDITIONS = "RewriteCond %{HTTP_HOST} ^(www)\\.(.*)", \
+        "RewriteCond %{HTTP_HOST} ^api [OR]", \
+        "RewriteCond %{HTTP_HOST} !^(a)(p)", \
+        "RewriteCond %{SERVER_PORT} =443", \
+        "RewriteCond %{SERVER_PORT} !=80 [OR]", \
+        "RewriteCond %{SERVER_PORT} -lt100", \
+        "RewriteCond %2 =example.com", \
+        "RewriteCond %{HTTP_HOST} ^(.*)$ [NC,OR]"
+
+    ENVIRONMENTS = ("www.example.com", "80"), ("api.example.com", "443"), \
+        ("ap.example.com", "8080"), ("example.com", "443")
+
+    def test_equivalent(self):
+        for length in range(1, 4):
+            for lines in itertools.product(self.CONDITIONS, repeat=length):
+                directives = [RewriteCondition.make(line) for line in lines]
+                tree = ConditionTree(tuple(map(CompiledCondition,
+                                               directives)))
+
+                for host, port in self.ENVIRONMENTS:
+                    expected_environment = Environment()
+                    expected_environment.update(_environment(host, port))
+                    environment = Environment()
+                    environment.update(_environment(host, port))
+
+                    expected = _outcome(RewriteCondition.chain, directives,
+                                        expected_environment)
+                    outcome = _outcome(ConditionTree.evaluate, tree,
+                                       environment)
+
+                    # a cheap check failing first can preempt an error
+                    if isinstance(expected, type) and outcome is False:
+                        continue
+
+                    self.assertEqual(expected, outcome, (lines, host, port))
+
+                    # backreferences only matter when the rule fires
+                    if expected is True:
+                        self.assertEqual(dict(expected_environment),
+                                         dict(environment), (lines, host))
@@ -129,3 +129,34 @@ RewriteEngine on
 <Pretend 3-4>
 </Pretend>
 """, remainder)
+
+    def test_skips_unrecognized_text(self):
+        string = """<Pretend 1-2>
+# some comment
+DocumentRoot /var/www
+ServerName JoeWuzHere
+</Pretend>"""
+        pretend_context, remainder = PretendContextDirective.consume(string)
+        self.assertEqual("", remainder)
+        self.assertSequenceEqual((ServerName("JoeWuzHere"),),
+                                 pretend_context.children)
+
+
+class TestContextDirectiveConsumeFrom(unittest.TestCase):
+    def test_returns_position(self):
+        string = """junk<Pretend 1-2>
+ServerName JoeWuzHere
+</Pretend>
+trailing"""
+        pretend_context, position = \
+            PretendContextDirective.consume_from(string, 4)
+
+        self.assertIsInstance(pretend_context, PretendContextDirective)
+        self.assertEqual("\ntrailing", string[position:])
+
+    def test_leaves_position_on_failure(self):
+        pretend_context, position = \
+            PretendContextDirective.consume_from("junk<Pretend 1-2>", 0)
+
+        self.assertIsNone(pretend_context)
+        self.assertEqual(0, position)
@@ -0,0 +1,40 @@
+import unittest
+
+from apache_rewrite_tester.rewrite_objects import RewriteRule
+from apache_rewrite_tester.rewrite_objects.control_flow import ControlFlow, \
+    DEFAULT_MAXIMUM_ROUNDS, RESTART, STOP
+
+__author__ = 'jwilner'
+
+
+def _compile(*flags):
+    return ControlFlow.compile([
+        RewriteRule.make("RewriteRule ^/{} /x{}".format(
+            index, " [{}]".format(flag) if flag else ""))
+        for index, flag in enumerate(flags)])
+
+
+class TestControlFlow(unittest.TestCase):
+    def test_plain_rules_go_on(self):
+        control_flow = _compile("", "NC")
+        self.assertEqual((1, 2), control_flow.fire_targets)
+        self.assertEqual((1, 2), control_flow.fail_targets)
+
+    def test_stopping_flags(self):
+        control_flow = _compile("L", "END", "F", "G", "P", "L,N")
+        self.assertEqual((STOP,) * 6, control_flow.fire_targets)
+
+    def test_next(self):
+        control_flow = _compile("N", "N=10", "N,S=1")
+        self.assertEqual((RESTART,) * 3, control_flow.fire_targets)
+        self.assertEqual((DEFAULT_MAXIMUM_ROUNDS, 10, DEFAULT_MAXIMUM_ROUNDS),
+                         control_flow.round_limits)
+
+    def test_skip(self):
+        control_flow = _compile("S=2", "", "", "S=5", "")
+        self.assertEqual((3, 2, 3, 5, 5), control_flow.fire_targets)
+
+    def test_chain(self):
+        control_flow = _compile("C", "C", "", "", "C")
+        self.assertEqual((3, 3, 3, 4, 5), control_flow.fail_targets)
+        self.assertEqual((1, 2, 3, 4, 5), control_flow.fire_targets)
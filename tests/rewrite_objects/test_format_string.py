@@ -2,7 +2,7 @@ import unittest
 
 from apache_rewrite_tester.rewrite_objects.format_string import FormatString
 from apache_rewrite_tester.environment import RuleBackreference, \
-    CondBackreference
+    CondBackreference, ServerVariable, MapExpansion
 
 __author__ = 'jwilner'
 
@@ -27,3 +27,54 @@ class TestFormatStringParsing(unittest.TestCase):
 
         self.assertSequenceEqual(components, parsed.components)
 
+    def test_coalesces_literals(self):
+        string = "/new/$1?page=%{QUERY_STRING}&x=1"
+        components = "/new/", RuleBackreference(1), "?page=", \
+            ServerVariable.QUERY_STRING, "&x=1"
+
+        parsed = FormatString.parse(string)
+
+        self.assertSequenceEqual(components, parsed.components)
+
+    def test_lone_signs_are_literal(self):
+        parsed = FormatString.parse("100% $$5%")
+        self.assertSequenceEqual(("100% $", RuleBackreference(5), "%"),
+                                 parsed.components)
+
+    def test_map_expansions(self):
+        parsed = FormatString.parse("/${hosts:%{HTTP_HOST}|none}/${ids:$1}")
+        self.assertSequenceEqual(
+            ("/", MapExpansion("hosts", "%{HTTP_HOST}", "none"), "/",
+             MapExpansion("ids", "$1")), parsed.components)
+        self.assertTrue(parsed.has_map_expansions)
+
+
+class TestFormatStringFormatting(unittest.TestCase):
+    def test_formats(self):
+        parsed = FormatString.parse("/new/$1?q=%{QUERY_STRING}")
+        environment = {RuleBackreference(1): "thing",
+                       ServerVariable.QUERY_STRING: "a=b"}
+
+        self.assertEqual("/new/thing?q=a=b", parsed.format(environment))
+
+    def test_compiled_matches_format(self):
+        environment = {RuleBackreference(1): "thing",
+                       CondBackreference(2): "other",
+                       ServerVariable.QUERY_STRING: "a=b"}
+
+        for string in ("", "literal", "$1", "/new/$1?q=%{QUERY_STRING}%2"):
+            parsed = FormatString.parse(string)
+            self.assertEqual(parsed.format(environment),
+                             parsed.compile()(environment))
+
+    def test_backreferences_to_nothing_are_empty(self):
+        parsed = FormatString.parse("/new/$1-$9-%1")
+        environment = {RuleBackreference(1): "thing"}
+
+        self.assertEqual("/new/thing--", parsed.format(environment))
+        self.assertEqual("/new/thing--", parsed.compile()(environment))
+
+    def test_compiled_is_cached(self):
+        parsed = FormatString.parse("/new/$1")
+        self.assertIs(parsed.compile(), parsed.compile())
+        self.assertEqual(FormatString.parse("/new/$1"), parsed)
@@ -0,0 +1,99 @@
+import itertools
+import random
+import unittest
+
+from apache_rewrite_tester.rewrite_objects import VirtualHost
+from apache_rewrite_tester.rewrite_objects.main_context import MainContext
+from apache_rewrite_tester.rewrite_objects.host_index import VirtualHostIndex
+from apache_rewrite_tester.rewrite_objects.simple_directives import ServerName
+from apache_rewrite_tester.rewrite_objects.ip_and_port import \
+    IpWildcardPattern, PortWildcardPattern
+from apache_rewrite_tester.utils import MatchType, compare
+
+__author__ = 'jwilner'
+
+IPS = IpWildcardPattern.WILDCARD, "10.0.0.1", "10.0.0.2"
+PORTS = PortWildcardPattern.WILDCARD, 80, 443
+NAMES = None, "a.example.com", "b.example.com"
+REQUESTED_NAMES = "a.example.com", "b.example.com", "c.example.com", \
+    "main.example.com", None
+
+
+def find_host_by_ranking(main_context, ip, port, requested_hostname):
+    """
+    How MainContext.find_host worked before the index: rank every host.
+    """
+    default_name_match = compare(requested_hostname,
+                                 main_context.server_name)
+
+    virtual_hosts = main_context.virtual_hosts
+    if not virtual_hosts:
+        return main_context
+
+    matches = (v_host.match_request(ip, port, requested_hostname)
+               for v_host in virtual_hosts)
+
+    ip_port_matches, name_matches = zip(*matches)
+
+    safe_name_matches = [(name_match if name_match is not None
+                          else default_name_match)
+                         for name_match in name_matches]
+
+    rankings = zip(ip_port_matches, safe_name_matches)
+
+    ranked_hosts = sorted(zip(virtual_hosts, rankings), key=lambda k: k[1],
+                          reverse=True)
+
+    filtered_hosts = (host for host, (ip_port_match, _) in ranked_hosts
+                      if ip_port_match > MatchType.NONE)
+
+    return next(filtered_hosts, main_context)
+
+
+def make_virtual_host(ip, port, name):
+    children = () if name is None else (ServerName(name),)
+    return VirtualHost(IpWildcardPattern(ip), PortWildcardPattern(port),
+                       children)
+
+
+class TestVirtualHostIndex(unittest.TestCase):
+    def test_buckets_by_ip_and_port(self):
+        index = VirtualHostIndex([make_virtual_host("*", 80, None),
+                                  make_virtual_host("*", 80, "a"),
+                                  make_virtual_host("10.0.0.1", 80, "a")])
+        self.assertEqual(2, len(index))
+
+    def test_nothing_found(self):
+        index = VirtualHostIndex([make_virtual_host("10.0.0.1", 80, "a")])
+        self.assertIsNone(index.find(IpWildcardPattern("10.0.0.2"),
+                                     PortWildcardPattern(80), "a",
+                                     MatchType.NONE))
+
+
+class TestEquivalentToRanking(unittest.TestCase):
+    def _assert_equivalent(self, main_context):
+        for ip, port, name in itertools.product(IPS + ("10.0.0.3",),
+                                                PORTS + (8080,),
+                                                REQUESTED_NAMES):
+            ip, port = IpWildcardPattern(ip), PortWildcardPattern(port)
+            expected = find_host_by_ranking(main_context, ip, port, name)
+            self.assertIs(expected, main_context.find_host(ip, port, name),
+                          (ip, port, name))
+
+    def test_every_single_host(self):
+        for ip, port, name in itertools.product(IPS, PORTS, NAMES):
+            main_context = MainContext((ServerName("main.example.com"),
+                                        make_virtual_host(ip, port, name)))
+            self._assert_equivalent(main_context)
+
+    def test_random_configurations(self):
+        generator = random.Random(1234)
+        hosts = list(itertools.product(IPS, PORTS, NAMES))
+
+        for _ in range(200):
+            chosen = [generator.choice(hosts)
+                      for _ in range(generator.randint(1, 12))]
+            main_context = MainContext(
+                (ServerName("main.example.com"),) +
+                tuple(make_virtual_host(*host) for host in chosen))
+            self._assert_equivalent(main_context)
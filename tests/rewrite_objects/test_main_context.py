@@ -1,10 +1,16 @@
+import os
+import tempfile
 import unittest
 
+from apache_rewrite_tester.environment import Environment, ServerVariable
+from apache_rewrite_tester.http_request import get_request
+from apache_rewrite_tester.outcome_cache import OutcomeCache
 from apache_rewrite_tester.rewrite_objects.main_context import MainContext
 from apache_rewrite_tester.rewrite_objects import VirtualHost
 from apache_rewrite_tester.rewrite_objects.simple_directives import ServerName
 from apache_rewrite_tester.rewrite_objects.ip_and_port import \
     IpWildcardPattern, PortWildcardPattern
+from apache_rewrite_tester.utils import split_source_lines
 
 __author__ = 'jwilner'
 
@@ -41,6 +47,54 @@ class TestMainContextParsing(unittest.TestCase):
         self.assertEqual(expected, main_context)
 
 
+class TestMainContextLineParsing(unittest.TestCase):
+    STRING = """ServerName joe.wuznt.here
+<VirtualHost *:80>
+    DocumentRoot /var/www
+    ServerName JoeWuzHere.com
+</VirtualHost>"""
+
+    def test_matches_string_parsing(self):
+        expected, _ = MainContext.consume(self.STRING)
+        parsed = MainContext.consume_lines(split_source_lines(self.STRING))
+        self.assertEqual(expected, parsed)
+
+    def test_records_sources(self):
+        parsed = MainContext.consume_lines(split_source_lines(self.STRING,
+                                                              "main.conf"))
+        server_name, virtual_host = parsed.children
+
+        self.assertEqual(("main.conf", 1), server_name.source[1:])
+        self.assertEqual(("main.conf", 2), virtual_host.source[1:])
+        self.assertEqual(4, virtual_host.children[0].source.line_number)
+
+    def test_skips_comments(self):
+        lines = split_source_lines("ServerName a\n# ServerName b")
+        parsed = MainContext.consume_lines(lines)
+        self.assertEqual(ServerName("a"), parsed.server_name)
+
+    def test_raises_on_unterminated_context(self):
+        lines = split_source_lines("ServerName a\n<VirtualHost *:80>")
+        self.assertRaises(ValueError, MainContext.consume_lines, lines)
+
+    def test_from_file(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        with open(os.path.join(directory.name, "vhosts.conf"), "w") as f:
+            f.write(self.STRING.split("\n", 1)[1])
+        with open(os.path.join(directory.name, "main.conf"), "w") as f:
+            f.write("ServerName joe.wuznt.here\nInclude vhosts.conf\n")
+
+        parsed = MainContext.from_file(os.path.join(directory.name,
+                                                    "main.conf"),
+                                       server_root=directory.name)
+
+        expected, _ = MainContext.consume(self.STRING)
+        self.assertEqual(expected, parsed)
+        self.assertEqual("vhosts.conf",
+                         os.path.basename(parsed.children[1].source.filename))
+
+
 class TestFindHost(unittest.TestCase):
     def test_returns_self(self):
         mc = MainContext((DEFAULT_SERVER_NAME,))
@@ -89,3 +143,37 @@ class TestFindHost(unittest.TestCase):
                        'something-else')
         self.assertIs(b, result)
 
+
+
+class TestHandleRequestWithQueryString(unittest.TestCase):
+    def setUp(self):
+        self.main_context, _ = MainContext.consume(
+            "ServerName example.com\n"
+            "RewriteEngine on\n"
+            "RewriteRule ^/b$ /c?was=%{QUERY_STRING} [L]\n"
+            "<VirtualHost *:8080>\n"
+            "    ServerName vhost.example.com\n"
+            "    RewriteEngine on\n"
+            "    RewriteRule ^/b$ /d?was=%{QUERY_STRING} [L]\n"
+            "</VirtualHost>")
+
+    def _handle(self, request, port=80):
+        environment = Environment(request)
+        environment[ServerVariable.SERVER_PORT] = port
+        return self.main_context.handle_request(request, environment)
+
+    def test_rules_see_only_the_path(self):
+        for host, port, expected in (
+                ("example.com", 80, "/c?was=q=1"),
+                ("vhost.example.com", 8080, "/d?was=q=1")):
+            http_request = get_request("GET", "/b?q=1", "HTTP/1.1", host)
+            self.assertEqual(expected, self._handle(http_request, port))
+            self.assertEqual(expected,
+                             self._handle(http_request.to_request(), port))
+
+    def test_with_outcome_cache(self):
+        self.main_context.cache_outcomes(OutcomeCache())
+        for query in "q=1", "q=2":
+            http_request = get_request("GET", "/b?" + query, "HTTP/1.1",
+                                       "example.com")
+            self.assertEqual("/c?was=" + query, self._handle(http_request))
@@ -58,3 +58,31 @@ class TestRegexCondPattern(TestCase):
             pattern = RegexCondPattern.make(string)
             self.assertIs(result, pattern.match(input_value))
 
+
+
+class TestRegexCondPatternLiteralPrefix(TestCase):
+    CASES = ("^/foo/(.*)$", "/foo/", "(.*)$"), \
+        ("/foo\\.html", "/foo.html", ""), \
+        ("^/ab?c", "/a", "b?c"), \
+        ("^/a\\d+", "/a", "\\d+"), \
+        ("^/a|^/b", "", "^/a|^/b"), \
+        (".*", "", ".*")
+
+    def test_splits(self):
+        for string, prefix, rest in self.CASES:
+            pattern = RegexCondPattern.make(string)
+            self.assertEqual((prefix, rest), pattern.split_literal_prefix())
+
+    def test_accepts_any_suffix(self):
+        for string in "^/foo", "^/foo.*", "^/foo(.*)$", "^":
+            self.assertTrue(RegexCondPattern.make(string).accepts_any_suffix)
+
+        for string in "^/foo$", "^/foo/.+", "^/foo\\d":
+            self.assertFalse(RegexCondPattern.make(string).accepts_any_suffix)
+
+    def test_matches_everything(self):
+        for string in "^", ".*", "^(.*)$":
+            self.assertTrue(RegexCondPattern.make(string).matches_everything)
+
+        for string in "^/", "^.+$":
+            self.assertFalse(RegexCondPattern.make(string).matches_everything)
@@ -0,0 +1,41 @@
+import unittest
+
+from apache_rewrite_tester.rewrite_objects import RewriteRule
+from apache_rewrite_tester.rewrite_objects.prefix_index import PrefixIndex
+from apache_rewrite_tester.rewrite_objects.program import CompiledRule
+
+__author__ = 'jwilner'
+
+
+def _index(*lines):
+    return PrefixIndex(CompiledRule(RewriteRule.make(line)) for line in lines)
+
+
+class TestPrefixIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = _index("RewriteRule ^/api/v2/(.*) /v2/$1",
+                            "RewriteRule ^/api/ /api",
+                            "RewriteRule ^/static/ -",
+                            "RewriteRule (.*)\\.php$ /index",
+                            "RewriteRule !^/api /other",
+                            "RewriteRule ^/Docs /docs [NC]")
+
+    def test_only_matching_prefixes(self):
+        self.assertEqual([0, 1, 3, 4], self.index.get_candidates("/api/v2/x"))
+        self.assertEqual([1, 3, 4], self.index.get_candidates("/api/v1/x"))
+        self.assertEqual([2, 3, 4], self.index.get_candidates("/static/a"))
+        self.assertEqual([3, 4], self.index.get_candidates("/"))
+
+    def test_ignores_case_when_rule_does(self):
+        self.assertEqual([3, 4, 5], self.index.get_candidates("/dOCs/a"))
+        self.assertEqual([3, 4], self.index.get_candidates("/API/"))
+
+    def test_tries_every_case_insensitive_rule_outside_ascii(self):
+        self.assertEqual([3, 4, 5], self.index.get_candidates("/ſ"))
+
+    def test_start(self):
+        self.assertEqual([3, 4], self.index.get_candidates("/api/v2/x", 2))
+
+    def test_inline_flags(self):
+        index = _index("RewriteRule (?i)^/a /b")
+        self.assertEqual([0], index.get_candidates("/A"))
@@ -0,0 +1,291 @@
+import random
+import re
+import unittest
+
+from apache_rewrite_tester.environment import RuleBackreference, \
+    CondBackreference, Environment, ServerVariable
+from apache_rewrite_tester.rewrite_objects import RewriteCondition, \
+    RewriteRule
+from apache_rewrite_tester.rewrite_objects.control_flow import \
+    DEFAULT_MAXIMUM_ROUNDS, RewriteLoopError, STOPPING_FLAGS
+from apache_rewrite_tester.rewrite_objects.main_context import MainContext
+from apache_rewrite_tester.rewrite_objects.program import RuleProgram, \
+    CompiledRule, CompiledCondition
+from apache_rewrite_tester.rewrite_objects.rule import RuleFlag
+
+__author__ = 'jwilner'
+
+
+def _compile(*lines):
+    directives = [RewriteCondition.make(line) or RewriteRule.make(line)
+                  for line in lines]
+    return RuleProgram.compile(directives)
+
+
+class TestCompilation(unittest.TestCase):
+    def test_groups_conditions_with_rules(self):
+        program = _compile("RewriteCond %{HTTP_HOST} ^a",
+                           "RewriteCond %{HTTP_HOST} ^b [OR]",
+                           "RewriteRule ^/x /y",
+                           "RewriteRule ^/y /z")
+
+        self.assertEqual(2, len(program))
+        first, second = program.rules
+        self.assertEqual(2, len(first.conditions))
+        self.assertEqual((), second.conditions)
+
+    def test_folds_in_no_case(self):
+        rule = CompiledRule(RewriteRule.make("RewriteRule ^/x /y [NC]"))
+        self.assertTrue(rule.regex.flags & re.IGNORECASE)
+
+        condition = CompiledCondition(
+            RewriteCondition.make("RewriteCond %{HTTP_HOST} ^a [NC]"))
+        self.assertTrue(condition.regex.flags & re.IGNORECASE)
+
+    def test_non_regex_conditions_have_no_regex(self):
+        condition = CompiledCondition(
+            RewriteCondition.make("RewriteCond %{TIME_HOUR} -lt12"))
+        self.assertIsNone(condition.regex)
+
+
+class TestRuleProgramApply(unittest.TestCase):
+    def test_rewrites_with_backreferences(self):
+        program = _compile("RewriteRule ^/old/(.*) /new/$1")
+        environment = {}
+
+        self.assertEqual("/new/thing",
+                         program.apply("/old/thing", environment))
+        self.assertEqual("thing", environment[RuleBackreference(1)])
+
+    def test_rules_see_previous_rewrites(self):
+        program = _compile("RewriteRule ^/a /b", "RewriteRule ^/b /c")
+        self.assertEqual("/c", program.apply("/a", {}))
+
+    def test_last_stops_processing(self):
+        program = _compile("RewriteRule ^/a /b [L]", "RewriteRule ^/b /c")
+        self.assertEqual("/b", program.apply("/a", {}))
+
+    def test_dash_leaves_path_alone(self):
+        program = _compile("RewriteRule ^/a - [L]", "RewriteRule ^/a /c")
+        self.assertEqual("/a", program.apply("/a", {}))
+
+    def test_negated_pattern(self):
+        program = _compile("RewriteRule !^/a /b")
+        self.assertEqual("/b", program.apply("/z", {}))
+        self.assertEqual("/a", program.apply("/a", {}))
+
+    def test_conditions_gate_rule(self):
+        program = _compile("RewriteCond %{HTTP_HOST} ^(www)\\.",
+                           "RewriteRule ^/a /%1")
+
+        environment = {ServerVariable.HTTP_HOST: "www.example.com"}
+        self.assertEqual("/www", program.apply("/a", environment))
+        self.assertEqual("www", environment[CondBackreference(1)])
+
+        environment = {ServerVariable.HTTP_HOST: "example.com"}
+        self.assertEqual("/a", program.apply("/a", environment))
+
+    def test_backreferences_to_nothing_are_empty(self):
+        program = _compile("RewriteRule ^/(a)?b$ /x$1-$5-%1 [L]",
+                           "RewriteCond %{HTTP_HOST} ^(www\\.)?example",
+                           "RewriteRule ^/c /y%1%2")
+
+        for environment in ({}, Environment()):
+            environment[ServerVariable.HTTP_HOST] = "example.com"
+            self.assertEqual("/x--", program.apply("/b", environment))
+            self.assertEqual("", environment[RuleBackreference(1)])
+            self.assertEqual("/xa--", program.apply("/ab", environment))
+            self.assertEqual("/y", program.apply("/c", environment))
+            self.assertEqual("", environment[CondBackreference(1)])
+
+    def test_no_case_condition(self):
+        program = _compile("RewriteCond %{HTTP_HOST} ^WWW [NC]",
+                           "RewriteRule ^/a /b")
+        environment = {ServerVariable.HTTP_HOST: "www.example.com"}
+        self.assertEqual("/b", program.apply("/a", environment))
+
+
+class TestPrefixFiltering(unittest.TestCase):
+    LINES = "RewriteRule ^/api/v1/(.*) /api/v2/$1", \
+        "RewriteRule ^/api/v2/(.*)$ /v2.php?q=$1", \
+        "RewriteRule !^/v2 - [L]", \
+        "RewriteRule ^/V2\\.PHP /index.php [NC]", \
+        "RewriteRule ^/index /final [L]"
+
+    PATHS = "/api/v1/x", "/api/v2/y", "/v2.php", "/other", "/api/v3"
+
+    def test_matches_trying_every_rule(self):
+        program = _compile(*self.LINES)
+
+        for path in self.PATHS:
+            expected = path
+            for rule in program.rules:
+                new_path = rule.apply(expected, {})
+                if new_path is not None:
+                    expected = new_path
+                    if rule.terminal:
+                        break
+
+            self.assertEqual(expected, program.apply(path, {}), path)
+
+    def test_rewrites_see_later_rules(self):
+        program = _compile(*self.LINES)
+        self.assertEqual("/final", program.apply("/api/v1/x", {}))
+
+    def test_extracts_prefixes(self):
+        prefixes = [(rule.prefix, rule.ignore_case)
+                    for rule in _compile(*self.LINES).rules]
+        self.assertEqual([("/api/v1/", False), ("/api/v2/", False),
+                          (None, False), ("/V2.PHP", True),
+                          ("/index", False)], prefixes)
+
+
+def _apply_like_mod_rewrite(program, path, environment):
+    """
+    The reference: mod_rewrite's own loop, walking every rule in turn.
+    """
+    rules = program.rules
+    rounds = 1
+    index = 0
+    while index < len(rules):
+        rule = rules[index]
+        flags = rule.directive.flags
+
+        new_path = rule.apply(path, environment)
+        if new_path is None:
+            while index < len(rules) and \
+                    RuleFlag.CHAIN in rules[index].directive.flags:
+                index += 1
+            index += 1
+            continue
+
+        path = new_path
+        if any(flag in flags for flag in STOPPING_FLAGS):
+            return path
+
+        if RuleFlag.NEXT in flags:
+            rounds += 1
+            maximum = flags[RuleFlag.NEXT].get("maximum") or \
+                DEFAULT_MAXIMUM_ROUNDS
+            if rounds >= maximum:
+                raise RewriteLoopError(rule.directive, path, maximum)
+            index = 0
+            continue
+
+        index += 1 + flags.get(RuleFlag.SKIP, {}).get("number", 0)
+
+    return path
+
+
+def _outcome(apply, program, path):
+    try:
+        return apply(program, path, {})
+    except RewriteLoopError as error:
+        return type(error), error.path
+
+
+class TestControlFlowFlags(unittest.TestCase):
+    def test_skip(self):
+        program = _compile("RewriteRule ^/a /b [S=2]",
+                           "RewriteRule ^/b /c",
+                           "RewriteRule ^/b /d",
+                           "RewriteRule ^/b /e")
+        self.assertEqual("/e", program.apply("/a", {}))
+        self.assertEqual("/c", program.apply("/b", {}))
+
+    def test_skip_only_when_fired(self):
+        program = _compile("RewriteCond %{HTTP_HOST} =www",
+                           "RewriteRule ^/a /b [S=1]",
+                           "RewriteRule ^/a /c")
+        self.assertEqual("/c", program.apply(
+            "/a", {ServerVariable.HTTP_HOST: "other"}))
+        self.assertEqual("/b", program.apply(
+            "/a", {ServerVariable.HTTP_HOST: "www"}))
+
+    def test_chain_continues_when_fired(self):
+        program = _compile("RewriteRule ^/a /b [C]",
+                           "RewriteRule ^/b /c [C]",
+                           "RewriteRule ^/c /d")
+        self.assertEqual("/d", program.apply("/a", {}))
+
+    def test_broken_chain_skips_the_rest(self):
+        program = _compile("RewriteRule ^/a /b [C]",
+                           "RewriteRule ^/x /y [C]",
+                           "RewriteRule ^/b /c",
+                           "RewriteRule ^/b /e")
+        self.assertEqual("/e", program.apply("/a", {}))
+
+        # prefixes never pass over a chain's first rule
+        self.assertEqual("/e", program.apply("/b", {}))
+
+    def test_next_restarts(self):
+        program = _compile("RewriteRule ^/strip/(.*) /$1 [N]",
+                           "RewriteRule ^/a$ /found")
+        self.assertEqual("/found", program.apply("/strip/strip/a", {}))
+
+    def test_next_maximum(self):
+        program = _compile("RewriteRule ^/(.*) /x$1 [N=5]")
+        with self.assertRaises(RewriteLoopError) as context:
+            program.apply("/a", {})
+        self.assertEqual(("/xxxxa", 5), (context.exception.path,
+                                         context.exception.maximum))
+
+    def test_forbidden_stops(self):
+        program = _compile("RewriteRule ^/private - [F]",
+                           "RewriteRule ^/(.*) /public/$1")
+        self.assertEqual("/private", program.apply("/private", {}))
+
+    def test_matches_mod_rewrite_loop(self):
+        templates = "RewriteRule ^/a(.*) /b$1", "RewriteRule ^/b(.*) /c$1", \
+            "RewriteRule ^/c /a", "RewriteRule ^/x - ", "RewriteRule .* -", \
+            "RewriteRule !^/a /z", "RewriteRule ^/z(.*) /x$1"
+        flags = "", "", " [C]", " [S=1]", " [S=2]", " [L]", " [N=5]", \
+            " [NC]", " [C,S=1]"
+        paths = "/a1", "/b", "/c", "/x", "/A1", "/zz", "/z/x"
+
+        generator = random.Random(23)
+        for _ in range(300):
+            lines = [generator.choice(templates) + generator.choice(flags)
+                     for _ in range(generator.randint(1, 12))]
+            program = _compile(*lines)
+            for path in paths:
+                self.assertEqual(
+                    _outcome(_apply_like_mod_rewrite, program, path),
+                    _outcome(RuleProgram.apply, program, path),
+                    (lines, path))
+
+
+class FakeRequest(object):
+    def __init__(self, path, host):
+        self.path = path
+        self.headers = {"Host": host}
+
+
+class TestHandleRequest(unittest.TestCase):
+    CONFIG = """ServerName main.example.com
+RewriteEngine on
+RewriteRule ^/main /from-main
+<VirtualHost *:80>
+    ServerName vhost.example.com
+    RewriteEngine on
+    RewriteRule ^/(.*) /from-vhost/$1
+</VirtualHost>"""
+
+    def setUp(self):
+        self.context, _ = MainContext.consume(self.CONFIG)
+
+    def test_dispatches_to_virtual_host(self):
+        environment = {ServerVariable.SERVER_PORT: 80}
+        result = self.context.handle_request(
+            FakeRequest("/main", "vhost.example.com"), environment)
+        self.assertEqual("/from-vhost/main", result)
+
+    def test_falls_back_on_main_context(self):
+        environment = {ServerVariable.SERVER_PORT: 8080}
+        result = self.context.handle_request(
+            FakeRequest("/main", "main.example.com"), environment)
+        self.assertEqual("/from-main", result)
+
+    def test_compiled_context_still_equal(self):
+        other, _ = MainContext.consume(self.CONFIG)
+        self.assertEqual(other, self.context.compile())
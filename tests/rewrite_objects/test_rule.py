@@ -1,3 +1,4 @@
+import pickle
 import unittest
 
 from apache_rewrite_tester.environment import RuleBackreference
@@ -76,7 +77,7 @@ class TestRewriteRule(unittest.TestCase):
         self.assertFalse(parsed.pattern.negated)
         self.assertEqual("^/somepath(.*)", parsed.pattern.pattern)
 
-        expected_components = tuple("/otherpath") + (RuleBackreference(1),)
+        expected_components = "/otherpath", RuleBackreference(1)
 
         self.assertSequenceEqual(expected_components,
                                  parsed.substitution.components)
@@ -92,10 +93,22 @@ class TestRewriteRule(unittest.TestCase):
         self.assertTrue(parsed.pattern.negated)
         self.assertEqual("^/somepath(.*)", parsed.pattern.pattern)
 
-        expected_components = tuple("http://thishost/otherpath") + \
-            (RuleBackreference(1),)
+        expected_components = "http://thishost/otherpath", \
+            RuleBackreference(1)
 
         self.assertSequenceEqual(expected_components,
                                  parsed.substitution.components)
 
         self.assertDictEqual({RuleFlag.PROXY: {}}, parsed.flags)
+
+    def test_apply(self):
+        rule = RewriteRule.make(r"RewriteRule ^/section(\d+)/(.*)$ /new$1/$2")
+        self.assertEqual("/new3/rest", rule.apply("/section3/rest", {}))
+
+    def test_apply_unmatched(self):
+        rule = RewriteRule.make(r"RewriteRule ^/section(\d+)/(.*)$ /new$1/$2")
+        self.assertEqual("/elsewhere", rule.apply("/elsewhere", {}))
+
+    def test_pickles(self):
+        rule = RewriteRule.make(r"RewriteRule ^/(.*)$ /b/$1 [NC,R=301,L]")
+        self.assertEqual(rule, pickle.loads(pickle.dumps(rule)))
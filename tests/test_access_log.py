@@ -0,0 +1,134 @@
+import io
+import os
+import tempfile
+import unittest
+
+from apache_rewrite_tester.access_log import parse_log_lines, \
+    read_log_lines, replay, write_outcomes, Outcome
+from apache_rewrite_tester.environment import Environment
+from apache_rewrite_tester.rewrite_objects.main_context import MainContext
+
+__author__ = 'jwilner'
+
+COMBINED = '10.0.0.1 - frank [10/Oct/2000:13:55:36 -0700] ' \
+           '"GET /old/page?x=1 HTTP/1.0" 200 2326 ' \
+           '"http://example.com/start.html" "Mozilla/4.08 \\"quoted\\""'
+COMMON = '10.0.0.2 - - [10/Oct/2000:13:55:37 -0700] "GET /other HTTP/1.1" ' \
+         '404 -'
+BAD_REQUEST = '10.0.0.3 - - [10/Oct/2000:13:55:38 -0700] "-" 408 -'
+
+CONFIG = """ServerName main.example.com
+RewriteEngine on
+RewriteRule ^/old/(.*) /new/$1 [L]
+RewriteRule ^/port/(.*) /port-%{SERVER_PORT}/https-%{HTTPS}/$1 [L]
+RewriteRule ^/loop(.*) /loop$1 [N]"""
+
+
+def _make_log_line(path):
+    return '10.0.0.4 - - [10/Oct/2000:13:55:39 -0700] "GET {} HTTP/1.1" ' \
+           '200 -'.format(path)
+
+
+def _make_environment(request):
+    if request.request_uri == "/broken":
+        raise ValueError("can't make an environment")
+    return Environment(request)
+
+
+class TestParseLogLines(unittest.TestCase):
+    def test_combined(self):
+        (line_number, entry), = parse_log_lines([(1, COMBINED)])
+
+        self.assertEqual("10.0.0.1", entry.remote_host)
+        self.assertEqual("GET /old/page?x=1 HTTP/1.0", entry.request_line)
+        self.assertEqual("http://example.com/start.html", entry.referer)
+        self.assertEqual('Mozilla/4.08 \\"quoted\\"', entry.user_agent)
+
+    def test_common(self):
+        (line_number, entry), = parse_log_lines([(1, COMMON)])
+
+        self.assertEqual("404", entry.status)
+        self.assertIsNone(entry.referer)
+        self.assertIsNone(entry.user_agent)
+
+    def test_unrecognized(self):
+        self.assertEqual([(3, None)], list(parse_log_lines([(3, "garbage")])))
+
+
+class TestReadLogLines(unittest.TestCase):
+    def _write(self, contents):
+        handle, filename = tempfile.mkstemp()
+        self.addCleanup(os.remove, filename)
+        with os.fdopen(handle, "wb") as f:
+            f.write(contents)
+        return filename
+
+    def test_reads_lines(self):
+        filename = self._write("\n".join((COMBINED, COMMON)).encode())
+        self.assertEqual([(1, COMBINED), (2, COMMON)],
+                         list(read_log_lines(filename)))
+
+    def test_empty(self):
+        self.assertEqual([], list(read_log_lines(self._write(b""))))
+
+
+class TestReplay(unittest.TestCase):
+    def setUp(self):
+        self.context, _ = MainContext.consume(CONFIG)
+        self.lines = list(enumerate(("garbage", COMBINED, BAD_REQUEST,
+                                     COMMON, "trailing garbage"), 1))
+
+    def test_outcome_per_line_in_order(self):
+        outcomes = list(replay(self.context, self.lines, chunk_size=1))
+
+        expected = [Outcome(1, None, None, "unrecognized log line"),
+                    Outcome(2, "/old/page?x=1", "/new/page", None),
+                    Outcome(3, None, None, "invalid request line"),
+                    Outcome(4, "/other", "/other", None),
+                    Outcome(5, None, None, "unrecognized log line")]
+        self.assertEqual(expected, outcomes)
+
+    def test_failed_requests_only_fail_their_line(self):
+        lines = list(enumerate(map(_make_log_line, ("/old/a", "/loop",
+                                                    "/broken", "/old/b")),
+                               1))
+
+        for workers in None, 2:
+            outcomes = list(replay(self.context, lines, chunk_size=2,
+                                   make_environment=_make_environment,
+                                   workers=workers))
+
+            self.assertEqual([Outcome(1, "/old/a", "/new/a", None),
+                              Outcome(4, "/old/b", "/new/b", None)],
+                             [outcomes[0], outcomes[3]])
+            loop, broken = outcomes[1:3]
+            self.assertEqual((2, "/loop", None),
+                             (loop.line_number, loop.request_uri,
+                              loop.result))
+            self.assertTrue(loop.error.startswith("500 RewriteLoopError: "))
+            self.assertEqual(Outcome(3, "/broken", None,
+                                     "500 ValueError: can't make an "
+                                     "environment"), broken)
+
+    def test_server_port(self):
+        lines = [(1, _make_log_line("/port/a"))]
+
+        for server_port, expected in ((None, "/port-80/https-off/a"),
+                                      (443, "/port-443/https-on/a")):
+            for workers in None, 2:
+                kwargs = {} if server_port is None \
+                    else {"server_port": server_port}
+                outcome, = replay(self.context, lines, workers=workers,
+                                  **kwargs)
+
+                self.assertEqual(Outcome(1, "/port/a", expected, None),
+                                 outcome)
+
+    def test_writes_outcomes(self):
+        output = io.StringIO()
+        write_outcomes(replay(self.context, self.lines[:3]), output)
+
+        self.assertEqual("1\t-\t!unrecognized log line\n"
+                         "2\t/old/page?x=1\t/new/page\n"
+                         "3\t-\t!invalid request line\n",
+                         output.getvalue())
@@ -0,0 +1,97 @@
+import pickle
+import unittest
+
+from apache_rewrite_tester.batch import RequestFailure, Throughput, \
+    handle_requests
+from apache_rewrite_tester.environment import ServerVariable
+from apache_rewrite_tester.http_request import get_request
+from apache_rewrite_tester.rewrite_objects.main_context import MainContext
+
+__author__ = 'jwilner'
+
+CONFIG = """ServerName main.example.com
+<VirtualHost *:80>
+    ServerName vhost.example.com
+    RewriteEngine on
+    RewriteRule ^/(\\w+)/(\\d+)$ /$2/$1 [L]
+    RewriteRule ^/loop(.*) /loop$1 [N]
+</VirtualHost>"""
+
+
+def make_port_80_environment(request):
+    return {ServerVariable.SERVER_PORT: 80}
+
+
+def make_requests(count):
+    return [get_request("GET", "/item/{}".format(index), "HTTP/1.1",
+                        "vhost.example.com")
+            for index in range(count)]
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        self.now += 1.0
+        return self.now
+
+
+class TestHandleRequests(unittest.TestCase):
+    def setUp(self):
+        self.context, _ = MainContext.consume(CONFIG)
+        self.expected = ["/{}/item".format(index) for index in range(25)]
+
+    def test_serially(self):
+        results = self.context.handle_requests(
+            make_requests(25), make_environment=make_port_80_environment,
+            chunk_size=4)
+        self.assertEqual(self.expected, list(results))
+
+    def test_in_worker_processes_preserves_order(self):
+        results = self.context.handle_requests(
+            make_requests(25), make_environment=make_port_80_environment,
+            workers=2, chunk_size=3)
+        self.assertEqual(self.expected, list(results))
+
+    def test_loops_fail_only_their_request(self):
+        requests = make_requests(3)
+        requests.insert(1, get_request("GET", "/loop", "HTTP/1.1",
+                                       "vhost.example.com"))
+
+        for workers in None, 2:
+            results = list(self.context.handle_requests(
+                requests, make_environment=make_port_80_environment,
+                workers=workers, chunk_size=2))
+
+            self.assertEqual(self.expected[:1] + self.expected[1:3],
+                             results[:1] + results[2:])
+            failure = results[1]
+            self.assertIsInstance(failure, RequestFailure)
+            self.assertEqual(500, failure.status)
+            self.assertIn("exceeded maximum number of rounds",
+                          failure.reason)
+
+    def test_is_lazy(self):
+        def requests():
+            yield from make_requests(2)
+            raise AssertionError("read too far")
+
+        results = handle_requests(self.context, requests(),
+                                  make_port_80_environment, chunk_size=2)
+        self.assertEqual(self.expected[:2], [next(results), next(results)])
+
+    def test_reports_throughput(self):
+        throughput = Throughput(clock=FakeClock())
+        list(self.context.handle_requests(make_requests(10),
+                                          throughput=throughput,
+                                          chunk_size=4))
+
+        self.assertEqual(10, throughput.count)
+        self.assertEqual(3.0, throughput.elapsed)
+        self.assertAlmostEqual(10 / 3.0, throughput.requests_per_second)
+
+    def test_compiled_context_pickles(self):
+        self.context.compile()
+        unpickled = pickle.loads(pickle.dumps(self.context))
+        self.assertEqual(self.context, unpickled)
@@ -0,0 +1,110 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from apache_rewrite_tester import config_cache
+from apache_rewrite_tester.config_cache import ConfigCache, ENTRY_SUFFIX
+from apache_rewrite_tester.environment import Environment
+from apache_rewrite_tester.http_request import Request
+from apache_rewrite_tester.rewrite_objects.main_context import MainContext
+
+__author__ = 'jwilner'
+
+
+class TestConfigCache(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = directory.name
+        os.mkdir(os.path.join(self.root, "conf.d"))
+
+        self._write("main.conf", "ServerName example.com\n"
+                                 "RewriteEngine on\n"
+                                 "RewriteCond %{HTTP_HOST} ^www\\. [NC]\n"
+                                 "RewriteRule ^/a /b [L]\n"
+                                 "IncludeOptional conf.d/*.conf\n")
+        self._write("conf.d/1.conf", "<VirtualHost *:80>\n"
+                                     "    ServerName one.example.com\n"
+                                     "    RewriteEngine on\n"
+                                     "    RewriteRule ^/(.*) /one/$1\n"
+                                     "</VirtualHost>\n")
+
+        self.cache = ConfigCache(os.path.join(self.root, "cache"))
+
+    def _write(self, filename, contents):
+        with open(os.path.join(self.root, filename), "w") as config_file:
+            config_file.write(contents)
+
+    def _load(self):
+        return self.cache.load(os.path.join(self.root, "main.conf"),
+                               self.root)
+
+    def _parse(self):
+        return MainContext.from_file(os.path.join(self.root, "main.conf"),
+                                     self.root)
+
+    def test_loads_what_was_parsed(self):
+        parsed = self._load()
+        loaded = self._load()
+
+        self.assertEqual((1, 1), (self.cache.hits, self.cache.misses))
+        self.assertIsNot(parsed, loaded)
+        self.assertEqual(self._parse(), loaded)
+        self.assertEqual([child.source for child in parsed.children],
+                         [child.source for child in loaded.children])
+
+    def test_loaded_context_rewrites(self):
+        self._load()
+        main_context = self._load()
+
+        request = Request("GET", "/x", headers={"Host": "one.example.com"})
+        self.assertEqual("/one/x", main_context.handle_request(
+            request, Environment(request)))
+
+    def test_changed_include_is_stale(self):
+        self._load()
+        self._write("conf.d/1.conf", "")
+
+        self.assertEqual((), self._load().virtual_hosts)
+        self.assertEqual((0, 2), (self.cache.hits, self.cache.misses))
+
+    def test_new_include_is_stale(self):
+        self._load()
+        self._write("conf.d/2.conf", "<VirtualHost *:80>\n"
+                                     "    ServerName two.example.com\n"
+                                     "</VirtualHost>\n")
+
+        self.assertEqual(2, len(self._load().virtual_hosts))
+        self.assertEqual(0, self.cache.hits)
+
+    def test_deleted_include_is_stale(self):
+        self._load()
+        os.remove(os.path.join(self.root, "conf.d/1.conf"))
+
+        self.assertEqual((), self._load().virtual_hosts)
+        self.assertEqual(0, self.cache.hits)
+
+    def test_corrupt_entry_is_reparsed(self):
+        self._load()
+        entry, = os.listdir(self.cache.directory)
+        self.assertTrue(entry.endswith(ENTRY_SUFFIX))
+        with open(os.path.join(self.cache.directory, entry), "wb") as f:
+            f.write(b"garbage")
+
+        self.assertEqual(self._parse(), self._load())
+        self.assertEqual((0, 2), (self.cache.hits, self.cache.misses))
+
+    def test_other_version_is_reparsed(self):
+        with mock.patch.object(config_cache, "CACHE_VERSION",
+                               config_cache.CACHE_VERSION - 1):
+            self._load()
+
+        self.assertEqual(self._parse(), self._load())
+        self.assertEqual((0, 2), (self.cache.hits, self.cache.misses))
+
+    def test_entries_per_server_root(self):
+        self._load()
+        self.assertIsNone(self.cache.get(
+            os.path.join(self.root, "main.conf"),
+            os.path.join(self.root, "conf.d")))
@@ -1,7 +1,10 @@
+import datetime
+import pickle
 from unittest import TestCase
 
 from apache_rewrite_tester.environment import Backreference, CondBackreference, \
-    RuleBackreference
+    RuleBackreference, Environment, ServerVariable, MapExpansion
+from apache_rewrite_tester.http_request import Request
 
 __author__ = 'jwilner'
 
@@ -20,6 +23,14 @@ class FakeMatch(object):
         """
         return self._groups[index]
 
+    def groups(self, default=None):
+        """
+        :type default: str
+        :rtype: tuple[str]
+        """
+        return tuple(default if group is None else group
+                     for group in self._groups[1:])
+
 
 class TestUpdateEnvironment(TestCase):
     def test_sets_properly(self):
@@ -33,6 +44,15 @@ class TestUpdateEnvironment(TestCase):
         self.assertEqual(3, len(mapping))
         self.assertDictEqual(backs, mapping)
 
+    def test_unmatched_groups_are_empty(self):
+        match = FakeMatch(("ab", None, "b"))
+        expected = {RuleBackreference(0): "ab", RuleBackreference(1): "",
+                    RuleBackreference(2): "b"}
+
+        for mapping in ({}, Environment()):
+            RuleBackreference.update_environment(match, mapping)
+            self.assertDictEqual(expected, dict(mapping))
+
     def test_unsets_expectedly(self):
         mapping = dict(zip(map(Backreference, range(10)), "abcdefghij"))
         expected = dict(zip(map(Backreference, range(4)), "abcde"))
@@ -48,3 +68,184 @@ class TestUpdateEnvironment(TestCase):
                        list(zip(map(RuleBackreference, range(4)), "abcd")))
 
         self.assertEqual(8, len(mapping))
+
+
+class TestEnvironment(TestCase):
+    def test_slotted_keys(self):
+        environment = Environment()
+        environment[RuleBackreference(1)] = "a"
+        environment[CondBackreference(1)] = "b"
+        environment[ServerVariable.QUERY_STRING] = "c"
+
+        self.assertEqual("a", environment[RuleBackreference(1)])
+        self.assertEqual("b", environment[CondBackreference(1)])
+        self.assertEqual("c", environment[ServerVariable.QUERY_STRING])
+        self.assertEqual(3, len(environment))
+        self.assertEqual({RuleBackreference(1), CondBackreference(1),
+                          ServerVariable.QUERY_STRING}, set(environment))
+
+    def test_other_keys(self):
+        environment = Environment()
+        key = MapExpansion("map", "key", "default")
+        environment[key] = "value"
+        environment[Backreference(1)] = "other"
+
+        self.assertEqual("value", environment[key])
+        self.assertEqual(2, len(environment))
+
+    def test_missing_raises_key_error(self):
+        environment = Environment()
+        self.assertRaises(KeyError, environment.__getitem__,
+                          RuleBackreference(3))
+        self.assertRaises(KeyError, environment.__delitem__,
+                          RuleBackreference(3))
+        self.assertNotIn(ServerVariable.HTTP_HOST, environment)
+
+    def test_delete(self):
+        environment = Environment()
+        environment[RuleBackreference(3)] = "a"
+        del environment[RuleBackreference(3)]
+        self.assertNotIn(RuleBackreference(3), environment)
+
+    def test_reset_forgets_everything(self):
+        environment = Environment()
+        environment[RuleBackreference(1)] = "a"
+        environment["other"] = "b"
+
+        environment.reset()
+
+        self.assertEqual(0, len(environment))
+        self.assertNotIn(RuleBackreference(1), environment)
+        self.assertNotIn("other", environment)
+
+    def test_extracts_from_request_lazily(self):
+        environment = Environment(Request("GET", "/", headers={"Host": "a"}))
+        self.assertEqual(0, len(environment))
+
+        self.assertEqual("a", environment[ServerVariable.HTTP_HOST])
+        self.assertEqual(1, len(environment))
+
+        environment.reset(Request("GET", "/", headers={"Host": "b"}))
+        self.assertEqual("b", environment[ServerVariable.HTTP_HOST])
+
+    def test_works_with_update_environment(self):
+        environment = Environment()
+        for index in range(10):
+            environment[RuleBackreference(index)] = "old"
+
+        RuleBackreference.update_environment(FakeMatch(tuple("ab")),
+                                             environment)
+
+        self.assertEqual({RuleBackreference(0): "a",
+                          RuleBackreference(1): "b"}, dict(environment))
+
+    def test_captures_replace_previous(self):
+        environment = Environment()
+        RuleBackreference.update_environment(FakeMatch(tuple("abc")),
+                                             environment)
+        CondBackreference.update_environment(FakeMatch(tuple("x")),
+                                             environment)
+        RuleBackreference.update_environment(FakeMatch(tuple("d")),
+                                             environment)
+
+        self.assertEqual({RuleBackreference(0): "d",
+                          CondBackreference(0): "x"}, dict(environment))
+
+    def test_set_and_delete_backreferences(self):
+        environment = Environment()
+        environment[CondBackreference(2)] = "a"
+
+        self.assertEqual({CondBackreference(2): "a"}, dict(environment))
+        self.assertRaises(KeyError, environment.__getitem__,
+                          CondBackreference(1))
+
+        del environment[CondBackreference(2)]
+        self.assertEqual(0, len(environment))
+
+
+class TestBackreference(TestCase):
+    def test_interned(self):
+        self.assertIs(RuleBackreference(3), RuleBackreference(3))
+        self.assertIsNot(RuleBackreference(3), CondBackreference(3))
+
+    def test_stable_hash(self):
+        self.assertEqual(3 * 4 + RuleBackreference.KIND,
+                         hash(RuleBackreference(3)))
+
+    def test_unpickles_interned(self):
+        self.assertIs(CondBackreference(4),
+                      pickle.loads(pickle.dumps(CondBackreference(4))))
+
+
+class CountingRequest(object):
+    def __init__(self, request):
+        self._request = request
+        self.count = 0
+
+    def __getattr__(self, name):
+        self.count += 1
+        return getattr(self._request, name)
+
+
+class TestServerVariableExtraction(TestCase):
+    REQUEST = Request("GET", "/a/b", "c=d", "HTTP/1.1",
+                      {"Host": "example.com:8443", "User-Agent": "curl"},
+                      remote_addr="10.0.0.1", remote_port=5555,
+                      local_addr="10.0.0.2", local_port=443,
+                      time="10/Oct/2000:13:55:36 -0700")
+
+    def test_unpickles_by_name(self):
+        for variable in ServerVariable:
+            self.assertIs(variable, pickle.loads(pickle.dumps(variable)))
+
+    def test_every_variable_extracts_a_string(self):
+        environment = Environment(self.REQUEST)
+        for variable in ServerVariable:
+            self.assertIsNotNone(variable.extract, variable)
+            self.assertIsInstance(environment[variable], str, variable)
+
+    def test_values(self):
+        environment = Environment(self.REQUEST)
+        expected = {ServerVariable.HTTP_HOST: "example.com:8443",
+                    ServerVariable.HTTP_USER_AGENT: "curl",
+                    ServerVariable.HTTP_REFERER: "",
+                    ServerVariable.QUERY_STRING: "c=d",
+                    ServerVariable.REQUEST_URI: "/a/b",
+                    ServerVariable.THE_REQUEST: "GET /a/b?c=d HTTP/1.1",
+                    ServerVariable.REMOTE_ADDR: "10.0.0.1",
+                    ServerVariable.REMOTE_PORT: "5555",
+                    ServerVariable.SERVER_NAME: "example.com",
+                    ServerVariable.SERVER_PORT: "443",
+                    ServerVariable.HTTPS: "on",
+                    ServerVariable.REQUEST_SCHEME: "https",
+                    ServerVariable.TIME: "20001010135536",
+                    ServerVariable.TIME_WDAY: "2"}
+
+        self.assertEqual(expected,
+                         {variable: environment[variable]
+                          for variable in expected})
+
+    def test_time_defaults_to_now(self):
+        environment = Environment(Request("GET", "/"))
+        self.assertEqual(str(datetime.datetime.now().year),
+                         environment[ServerVariable.TIME_YEAR])
+
+    def test_memoized_per_request(self):
+        request = CountingRequest(self.REQUEST)
+        environment = Environment(request)
+
+        for _ in range(10):
+            environment[ServerVariable.HTTP_HOST]
+        self.assertEqual(1, request.count)
+
+        environment.reset(request)
+        environment[ServerVariable.HTTP_HOST]
+        self.assertEqual(2, request.count)
+
+    def test_only_what_is_used_is_extracted(self):
+        request = CountingRequest(self.REQUEST)
+        environment = Environment(request)
+        environment[ServerVariable.QUERY_STRING]
+
+        self.assertEqual(1, request.count)
+        self.assertEqual([ServerVariable.QUERY_STRING], list(environment))
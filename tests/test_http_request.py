@@ -0,0 +1,52 @@
+import pickle
+import unittest
+
+from apache_rewrite_tester.http_request import Request, get_request
+
+__author__ = 'jwilner'
+
+
+class TestRequest(unittest.TestCase):
+    def test_splits_request_uri(self):
+        request = Request.from_request_uri("GET", "/a/b?c=d&e", "HTTP/1.0")
+
+        self.assertEqual("/a/b", request.path)
+        self.assertEqual("c=d&e", request.query_string)
+        self.assertEqual("/a/b?c=d&e", request.request_uri)
+        self.assertEqual("GET /a/b?c=d&e HTTP/1.0", request.request_line)
+
+    def test_from_request_line_without_version(self):
+        request = Request.from_request_line("GET /")
+        self.assertEqual("HTTP/1.1", request.http_version)
+
+    def test_from_log_entry(self):
+        request = Request.from_log_entry("10.0.0.1", "POST /x HTTP/1.1",
+                                         referer="http://a/",
+                                         user_agent="curl", host="a")
+
+        self.assertEqual("10.0.0.1", request.remote_addr)
+        self.assertEqual("POST", request.method)
+        self.assertEqual({"Host": "a", "Referer": "http://a/",
+                          "User-Agent": "curl"}, request.headers)
+
+    def test_header_names_are_normalized(self):
+        request = Request("GET", "/", headers={"user-agent": "curl"})
+        self.assertEqual("curl", request.headers.get("User-Agent"))
+
+    def test_adapts_http_request(self):
+        http_request = get_request("GET", "/a?b", "HTTP/1.1", "example.com")
+        expected = Request("GET", "/a", "b", "HTTP/1.1",
+                           {"Host": "example.com"})
+
+        self.assertEqual(expected, http_request.to_request())
+
+    def test_http_request_path_excludes_query_string(self):
+        http_request = get_request("GET", "/a?b=c", "HTTP/1.1", "example.com")
+
+        self.assertEqual("/a", http_request.path)
+        self.assertEqual("b=c", http_request.query_string)
+        self.assertEqual("/a?b=c", http_request.request_uri)
+
+    def test_pickles(self):
+        request = Request("GET", "/", local_port=80)
+        self.assertEqual(request, pickle.loads(pickle.dumps(request)))
@@ -0,0 +1,183 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from apache_rewrite_tester.incremental import IncrementalConfig
+from apache_rewrite_tester.rewrite_objects.main_context import MainContext
+
+__author__ = 'jwilner'
+
+
+MAIN = """ServerName example.com
+RewriteEngine on
+RewriteRule ^/first /1
+Include conf.d/rules.conf
+RewriteRule ^/last /2
+<VirtualHost *:80>
+    ServerName inner.example.com
+    RewriteEngine on
+    Include conf.d/inner.conf
+    RewriteRule ^/inner-last /3
+</VirtualHost>
+Include conf.d/sites.conf
+"""
+
+SITE = """<VirtualHost *:80>
+    ServerName {0}.example.com
+    RewriteEngine on
+    RewriteRule ^/(.*) /{0}/$1
+</VirtualHost>
+"""
+
+
+class TestIncrementalConfig(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = directory.name
+        os.mkdir(os.path.join(self.root, "conf.d"))
+        os.mkdir(os.path.join(self.root, "sites"))
+
+        # files are given increasing modification times, however quickly
+        # they're written
+        self.time = 10 ** 18
+
+        self._write("main.conf", MAIN)
+        self._write("conf.d/rules.conf", "RewriteRule ^/a /b\n"
+                                          "RewriteRule ^/c /d\n")
+        self._write("conf.d/inner.conf", "RewriteRule ^/inner /e\n")
+        self._write("conf.d/sites.conf", "IncludeOptional sites/*.conf\n")
+        self._write("sites/one.conf", SITE.format("one"))
+
+        self.config = IncrementalConfig(os.path.join(self.root, "main.conf"),
+                                        self.root)
+
+    def _write(self, filename, contents):
+        filename = os.path.join(self.root, filename)
+        with open(filename, "w") as config_file:
+            config_file.write(contents)
+
+        self.time += 10 ** 9
+        os.utime(filename, ns=(self.time, self.time))
+
+    def _refresh(self):
+        """
+        :rtype: (int, int)
+        :returns: how many more full and partial parses it took
+        """
+        full, partial = self.config.full_parses, self.config.partial_parses
+        self.config.refresh()
+
+        self.assertEqual(MainContext.from_file(
+            os.path.join(self.root, "main.conf"), self.root),
+            self.config.main_context)
+
+        return self.config.full_parses - full, \
+            self.config.partial_parses - partial
+
+    def test_unchanged(self):
+        self.assertEqual(set(), self.config.refresh())
+        self.assertEqual((0, 0), self._refresh())
+
+    def test_main_context_file(self):
+        self._write("conf.d/rules.conf", "RewriteRule ^/x /y\n"
+                                          "RewriteCond %{HTTP_HOST} =z\n"
+                                          "RewriteRule ^/z /w\n")
+        self.assertEqual((0, 1), self._refresh())
+
+    def test_file_in_virtual_host(self):
+        self._write("conf.d/inner.conf", "RewriteRule ^/changed /f\n")
+        self.assertEqual((0, 1), self._refresh())
+        self.assertEqual("inner.example.com",
+                         self.config.main_context.virtual_hosts[0]
+                         .server_name.server_name)
+
+    def test_file_of_virtual_hosts(self):
+        self._write("sites/one.conf", SITE.format("uno") + SITE.format("dos"))
+        self.assertEqual((0, 1), self._refresh())
+        self.assertEqual(3, len(self.config.main_context.virtual_hosts))
+
+    def test_new_file(self):
+        self._write("sites/two.conf", SITE.format("two"))
+        self.assertEqual((0, 1), self._refresh())
+
+        # and it's watched from then on
+        self._write("sites/two.conf", SITE.format("deux"))
+        self.assertEqual((0, 1), self._refresh())
+
+    def test_deleted_file(self):
+        os.remove(os.path.join(self.root, "sites/one.conf"))
+        self.assertEqual((0, 1), self._refresh())
+        self.assertEqual(1, len(self.config.main_context.virtual_hosts))
+
+    def test_emptied_file(self):
+        self._write("conf.d/rules.conf", "# nothing\n")
+        self.assertEqual((0, 1), self._refresh())
+
+        # with no directives left, there's no telling where new ones go
+        self._write("conf.d/rules.conf", "RewriteRule ^/a /b\n")
+        self.assertEqual((1, 0), self._refresh())
+
+    def test_included_and_including_files(self):
+        self._write("conf.d/sites.conf", "IncludeOptional sites/*.conf\n"
+                                         "# changed\n")
+        self._write("sites/one.conf", SITE.format("uno"))
+        self.assertEqual((0, 1), self._refresh())
+
+    def test_root_file(self):
+        self._write("main.conf", MAIN + "RewriteRule ^/very-last /4\n")
+        self.assertEqual((1, 0), self._refresh())
+
+    def test_context_closed_elsewhere(self):
+        self._write("conf.d/inner.conf", "RewriteRule ^/inner /e\n"
+                                         "</VirtualHost>\n"
+                                         "<VirtualHost *:80>\n"
+                                         "ServerName other.example.com\n")
+        self.assertEqual((1, 0), self._refresh())
+        self.assertEqual(["inner.example.com", "other.example.com", "one"
+                          ".example.com"],
+                         [host.server_name.server_name
+                          for host in self.config.main_context.virtual_hosts])
+
+    def test_broken_file(self):
+        before = self.config.main_context
+        self._write("sites/one.conf", "<VirtualHost *:80>\n")
+        self.assertRaises(ValueError, self.config.refresh)
+        self.assertIs(before, self.config.main_context)
+
+        # not reported again until it changes
+        self.assertEqual(set(), self.config.refresh())
+
+        self._write("sites/one.conf", SITE.format("fixed"))
+        self.assertEqual((1, 0), self._refresh())
+
+    def test_watch_outlasts_errors(self):
+        class Stop(Exception):
+            pass
+
+        errors, refreshes = [], []
+
+        def on_refresh(changed):
+            refreshes.append(changed)
+            raise Stop()
+
+        # e.g. a file an editor replaced between being found and opened
+        missing = FileNotFoundError("conf.d/rules.conf")
+        with mock.patch.object(self.config, "refresh",
+                               side_effect=[missing, ValueError("broken"),
+                                            {"conf.d/rules.conf"}]):
+            self.assertRaises(Stop, self.config.watch, on_refresh,
+                              interval=0, on_error=errors.append)
+
+        self.assertEqual([FileNotFoundError, ValueError],
+                         [type(error) for error in errors])
+        self.assertEqual([{"conf.d/rules.conf"}], refreshes)
+
+    def test_keeps_sources(self):
+        self._write("conf.d/rules.conf", "RewriteRule ^/x /y\n")
+        self._refresh()
+
+        rule = self.config.main_context.children[3]
+        self.assertEqual((os.path.join(self.root, "conf.d/rules.conf"), 1),
+                         (rule.source.filename, rule.source.line_number))
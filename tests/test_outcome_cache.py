@@ -0,0 +1,143 @@
+import pickle
+import unittest
+
+from apache_rewrite_tester.environment import Environment, ServerVariable
+from apache_rewrite_tester.http_request import Request
+from apache_rewrite_tester.outcome_cache import OutcomeCache
+from apache_rewrite_tester.rewrite_objects.main_context import MainContext
+
+__author__ = 'jwilner'
+
+
+CONFIG = """ServerName example.com
+RewriteEngine on
+RewriteCond %{HTTP_USER_AGENT} =bot
+RewriteRule ^/(.*) /bots/$1?%{QUERY_STRING} [L]
+RewriteRule ^/(.*) /main/$1
+<VirtualHost *:8080>
+    ServerName one.example.com
+    RewriteEngine on
+    RewriteRule ^/(.*) /one/$1
+</VirtualHost>
+<VirtualHost *:8080>
+    ServerName two.example.com
+    RewriteEngine on
+    RewriteRule ^/(.*) /two/${lookup:key|fallback}
+</VirtualHost>
+"""
+
+
+def _request(path, host="example.com", **headers):
+    headers["Host"] = host
+    return Request("GET", path, headers=headers)
+
+
+def _make_environment(request):
+    """
+    The virtual hosts only listen on 8080, so that the main context handles
+    requests for example.com.
+    """
+    environment = Environment(request)
+    environment[ServerVariable.SERVER_PORT] = \
+        80 if request.headers["Host"] == "example.com" else 8080
+    return environment
+
+
+class TestOutcomeCache(unittest.TestCase):
+    def setUp(self):
+        self.main_context, _ = MainContext.consume(CONFIG)
+        self.cache = OutcomeCache()
+        self.main_context.cache_outcomes(self.cache)
+
+    def _handle(self, request):
+        return self.main_context.handle_request(request,
+                                                _make_environment(request))
+
+    def test_observed_variables(self):
+        main, one, two = self.main_context.handlers
+        self.assertEqual((ServerVariable.HTTP_USER_AGENT,
+                          ServerVariable.QUERY_STRING),
+                         main.get_observed_variables())
+        self.assertEqual((), one.get_observed_variables())
+        self.assertIsNone(two.get_observed_variables())
+
+    def test_unobserved_differences_hit(self):
+        self.assertEqual("/one/a", self._handle(_request(
+            "/a", "one.example.com", **{"User-Agent": "bot"})))
+        self.assertEqual("/one/a", self._handle(_request(
+            "/a", "one.example.com", **{"User-Agent": "browser"})))
+        self.assertEqual((1, 1), (self.cache.hits, self.cache.misses))
+        self.assertEqual(.5, self.cache.hit_rate)
+
+    def test_observed_differences_miss(self):
+        self.assertEqual("/bots/a?", self._handle(_request(
+            "/a", **{"User-Agent": "bot"})))
+        self.assertEqual("/main/a", self._handle(_request(
+            "/a", **{"User-Agent": "browser"})))
+        self.assertEqual("/bots/a?", self._handle(_request(
+            "/a", **{"User-Agent": "bot"})))
+        self.assertEqual((1, 2), (self.cache.hits, self.cache.misses))
+
+    def test_hosts_kept_apart(self):
+        self.assertEqual("/one/a", self._handle(_request(
+            "/a", "one.example.com")))
+        self.assertEqual("/main/a", self._handle(_request("/a")))
+        self.assertEqual(0, self.cache.hits)
+
+    def test_maps_uncacheable(self):
+        request = _request("/a", "two.example.com")
+        # the map isn't defined, so it expands to its default
+        self.assertEqual("/two/fallback", self._handle(request))
+        self.assertEqual("/two/fallback", self._handle(request))
+        self.assertEqual((0, 0, 2), (self.cache.hits, self.cache.misses,
+                                     self.cache.uncacheable))
+        self.assertEqual(0, len(self.cache))
+
+    def test_same_as_uncached(self):
+        uncached, _ = MainContext.consume(CONFIG)
+        requests = [_request("/{}".format(index % 7),
+                             ("example.com", "one.example.com")[index % 2],
+                             **{"User-Agent": "bot" if index % 3 else "x"})
+                    for index in range(50)]
+        self.assertEqual(
+            [uncached.handle_request(request, _make_environment(request))
+             for request in requests],
+            [self._handle(request) for request in requests])
+        self.assertGreater(self.cache.hits, 0)
+
+    def test_evicts_least_recently_used(self):
+        cache = OutcomeCache()
+        self.main_context.cache_outcomes(cache)
+        self._handle(_request("/a", "one.example.com"))
+        cache.max_bytes = cache.size * 2
+
+        self._handle(_request("/b", "one.example.com"))
+        self._handle(_request("/a", "one.example.com"))  # now the most recent
+        self._handle(_request("/c", "one.example.com"))
+
+        self.assertEqual(1, cache.evictions)
+        self.assertLessEqual(cache.size, cache.max_bytes)
+        self._handle(_request("/a", "one.example.com"))
+        self.assertEqual(2, cache.hits)
+
+    def test_too_big_to_keep(self):
+        cache = OutcomeCache(max_bytes=0)
+        self.main_context.cache_outcomes(cache)
+        self.assertEqual("/one/a", self._handle(_request(
+            "/a", "one.example.com")))
+        self.assertEqual((0, 0), (len(cache), cache.size))
+
+    def test_pickled_empty(self):
+        self._handle(_request("/a"))
+        cache = pickle.loads(pickle.dumps(OutcomeCache(1024)))
+        self.assertEqual((1024, 0, 0), (cache.max_bytes, len(cache),
+                                        cache.hits))
+
+        unpickled = pickle.loads(pickle.dumps(self.cache))
+        self.assertEqual(0, len(unpickled))
+        self.assertEqual(1, len(self.cache))
+
+    def test_stops_caching(self):
+        self.main_context.cache_outcomes(None)
+        self.assertEqual("/main/a", self._handle(_request("/a")))
+        self.assertEqual(0, self.cache.misses)
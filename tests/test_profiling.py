@@ -0,0 +1,134 @@
+import csv
+import io
+import json
+import os
+import tempfile
+import unittest
+
+from apache_rewrite_tester.environment import Environment
+from apache_rewrite_tester.http_request import Request
+from apache_rewrite_tester.profiling import Profile
+from apache_rewrite_tester.rewrite_objects.main_context import MainContext
+from apache_rewrite_tester.utils import split_source_lines
+
+__author__ = 'jwilner'
+
+
+def _compile(*lines):
+    config = "\n".join(("ServerName example.com", "RewriteEngine on") + lines)
+    main_context = MainContext.consume_lines(
+        split_source_lines(config, "httpd.conf"))
+    profile = Profile()
+    main_context.compile(profile=profile)
+    return main_context, profile
+
+
+def _rewrite(main_context, path, host="example.com"):
+    request = Request("GET", path, headers={"Host": host})
+    return main_context.rewrite(path, Environment(request))
+
+
+class TestProfile(unittest.TestCase):
+    def test_counts(self):
+        main_context, profile = _compile("RewriteCond %{HTTP_HOST} =alpha",
+                                         "RewriteRule ^/a /b",
+                                         "RewriteRule ^/b /c")
+
+        _rewrite(main_context, "/a", host="alpha")
+        _rewrite(main_context, "/a")
+        _rewrite(main_context, "/b")
+
+        condition, first, second = profile.stats
+        self.assertEqual(("condition", 3, 2, 1, 0),
+                         (condition.kind, condition.line_number,
+                          condition.attempts, condition.matches,
+                          condition.condition_failures))
+        self.assertEqual(("rule", 4, 2, 2, 1),
+                         (first.kind, first.line_number, first.attempts,
+                          first.matches, first.condition_failures))
+        self.assertEqual((2, 2, 0), (second.attempts, second.matches,
+                                     second.condition_failures))
+        self.assertTrue(all(stats.nanoseconds > 0
+                            for stats in profile.stats))
+
+    def test_identical_rules_counted_apart(self):
+        main_context, profile = _compile("RewriteRule ^/a /a",
+                                         "RewriteRule ^/a /a")
+        _rewrite(main_context, "/a")
+        self.assertEqual([(3, 1), (4, 1)],
+                         [(stats.line_number, stats.matches)
+                          for stats in profile.stats])
+
+    def test_fused_rules(self):
+        main_context, profile = _compile(*("RewriteRule ^/{0}$ /{0}.html"
+                                           .format(name)
+                                           for name in "abcdef"))
+        self.assertEqual("/c.html", _rewrite(main_context, "/c"))
+        self.assertEqual([0, 0, 1, 0, 0, 0],
+                         [stats.matches for stats in profile.stats])
+
+    def test_recompiling_keeps_counting(self):
+        main_context, profile = _compile("RewriteRule ^/a /b")
+        _rewrite(main_context, "/a")
+        main_context.compile(profile=profile)
+        _rewrite(main_context, "/a")
+        stats, = profile.stats
+        self.assertEqual(2, stats.matches)
+
+    def test_hottest(self):
+        main_context, profile = _compile("RewriteRule ^/a /b",
+                                         "RewriteRule ^/b /c")
+        stats = profile.stats
+        stats[0].nanoseconds, stats[1].nanoseconds = 5, 10
+        self.assertEqual([stats[1]], profile.get_hottest(1))
+
+
+class TestReports(unittest.TestCase):
+    def setUp(self):
+        self.main_context, self.profile = _compile("RewriteRule ^/a /b")
+        _rewrite(self.main_context, "/a")
+
+    def test_json(self):
+        stats, = json.loads(self.profile.to_json())
+        self.assertEqual({"index": 0, "kind": "rule", "filename": "httpd.conf",
+                          "line_number": 3, "attempts": 1, "matches": 1,
+                          "condition_failures": 0},
+                         {key: value for key, value in stats.items()
+                          if key != "nanoseconds"})
+
+    def test_csv(self):
+        row, = csv.DictReader(io.StringIO(self.profile.to_csv()))
+        self.assertEqual(("rule", "httpd.conf", "3", "1"),
+                         (row["kind"], row["filename"], row["line_number"],
+                          row["matches"]))
+
+    def test_prometheus(self):
+        lines = self.profile.to_prometheus().splitlines()
+        self.assertIn("# TYPE apache_rewrite_matches_total counter", lines)
+        self.assertIn('apache_rewrite_matches_total{index="0",kind="rule",'
+                      'file="httpd.conf",line="3"} 1', lines)
+
+    def test_prometheus_escapes_labels(self):
+        self.profile.stats[0].filename = 'my "conf"'
+        self.assertIn(r'file="my \"conf\""', self.profile.to_prometheus())
+
+    def test_write_picks_format(self):
+        directory = tempfile.mkdtemp()
+        for extension, expected in ((".json", self.profile.to_json()),
+                                    (".csv", self.profile.to_csv()),
+                                    (".prom", self.profile.to_prometheus())):
+            filename = os.path.join(directory, "profile" + extension)
+            self.profile.write(filename)
+            with open(filename) as report_file:
+                self.assertEqual(expected, report_file.read())
+            os.remove(filename)
+        os.rmdir(directory)
+
+
+class TestUnprofiled(unittest.TestCase):
+    def test_no_instrumentation(self):
+        main_context = MainContext.consume_lines(split_source_lines(
+            "ServerName example.com\nRewriteEngine on\nRewriteRule ^/a /b"))
+        main_context.compile()
+        rule, = main_context.program.rules
+        self.assertFalse(hasattr(rule, "stats"))
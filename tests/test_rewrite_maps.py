@@ -0,0 +1,373 @@
+import contextlib
+import dbm
+import io
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from apache_rewrite_tester import rewrite_maps
+from apache_rewrite_tester.environment import Environment, ServerVariable
+from apache_rewrite_tester.http_request import Request
+from apache_rewrite_tester.rewrite_maps import build_index, DbmMap, \
+    HashedIndex, InternalMap, ProgramMap, RandomMap, RewriteMaps, TextMap, \
+    open_map, read_text_map
+from apache_rewrite_tester.rewrite_objects.main_context import MainContext
+from apache_rewrite_tester.rewrite_objects.simple_directives import \
+    RewriteMap
+
+__author__ = 'jwilner'
+
+
+TEXT_MAP = """# users
+alice /home/alice
+bob   /home/bob   trailing comment
+
+alice /elsewhere
+"""
+
+# answers in upper case, except for a few keys with special meanings
+PROGRAM = """import sys, time
+for line in sys.stdin:
+    key = line.strip()
+    if key == "missing":
+        print("NULL")
+    elif key == "slow":
+        time.sleep(10)
+    elif key == "exit":
+        sys.exit()
+    elif key == "pid":
+        print(__import__("os").getpid())
+    else:
+        print(key.upper())
+    sys.stdout.flush()
+"""
+
+
+class MapFileTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def _write(self, name, contents):
+        filename = os.path.join(self.directory, name)
+        with open(filename, "w") as map_file:
+            map_file.write(contents)
+        return filename
+
+
+class TestRewriteMapParsing(unittest.TestCase):
+    def test_parses(self):
+        directive = RewriteMap.make("RewriteMap users txt:/etc/users.txt")
+        self.assertEqual(("users", "txt", None, "/etc/users.txt", None),
+                         (directive.name, directive.map_type,
+                          directive.subtype, directive.map_source,
+                          directive.options))
+
+    def test_subtype_and_options(self):
+        directive = RewriteMap.make(
+            'RewriteMap ids "dbm=sdbm:/maps/my ids" 60')
+        self.assertEqual(("ids", "dbm", "sdbm", "/maps/my ids", "60"),
+                         (directive.name, directive.map_type,
+                          directive.subtype, directive.map_source,
+                          directive.options))
+
+
+class TestHashedIndex(MapFileTestCase):
+    def test_looks_up(self):
+        filename = os.path.join(self.directory, "index")
+        entries = [("key{}".format(index), "value{}".format(index))
+                   for index in range(1000)]
+        build_index(entries, filename, (1, 2))
+
+        index = HashedIndex(filename)
+        self.addCleanup(index.close)
+        self.assertEqual(1000, len(index))
+        self.assertEqual((1, 2), index.stamp)
+        for key, value in entries:
+            self.assertEqual(value, index.get(key))
+        self.assertIsNone(index.get("key1000"))
+        self.assertIsNone(index.get(""))
+
+    def test_first_duplicate_kept(self):
+        filename = os.path.join(self.directory, "index")
+        build_index(read_text_map(self._write("users.txt", TEXT_MAP)),
+                    filename)
+
+        index = HashedIndex(filename)
+        self.addCleanup(index.close)
+        self.assertEqual(2, len(index))
+        self.assertEqual("/home/alice", index.get("alice"))
+        self.assertEqual("/home/bob", index.get("bob"))
+
+    def test_rejects_other_files(self):
+        self.assertRaises(ValueError, HashedIndex,
+                          self._write("other", "x" * 100))
+
+
+class TestTextMap(MapFileTestCase):
+    def test_in_memory(self):
+        text_map = TextMap(self._write("users.txt", TEXT_MAP),
+                           self.directory)
+        self.assertIsNone(text_map._index)
+        self.assertEqual("/home/alice", text_map.lookup("alice"))
+        self.assertIsNone(text_map.lookup("carol"))
+
+    @mock.patch.object(rewrite_maps, "IN_MEMORY_LIMIT", 0)
+    def test_indexed(self):
+        filename = self._write("users.txt", TEXT_MAP)
+        text_map = TextMap(filename, self.directory)
+        self.addCleanup(text_map.close)
+        self.assertIsNotNone(text_map._index)
+        self.assertEqual("/home/alice", text_map.lookup("alice"))
+        self.assertEqual("/home/bob", text_map.lookup("bob"))
+
+        index_filename = text_map._index.filename
+        index_stamp = os.stat(index_filename).st_mtime_ns
+
+        # an index already built for the same file is reused
+        reopened = TextMap(filename, self.directory)
+        self.addCleanup(reopened.close)
+        self.assertEqual(index_stamp, os.stat(index_filename).st_mtime_ns)
+        self.assertEqual("/home/bob", reopened.lookup("bob"))
+
+    @mock.patch.object(rewrite_maps, "IN_MEMORY_LIMIT", 0)
+    def test_stale_index_rebuilt(self):
+        filename = self._write("users.txt", TEXT_MAP)
+        TextMap(filename, self.directory).close()
+
+        self._write("users.txt", "alice /moved\ncarol /home/carol\n")
+        text_map = TextMap(filename, self.directory)
+        self.addCleanup(text_map.close)
+        self.assertEqual("/moved", text_map.lookup("alice"))
+        self.assertEqual("/home/carol", text_map.lookup("carol"))
+        self.assertIsNone(text_map.lookup("bob"))
+
+    def test_hot_keys_cached(self):
+        text_map = TextMap(self._write("users.txt", TEXT_MAP),
+                           self.directory, cache_size=1)
+        for key in ("alice", "alice", "bob", "alice"):
+            text_map.lookup(key)
+        cache_info = text_map.cache_info()
+        self.assertEqual((1, 3), (cache_info.hits, cache_info.misses))
+
+
+class TestRandomMap(MapFileTestCase):
+    def test_chooses_among_alternatives(self):
+        random_map = RandomMap(self._write("servers.txt",
+                                           "static s1|s2|s3\nsole s4\n"),
+                               self.directory)
+        self.assertEqual({"s1", "s2", "s3"},
+                         {random_map.lookup("static") for _ in range(200)})
+        self.assertEqual("s4", random_map.lookup("sole"))
+        self.assertIsNone(random_map.lookup("dynamic"))
+        self.assertEqual(3, random_map.cache_info().currsize)
+
+
+class TestDbmMap(MapFileTestCase):
+    def test_from_index(self):
+        filename = os.path.join(self.directory, "users.index")
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            rewrite_maps.main([self._write("users.txt", TEXT_MAP),
+                               filename])
+        self.assertEqual("{}: 2 entries\n".format(filename),
+                         output.getvalue())
+
+        dbm_map = DbmMap(filename)
+        self.addCleanup(dbm_map.close)
+        self.assertEqual("/home/alice", dbm_map.lookup("alice"))
+        self.assertIsNone(dbm_map.lookup("carol"))
+
+    def test_from_python_dbm(self):
+        filename = os.path.join(self.directory, "users")
+        with dbm.open(filename, "n") as database:
+            database[b"alice"] = b"/home/alice"
+
+        dbm_map = DbmMap(filename)
+        self.addCleanup(dbm_map.close)
+        self.assertEqual("/home/alice", dbm_map.lookup("alice"))
+        self.assertIsNone(dbm_map.lookup("bob"))
+
+
+class TestInternalMap(unittest.TestCase):
+    def test_functions(self):
+        self.assertEqual("ABC", InternalMap("toupper").lookup("aBc"))
+        self.assertEqual("abc", InternalMap("tolower").lookup("aBc"))
+        self.assertEqual("/a%20b/c:d",
+                         InternalMap("escape").lookup("/a b/c:d"))
+        self.assertEqual("/a b", InternalMap("unescape").lookup("/a%20b"))
+
+    def test_unknown_function(self):
+        self.assertRaises(ValueError, InternalMap, "reverse")
+
+
+class TestProgramMap(MapFileTestCase):
+    def setUp(self):
+        super(TestProgramMap, self).setUp()
+        self.command = [sys.executable, self._write("upper.py", PROGRAM)]
+
+    def _open(self, **kwargs):
+        program_map = ProgramMap(self.command, **kwargs)
+        self.addCleanup(program_map.close)
+        return program_map
+
+    def test_looks_up(self):
+        program_map = self._open()
+        self.assertEqual("ALICE", program_map.lookup("alice"))
+        self.assertIsNone(program_map.lookup("missing"))
+
+    def test_kept_running(self):
+        program_map = self._open(cache_size=0)
+        pids = {program_map.lookup("pid") for _ in range(5)}
+        self.assertEqual(1, len(pids))
+        self.assertEqual(1, len(program_map._workers))
+
+    def test_cached(self):
+        program_map = self._open()
+        for key in ("alice", "alice", "bob"):
+            program_map.lookup(key)
+        cache_info = program_map.cache_info()
+        self.assertEqual((1, 2), (cache_info.hits, cache_info.misses))
+
+    def test_lookup_many_pipelined_across_pool(self):
+        program_map = self._open(pool_size=3)
+        keys = ["key{}".format(index % 50) for index in range(200)] + \
+            ["missing"]
+        self.assertEqual([key.upper() for key in keys[:-1]] + [None],
+                         program_map.lookup_many(keys))
+        self.assertEqual(3, len(program_map._workers))
+        self.assertEqual("KEY1", program_map.lookup("key1"))
+        self.assertEqual(51, program_map.cache_info().currsize)
+
+    def test_concurrent_lookups_share_pool(self):
+        program_map = self._open(pool_size=2, cache_size=0)
+        results = {}
+
+        def look_up(index):
+            results[index] = [program_map.lookup("{}-{}".format(index, each))
+                              for each in range(50)]
+
+        threads = [threading.Thread(target=look_up, args=(index,))
+                   for index in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual({index: ["{}-{}".format(index, each)
+                                  for each in range(50)]
+                          for index in range(4)}, results)
+        self.assertLessEqual(len(program_map._workers), 2)
+
+    def test_timeout_restarts_program(self):
+        program_map = self._open(timeout=.2, cache_size=0)
+        first_pid = program_map.lookup("pid")
+        self.assertIsNone(program_map.lookup("slow"))
+        self.assertEqual(1, program_map.timeouts)
+        self.assertNotEqual(first_pid, program_map.lookup("pid"))
+
+    def test_exited_program_restarted(self):
+        program_map = self._open(cache_size=0)
+        self.assertIsNone(program_map.lookup("exit"))
+        self.assertEqual("ALICE", program_map.lookup("alice"))
+
+    def test_unstartable_program_finds_nothing(self):
+        program_map = self._open(cache_size=0)
+        program_map.command = [os.path.join(self.directory, "missing")]
+
+        self.assertIsNone(program_map.lookup("alice"))
+        self.assertEqual([None, None], program_map.lookup_many(["a", "b"]))
+        self.assertEqual([], program_map._workers)
+        self.assertGreater(program_map.start_failures, 0)
+
+    def test_closed(self):
+        program_map = ProgramMap(self.command)
+        program_map.lookup("alice")
+        process = program_map._workers[0]._process
+        program_map.close()
+        self.assertIsNotNone(process.poll())
+        self.assertEqual([], program_map._workers)
+
+
+class TestOpenMap(unittest.TestCase):
+    def test_unsupported_type(self):
+        self.assertRaises(ValueError, open_map,
+                          RewriteMap.make("RewriteMap m dbd:SELECT 1"))
+
+
+class TestRewriteMaps(MapFileTestCase):
+    def test_later_definitions_win_and_open_lazily(self):
+        maps = RewriteMaps([
+            RewriteMap.make("RewriteMap case int:toupper"),
+            RewriteMap.make("RewriteMap case int:tolower"),
+            RewriteMap.make("RewriteMap missing txt:/no/such/map.txt")])
+        self.assertIn("missing", maps)
+        self.assertEqual("abc", maps.get("case").lookup("ABC"))
+        self.assertIs(maps.get("case"), maps.get("case"))
+        self.assertIsNone(maps.get("undefined"))
+
+
+class TestMapExpansion(MapFileTestCase):
+    def setUp(self):
+        super(TestMapExpansion, self).setUp()
+        users = self._write("users.txt", TEXT_MAP)
+        self.main_context, _ = MainContext.consume(r"""ServerName example.com
+RewriteEngine on
+RewriteMap users txt:{}
+RewriteMap case int:tolower
+RewriteCond ${{case:%{{HTTP_HOST}}}} ^www\.
+RewriteRule ^/~(\w+)(.*) ${{users:$1|/nobody}}$2 [L]
+RewriteRule ^/(.*) /${{undefined:$1|default/$1}}
+""".format(users))
+
+    def test_program(self):
+        self.main_context, _ = MainContext.consume(r"""ServerName example.com
+RewriteEngine on
+RewriteMap upper "prg:{} {}"
+RewriteRule ^/(\w+)$ /${{upper:$1|unknown}}
+""".format(sys.executable, self._write("upper.py", PROGRAM)))
+        self.addCleanup(self.main_context.handlers[0].maps.close)
+
+        self.assertEqual("/ALICE", self._rewrite("/alice"))
+        self.assertEqual("/unknown", self._rewrite("/missing"))
+
+    def test_maps_opened_on_first_lookup(self):
+        self.main_context, _ = MainContext.consume(r"""ServerName example.com
+RewriteEngine on
+RewriteMap upper "prg:{}"
+RewriteRule ^/(\w+)$ /${{upper:$1|unknown}}
+""".format(os.path.join(self.directory, "missing")))
+
+        maps = self.main_context.compile().handlers[0].maps
+        self.assertEqual({}, maps._opened)
+        self.assertEqual("/unknown", self._rewrite("/alice"))
+        self.assertIn("upper", maps._opened)
+
+    def _rewrite(self, path, host="www.example.com"):
+        request = Request("GET", path, headers={"Host": host})
+        environment = Environment(request)
+        environment[ServerVariable.HTTP_HOST] = host
+        return self.main_context.rewrite(path, environment)
+
+    def test_looks_up(self):
+        self.assertEqual("/home/alice/a", self._rewrite("/~alice/a"))
+        self.assertEqual("/home/alice/a", self._rewrite("/~alice/a",
+                                                        "WWW.example.com"))
+
+    def test_defaults(self):
+        self.assertEqual("/nobody/a", self._rewrite("/~carol/a"))
+        self.assertEqual("/default/~alice/a", self._rewrite(
+            "/~alice/a", "example.com"))
+
+    def test_pickled(self):
+        self._rewrite("/~alice/a")
+        unpickled = pickle.loads(pickle.dumps(self.main_context))
+        self.assertEqual("/home/bob", self._rewrite("/~bob"))
+        self.assertEqual("/home/bob", unpickled.rewrite(
+            "/~bob", Environment(Request("GET", "/~bob", headers={
+                "Host": "www.example.com"}))))
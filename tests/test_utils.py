@@ -1,8 +1,13 @@
+import os
+import tempfile
 import unittest
 
 __author__ = 'jwilner'
 
-from apache_rewrite_tester.utils import expand_includes, join_continued_lines
+from apache_rewrite_tester.utils import expand_includes, \
+    join_continued_lines, SourceLine, split_source_lines, \
+    join_continued_source_lines, expand_source_includes, \
+    read_directive_lines, IncludeGraph
 
 
 class TestExpandIncludes(unittest.TestCase):
@@ -115,4 +120,83 @@ expected
 stuff
 
 alone"""
-        self.assertEqual(string, join_continued_lines(string))
\ No newline at end of file
+        self.assertEqual(string, join_continued_lines(string))
+
+
+class TestSourceLines(unittest.TestCase):
+    def test_joined_lines_keep_first_location(self):
+        lines = split_source_lines("a \\\nb\nc", "f")
+        self.assertEqual([SourceLine("a b", "f", 1), SourceLine("c", "f", 3)],
+                         list(join_continued_source_lines(lines)))
+
+    def test_included_lines_keep_their_location(self):
+        includes = {"other": list(split_source_lines("b", "other"))}
+        lines = expand_source_includes(
+            split_source_lines("a\nInclude other\nc", "main"), includes.get)
+
+        self.assertEqual([SourceLine("a", "main", 1),
+                          SourceLine("b", "other", 1),
+                          SourceLine("c", "main", 3)], list(lines))
+
+    def test_is_lazy(self):
+        def lines():
+            yield SourceLine("a", "f", 1)
+            raise AssertionError("read too far")
+
+        self.assertEqual(SourceLine("a", "f", 1),
+                         next(join_continued_source_lines(lines())))
+
+
+class TestReadDirectiveLines(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        os.mkdir(os.path.join(self.directory.name, "conf.d"))
+
+    def _write(self, filename, contents):
+        with open(os.path.join(self.directory.name, filename), "w") as f:
+            f.write(contents)
+
+    def test_expands_globbed_includes(self):
+        self._write("main.conf", "a \\\n b\nInclude conf.d/*.conf\n"
+                                 "IncludeOptional missing/*.conf\nc\n")
+        self._write("conf.d/1.conf", "one\n")
+        self._write("conf.d/2.conf", "two\n")
+
+        lines = read_directive_lines(
+            os.path.join(self.directory.name, "main.conf"),
+            server_root=self.directory.name)
+
+        self.assertEqual(["a  b", "one", "two", "c"],
+                         [line.text for line in lines])
+
+    def test_records_include_graph(self):
+        self._write("main.conf", "Include conf.d/*.conf\n"
+                                 "IncludeOptional missing/*.conf\n")
+        self._write("conf.d/1.conf", "one\n")
+        self._write("conf.d/2.conf", "two\n")
+
+        main = os.path.join(self.directory.name, "main.conf")
+        conf_d = os.path.join(self.directory.name, "conf.d")
+        graph = IncludeGraph()
+        list(read_directive_lines(main, server_root=self.directory.name,
+                                  include_graph=graph))
+
+        included = os.path.join(conf_d, "1.conf"), \
+            os.path.join(conf_d, "2.conf")
+        self.assertEqual([main] + list(included), graph.filenames)
+        self.assertEqual(
+            [(main, os.path.join(conf_d, "*.conf"), included),
+             (main, os.path.join(self.directory.name, "missing", "*.conf"),
+              ())],
+            graph.includes)
+        self.assertEqual({included[0]: main, included[1]: main},
+                         graph.get_parents())
+
+    def test_missing_include_raises(self):
+        self._write("main.conf", "Include nope.conf\n")
+        lines = read_directive_lines(
+            os.path.join(self.directory.name, "main.conf"),
+            server_root=self.directory.name)
+
+        self.assertRaises(KeyError, list, lines)